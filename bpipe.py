@@ -5,12 +5,29 @@ from flask import Flask, request, jsonify, redirect
 import requests
 import os
 import json
+import re
 from datetime import datetime, timezone
 import uuid
+import sqlite3
+import hashlib
+import hmac
+import atexit
+import secrets
 import tempfile
 import base64
+import codecs
+import io
+import zipfile
+from xml.etree import ElementTree
 import threading
 import time
+import queue
+import asyncio
+import bisect
+import concurrent.futures
+import multiprocessing
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
 
 # ✅ ADD: APScheduler for background token refresh
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -26,6 +43,9 @@ from qdrant_client.models import (
     MatchValue,
 )
 from google import genai
+import httpx
+from PIL import Image, ImageOps
+from pypdf import PdfReader, PdfWriter
 
 app = Flask(__name__)
 app.secret_key = 'YOUR_SECRET_KEY'
@@ -160,6 +180,352 @@ def get_catalyst_token():
 CATALYST_TOKEN = property(lambda self: token_manager.get_token())
 
 
+# ========= Circuit Breakers =========
+# One breaker per external dependency. A breaker trips when too many recent
+# calls failed or ran slower than the dependency's latency budget; while it
+# is open, callers skip the dependency and take their degraded path (local
+# classifier, queued embedding, keyword linking) instead of waiting out a
+# timeout on every message. After BREAKER_OPEN_S one probe call is let
+# through, and its outcome closes or re-opens the breaker.
+
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_S = float(os.getenv("BREAKER_OPEN_S", "30"))
+
+
+class BreakerOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, slow_ms: float):
+        self.name = name
+        self.slow_ms = slow_ms
+        self.state = "closed"  # closed -> open -> half_open -> closed
+        self.window = deque(maxlen=BREAKER_WINDOW)  # True = bad call (error or slow)
+        self.opened_at = 0.0
+        self.probe_inflight = False
+        self.stats = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "trips": 0}
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go to the dependency right now"""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self.opened_at >= BREAKER_OPEN_S:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probe_inflight:
+                self.probe_inflight = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.state == "open" and time.time() - self.opened_at < BREAKER_OPEN_S
+
+    def record(self, ok: bool, elapsed_ms: float):
+        slow = ok and elapsed_ms > self.slow_ms
+        bad = not ok or slow
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += 0 if ok else 1
+            self.stats["slow"] += 1 if slow else 0
+
+            if self.state == "half_open":
+                self.probe_inflight = False
+                if bad:
+                    self._trip(f"probe {'slow' if slow else 'failed'}")
+                else:
+                    self.state = "closed"
+                    self.window.clear()
+                    print(f"✅ Breaker {self.name} closed")
+                return
+
+            self.window.append(bad)
+            if self.state == "closed" and len(self.window) >= BREAKER_MIN_CALLS:
+                rate = sum(self.window) / len(self.window)
+                if rate >= BREAKER_FAILURE_RATE:
+                    self._trip(f"{rate:.0%} of last {len(self.window)} calls failed or slow")
+
+    def _trip(self, reason: str):
+        self.state = "open"
+        self.opened_at = time.time()
+        self.window.clear()
+        self.stats["trips"] += 1
+        print(f"🔌 Breaker {self.name} opened ({reason}), using fallback for {BREAKER_OPEN_S:.0f}s")
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker; raises BreakerOpenError when open"""
+        if not self.allow():
+            raise BreakerOpenError(f"{self.name} unavailable (breaker open)")
+        start = time.monotonic()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            self.record(ok, (time.monotonic() - start) * 1000)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            window = list(self.window)
+            return {
+                "state": self.state,
+                "slow_ms": self.slow_ms,
+                "recent_bad_rate": round(sum(window) / len(window), 3) if window else 0.0,
+                "open_for_s": round(max(0.0, BREAKER_OPEN_S - (time.time() - self.opened_at)), 1) if self.state == "open" else 0,
+                **self.stats,
+            }
+
+
+breakers = {
+    "quickml_chat": CircuitBreaker("quickml_chat", float(os.getenv("BREAKER_QUICKML_CHAT_SLOW_MS", "8000"))),
+    "quickml_vlm": CircuitBreaker("quickml_vlm", float(os.getenv("BREAKER_QUICKML_VLM_SLOW_MS", "30000"))),
+    "catalyst_ocr": CircuitBreaker("catalyst_ocr", float(os.getenv("BREAKER_OCR_SLOW_MS", "60000"))),
+    "gemini_embed": CircuitBreaker("gemini_embed", float(os.getenv("BREAKER_EMBED_SLOW_MS", "3000"))),
+    "qdrant": CircuitBreaker("qdrant", float(os.getenv("BREAKER_QDRANT_SLOW_MS", "2000"))),
+}
+
+
+# ========= QuickML Client =========
+# Every LLM / VLM helper goes through this one client. It runs an asyncio
+# loop on a background thread so Flask workers can call it synchronously,
+# while the loop enforces a global in-flight limit, per-call deadlines and
+# optional hedging (a second request once a call runs past the model's p95).
+
+QUICKML_MAX_INFLIGHT = int(os.getenv("QUICKML_MAX_INFLIGHT", "8"))
+QUICKML_CHAT_DEADLINE_S = float(os.getenv("QUICKML_CHAT_DEADLINE_S", "12"))
+QUICKML_VLM_DEADLINE_S = float(os.getenv("QUICKML_VLM_DEADLINE_S", "45"))
+QUICKML_HEDGE_ENABLED = os.getenv("QUICKML_HEDGE_ENABLED", "true").lower() == "true"
+QUICKML_HEDGE_MIN_SAMPLES = int(os.getenv("QUICKML_HEDGE_MIN_SAMPLES", "20"))
+
+QUICKML_CHAT_URL = f"https://api.catalyst.zoho.com/quickml/v2/project/{CATALYST_PROJECT_ID}/llm/chat"
+QUICKML_VLM_URL = f"https://api.catalyst.zoho.com/quickml/v1/project/{CATALYST_PROJECT_ID}/vlm/chat"
+
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 5000, 10000, 20000, 30000, 60000, 90000)
+
+
+def extract_llm_output(result: dict):
+    """Pull the generated text out of a QuickML response body"""
+    if not isinstance(result, dict):
+        return None
+    # Path 1: data.output_text
+    if isinstance(result.get("data"), dict) and "output_text" in result["data"]:
+        return result["data"]["output_text"]
+    # Path 2: direct output_text
+    if "output_text" in result:
+        return result["output_text"]
+    # Path 3: response
+    if "response" in result:
+        return result["response"]
+    return None
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram plus a window of recent samples for percentiles"""
+
+    def __init__(self, window: int = 500):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.recent = deque(maxlen=window)
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float, ok: bool = True):
+        with self.lock:
+            idx = bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)
+            self.counts[idx] += 1
+            self.recent.append(elapsed_ms)
+            if not ok:
+                self.errors += 1
+
+    def percentile(self, pct: float):
+        with self.lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[idx]
+
+    def sample_count(self) -> int:
+        with self.lock:
+            return len(self.recent)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            counts = list(self.counts)
+            errors = self.errors
+        buckets = {f"le_{b}ms": c for b, c in zip(LATENCY_BUCKETS_MS, counts)}
+        buckets["gt_90000ms"] = counts[-1]
+        return {
+            "count": sum(counts),
+            "errors": errors,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": buckets,
+        }
+
+
+class QuickMLClient:
+    def __init__(self, max_inflight: int):
+        self.max_inflight = max_inflight
+        self.histograms = {}  # {model: LatencyHistogram}
+        self.stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+        self.inflight = 0
+        self.lock = threading.Lock()
+        self.loop = None
+        self.http = None
+        self.semaphore = None
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            ready = threading.Event()
+
+            def run():
+                self.loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self.loop)
+                self.semaphore = asyncio.Semaphore(self.max_inflight)
+                self.http = httpx.AsyncClient(
+                    timeout=httpx.Timeout(None, connect=10.0),
+                    limits=httpx.Limits(max_connections=self.max_inflight * 2),
+                )
+                ready.set()
+                self.loop.run_forever()
+
+            threading.Thread(target=run, name="quickml-loop", daemon=True).start()
+            ready.wait()
+
+    def _histogram(self, model: str) -> LatencyHistogram:
+        with self.lock:
+            if model not in self.histograms:
+                self.histograms[model] = LatencyHistogram()
+            return self.histograms[model]
+
+    def _bump(self, key: str, n: int = 1):
+        with self.lock:
+            self.stats[key] += n
+
+    async def _attempt(self, url: str, payload: dict) -> dict:
+        model = payload.get("model", "unknown")
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {get_catalyst_token()}",
+            "CATALYST-ORG": CATALYST_ORG_ID,
+        }
+        # requests silently dropped unset headers, httpx rejects them
+        headers = {k: v for k, v in headers.items() if v is not None}
+        async with self.semaphore:
+            with self.lock:
+                self.inflight += 1
+            start = time.monotonic()
+            ok = False
+            try:
+                resp = await self.http.post(url, json=payload, headers=headers)
+                ok = resp.status_code == 200
+                if not ok:
+                    raise RuntimeError(f"QuickML {model} error {resp.status_code}: {resp.text[:200]}")
+                return resp.json()
+            finally:
+                self._histogram(model).observe((time.monotonic() - start) * 1000, ok=ok)
+                with self.lock:
+                    self.inflight -= 1
+
+    async def _hedged(self, url: str, payload: dict, hedge: bool) -> dict:
+        hist = self._histogram(payload.get("model", "unknown"))
+        first = asyncio.ensure_future(self._attempt(url, payload))
+        tasks = {first}
+
+        hedge_after_ms = None
+        if hedge and QUICKML_HEDGE_ENABLED and hist.sample_count() >= QUICKML_HEDGE_MIN_SAMPLES:
+            hedge_after_ms = hist.percentile(95)
+
+        try:
+            if hedge_after_ms:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after_ms / 1000.0)
+                if not done:
+                    print(f"⏱️ QuickML {payload.get('model')} past p95 ({hedge_after_ms:.0f}ms), sending hedge request")
+                    self._bump("hedges")
+                    tasks.add(asyncio.ensure_future(self._attempt(url, payload)))
+
+            # First successful response wins; only fail once every attempt failed
+            last_error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._bump("hedge_wins")
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def post(self, url: str, payload: dict, deadline: float, hedge: bool = True):
+        """
+        Send a QuickML request and return the parsed JSON body, or None if it
+        failed or ran past the deadline. Blocks the caller for at most `deadline` seconds.
+        """
+        breaker = breakers["quickml_vlm" if url == QUICKML_VLM_URL else "quickml_chat"]
+        if not breaker.allow():
+            print(f"🔌 QuickML {payload.get('model')} skipped, breaker {breaker.name} is open")
+            return None
+
+        start = time.monotonic()
+        ok = False
+        future = None
+        try:
+            # Everything after allow() records an outcome, or a half-open
+            # probe would stay in flight forever
+            self._ensure_started()
+            self._bump("requests")
+            coro = asyncio.wait_for(self._hedged(url, payload, hedge), timeout=deadline)
+            future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+            result = future.result(timeout=deadline + 1)
+            ok = True
+            return result
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+            if future is not None:
+                future.cancel()
+            self._bump("deadline_exceeded")
+            print(f"⏱️ QuickML {payload.get('model')} exceeded {deadline:.0f}s deadline")
+            return None
+        except Exception as e:
+            print(f"❌ QuickML {payload.get('model')} request failed: {e}")
+            return None
+        finally:
+            breaker.record(ok, (time.monotonic() - start) * 1000)
+
+    def chat(self, payload: dict, deadline: float = None, hedge: bool = True):
+        """LLM chat call; returns the output text or None"""
+        result = self.post(QUICKML_CHAT_URL, payload, deadline or QUICKML_CHAT_DEADLINE_S, hedge)
+        return extract_llm_output(result) if result is not None else None
+
+    def vlm(self, payload: dict, deadline: float = None, hedge: bool = False):
+        """Vision chat call; returns the output text or None"""
+        result = self.post(QUICKML_VLM_URL, payload, deadline or QUICKML_VLM_DEADLINE_S, hedge)
+        return extract_llm_output(result) if result is not None else None
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["inflight"] = self.inflight
+            models = list(self.histograms.items())
+        stats["max_inflight"] = self.max_inflight
+        stats["models"] = {model: hist.snapshot() for model, hist in models}
+        return stats
+
+
+quickml = QuickMLClient(QUICKML_MAX_INFLIGHT)
+
+
 # In-memory issue tracker (for fast access)
 open_issues = {}  # {issue_id: {"opened_at": ts, "title": str, "category": str, "severity": str}}
 @app.route('/quick_fix_past', methods=['GET'])
@@ -193,7 +559,7 @@ def quick_fix_past():
     
     # Search for similar RESOLVED incidents
     q_filter = Filter(must=[FieldCondition(key="role", match=MatchValue(value="incident"))])
-    hits = qdrant.search(
+    hits = qdrant_search(
         collection_name=QDRANT_COLLECTION,
         query_vector=incident_emb,
         query_filter=q_filter,
@@ -221,7 +587,7 @@ def quick_fix_past():
         if not res_issue:
             continue
         
-        resolution = res_issue.get("resolution_summary", "No details")
+        resolution = get_resolution_summary(res_issue_id, issue=res_issue) or "No details"
         title = res_issue.get("title", "Untitled")[:80]
         
         results.append({
@@ -303,13 +669,6 @@ def quick_fix_web():
 
 def generate_search_query_with_llm(context: str) -> str:
     """Use LLM to craft perfect search query from incident context"""
-    url = f"https://api.catalyst.zoho.com/quickml/v2/project/{CATALYST_PROJECT_ID}/llm/chat"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {get_catalyst_token()}",
-        "CATALYST-ORG": CATALYST_ORG_ID,
-    }
-    
     prompt = f"""Generate a concise web search query to find solutions for this IT incident.
 
 Context:
@@ -333,28 +692,17 @@ Query:"""
     }
     
     try:
-        resp = requests.post(url, json=data, headers=headers, timeout=30)
+        output = quickml.chat(data)
         
-        if resp.status_code == 200:
-            result = resp.json()
+        if output:
+            query = output.strip().strip('"').strip("'")
             
-            output = None
-            if "data" in result and "output_text" in result["data"]:
-                output = result["data"]["output_text"]
-            elif "output_text" in result:
-                output = result["output_text"]
-            elif "response" in result:
-                output = result["response"]
+            # Clean up
+            for prefix in ["Query:", "Search:"]:
+                if query.startswith(prefix):
+                    query = query[len(prefix):].strip()
             
-            if output:
-                query = output.strip().strip('"').strip("'")
-                
-                # Clean up
-                for prefix in ["Query:", "Search:"]:
-                    if query.startswith(prefix):
-                        query = query[len(prefix):].strip()
-                
-                return query
+            return query
         
         # Fallback: extract key terms
         print(f"⚠️ LLM query generation failed, using fallback")
@@ -371,72 +719,10 @@ Query:"""
 
 def check_resolution_specificity(resolution_text: str) -> dict:
     """Use LLM to determine if resolution is vague/generic or specific"""
-    url = f"https://api.catalyst.zoho.com/quickml/v2/project/{CATALYST_PROJECT_ID}/llm/chat"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {get_catalyst_token()}",
-        "CATALYST-ORG": CATALYST_ORG_ID,
-    }
-    
-    prompt = f"""Analyze this resolution message and determine if it's VAGUE or SPECIFIC.
-
-Resolution: "{resolution_text}"
-
-VAGUE = Generic statements without mentioning what was fixed (e.g., "fixed", "done", "working now", "issue resolved")
-SPECIFIC = Mentions what was done or what issue was resolved (e.g., "restarted payment gateway", "fixed database timeout", "resolved API connection issue")
-
-Return ONLY this JSON (no extra text):
-{{"specificity": "vague|specific"}}
-
-JSON:"""
-    
-    data = {
-        "prompt": prompt,
-        "model": "crm-di-qwen_text_14b-fp8-it",
-        "system_prompt": "Classify resolution messages as vague or specific. Return ONLY valid JSON.",
-        "temperature": 0.1,
-        "max_tokens": 50,
-    }
-    
-    try:
-        resp = requests.post(url, json=data, headers=headers, timeout=30)
-        
-        if resp.status_code == 200:
-            result = resp.json()
-            
-            # Get output
-            output_text = None
-            if "data" in result and "output_text" in result["data"]:
-                output_text = result["data"]["output_text"]
-            elif "output_text" in result:
-                output_text = result["output_text"]
-            elif "response" in result:
-                output_text = result["response"]
-            
-            if output_text:
-                # Clean and parse JSON
-                output_text = output_text.strip()
-                if "{" in output_text and "}" in output_text:
-                    start = output_text.index("{")
-                    end = output_text.rindex("}") + 1
-                    json_str = output_text[start:end]
-                else:
-                    json_str = output_text
-                
-                parsed = json.loads(json_str)
-                specificity = parsed.get("specificity", "specific")
-                
-                print(f"✅ LLM specificity check: {specificity}")
-                return {"specificity": specificity}
-        
-        # Fallback: assume specific (safer to use similarity)
-        print(f"⚠️ LLM specificity check failed, assuming specific")
-        return {"specificity": "specific"}
-        
-    except Exception as e:
-        print(f"❌ Specificity check error: {e}")
-        # Fallback: assume specific
-        return {"specificity": "specific"}
+    analysis = analyze_message_llm(resolution_text)
+    specificity = analysis.get("specificity", "specific")
+    print(f"✅ LLM specificity check: {specificity}")
+    return {"specificity": specificity}
 
 
 
@@ -446,72 +732,9 @@ JSON:"""
 
 def extract_incident_title_from_analysis(analysis: str) -> str:
     """Extract a concise incident title from vision analysis using LLM"""
-    url = f"https://api.catalyst.zoho.com/quickml/v2/project/{CATALYST_PROJECT_ID}/llm/chat"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {get_catalyst_token()}",
-        "CATALYST-ORG": CATALYST_ORG_ID,
-    }
-    
-    prompt = f"""Extract the main incident from this analysis as a short title (max 10 words).
-
-Analysis: "{analysis[:300]}"
-
-Return ONLY the incident title, no extra text. Examples:
-- "Production database is down"
-- "Payment gateway connection refused"
-- "API timeout errors"
-
-Title:"""
-    
-    data = {
-        "prompt": prompt,
-        "model": "crm-di-qwen_text_14b-fp8-it",
-        "system_prompt": "Extract concise incident titles. Return only the title, no formatting.",
-        "temperature": 0.2,
-        "max_tokens": 50,
-    }
-    
-    try:
-        resp = requests.post(url, json=data, headers=headers, timeout=30)
-        
-        if resp.status_code == 200:
-            result = resp.json()
-            
-            # Get output
-            output = None
-            if "data" in result and "output_text" in result["data"]:
-                output = result["data"]["output_text"]
-            elif "output_text" in result:
-                output = result["output_text"]
-            elif "response" in result:
-                output = result["response"]
-            
-            if output:
-                title = output.strip().strip('"').strip("'")
-                
-                # Clean up common prefixes
-                for prefix in ["Title:", "Incident:", "Issue:"]:
-                    if title.startswith(prefix):
-                        title = title[len(prefix):].strip()
-                
-                # Limit length
-                if len(title) > 80:
-                    title = title[:77] + "..."
-                
-                print(f"✅ Extracted title: {title}")
-                return title
-        
-        # Fallback: use first sentence of analysis
-        print(f"⚠️ LLM title extraction failed, using fallback")
-        first_sentence = analysis.split('.')[0][:80]
-        return first_sentence if first_sentence else "Incident detected from image"
-        
-    except Exception as e:
-        print(f"❌ Title extraction error: {e}")
-        # Fallback
-        first_sentence = analysis.split('.')[0][:80]
-        return first_sentence if first_sentence else "Incident detected from image"
+    title = analyze_message_llm(analysis).get("title", "")
+    print(f"✅ Extracted title: {title}")
+    return title
 
 
 
@@ -665,20 +888,168 @@ def get_issue_id_from_last_message(conversation_id: str):
 
 
 
-def classify_message_llm(text: str) -> dict:
-    url = f"https://api.catalyst.zoho.com/quickml/v2/project/{CATALYST_PROJECT_ID}/llm/chat"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {get_catalyst_token()}",
-        "CATALYST-ORG": CATALYST_ORG_ID,
+# ---------- Combined Message Analysis ----------
+# One QuickML call returns everything the pipeline needs about a message:
+# role/category/severity (classification), specificity (for resolutions)
+# and a short title (for incidents). The older single-purpose helpers
+# below are thin wrappers that read their field from this result.
+
+ANALYSIS_ROLES = ("incident", "discussion", "resolution")
+ANALYSIS_CATEGORIES = ("database", "cache", "auth", "network", "security", "deployment", "other")
+ANALYSIS_SEVERITIES = ("low", "medium", "high")
+ANALYSIS_SPECIFICITIES = ("vague", "specific")
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "256"))
+# Same cut-off for single and batched prompts, so a message is classified
+# the same way whether or not it arrived during a burst
+ANALYSIS_TEXT_MAX_CHARS = int(os.getenv("ANALYSIS_TEXT_MAX_CHARS", "1000"))
+
+_analysis_cache = OrderedDict()  # {text: analysis dict}, LRU
+_analysis_cache_lock = threading.Lock()
+
+
+def _fallback_title(text: str) -> str:
+    first_sentence = (text or "").strip().split('.')[0][:80]
+    return first_sentence if first_sentence else "Incident detected from image"
+
+
+def _clean_title(title: str) -> str:
+    title = (title or "").strip().strip('"').strip("'")
+    for prefix in ["Title:", "Incident:", "Issue:"]:
+        if title.startswith(prefix):
+            title = title[len(prefix):].strip()
+    if len(title) > 80:
+        title = title[:77] + "..."
+    return title
+
+
+def _extract_json_object(output_text: str) -> str:
+    output_text = output_text.strip()
+    if "{" in output_text and "}" in output_text:
+        start = output_text.index("{")
+        end = output_text.rindex("}") + 1
+        return output_text[start:end]
+    return output_text
+
+
+def normalize_analysis(parsed, text: str) -> dict:
+    """
+    Validate an LLM analysis against the strict schema.
+    Missing or invalid fields fall back individually instead of
+    throwing away the whole response.
+    """
+    if not isinstance(parsed, dict):
+        parsed = {}
+
+    def pick(field, allowed, default):
+        value = str(parsed.get(field, "")).strip().lower()
+        if value not in allowed:
+            if field in parsed:
+                print(f"⚠️ Invalid {field} in analysis: {parsed.get(field)!r}, using {default}")
+            return default
+        return value
+
+    title = _clean_title(str(parsed.get("title") or ""))
+
+    return {
+        "role": pick("role", ANALYSIS_ROLES, "discussion"),
+        "category": pick("category", ANALYSIS_CATEGORIES, "other"),
+        "severity": pick("severity", ANALYSIS_SEVERITIES, "low"),
+        # Assume specific when unknown (safer to use similarity)
+        "specificity": pick("specificity", ANALYSIS_SPECIFICITIES, "specific"),
+        "title": title or _fallback_title(text),
     }
-    
-    prompt = f"""Classify this engineering message:
 
-Statement: "{text}"
+
+# Keyword rules for the local classifier used while QuickML is unavailable
+LOCAL_RESOLUTION_MARKERS = ("fixed", "resolved", "back to normal", "working now", "working fine", "is back up", "issue is gone", "mitigated")
+LOCAL_INCIDENT_MARKERS = ("down", "outage", "error", "failing", "failed", "failure", "broken", "not working", "timeout", "timed out", "crash", "500", "503", "refused", "unreachable", "spike")
+LOCAL_CATEGORY_KEYWORDS = {
+    "database": ("database", "db ", "postgres", "mysql", "query", "deadlock", "replica", "sql"),
+    "cache": ("cache", "redis", "memcached", "stale"),
+    "auth": ("auth", "authentication", "login", "token", "sso", "password", "oauth", "permission"),
+    "network": ("network", "dns", "latency", "connection", "packet", "load balancer", "gateway", "ssl"),
+    "security": ("security", "breach", "vulnerability", "attack", "ddos", "malware", "leak"),
+    "deployment": ("deploy", "deployment", "release", "rollback", "rolled back", "build", "pipeline", "migration"),
+}
+LOCAL_HIGH_SEVERITY_MARKERS = ("production", "prod ", "outage", "down", "all users", "customers", "critical", "urgent")
+LOCAL_VAGUE_RESOLUTIONS = ("fixed", "done", "resolved", "working now", "issue resolved", "all good", "back to normal")
+LOCAL_TENTATIVE_MARKERS = ("let's", "lets", "should we", "maybe", "i think", "trying")
+# "no errors", "not down", "isn't broken", "without any failures"
+LOCAL_NEGATION_RE = re.compile(r"\b(?:no|not|never|without|zero|\w+n't)\s+(?:\w+\s+)?$")
+
+
+def _keyword_re(words) -> re.Pattern:
+    """Whole words / phrases only ("down" must not match "download"), plus simple inflections"""
+    alternatives = "|".join(re.escape(w.strip()) for w in words)
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?:s|es|ed|ing)?(?!\w)")
+
+
+def _mentions(pattern: re.Pattern, text: str, negatable: bool = True) -> bool:
+    """True if pattern matches somewhere in text that is not negated right before it"""
+    for match in pattern.finditer(text):
+        if not (negatable and LOCAL_NEGATION_RE.search(text[max(0, match.start() - 30):match.start()])):
+            return True
+    return False
+
+
+LOCAL_RESOLUTION_RE = _keyword_re(LOCAL_RESOLUTION_MARKERS)
+LOCAL_INCIDENT_RE = _keyword_re(LOCAL_INCIDENT_MARKERS)
+LOCAL_HIGH_SEVERITY_RE = _keyword_re(LOCAL_HIGH_SEVERITY_MARKERS)
+LOCAL_TENTATIVE_RE = _keyword_re(LOCAL_TENTATIVE_MARKERS)
+LOCAL_CATEGORY_RES = {category: _keyword_re(words) for category, words in LOCAL_CATEGORY_KEYWORDS.items()}
+
+
+def local_analyze_message(text: str) -> dict:
+    """
+    Keyword classifier used when the QuickML breaker is open.
+    Coarser than the LLM but returns the same fields without a network call.
+    Marked source="local" so it is never stored in place of an LLM result.
+    """
+    lowered = " " + (text or "").lower().replace("\u2019", "'") + " "
+    # Questions and plans stay discussions even if they mention errors
+    tentative = "?" in lowered or _mentions(LOCAL_TENTATIVE_RE, lowered, negatable=False)
+
+    if not tentative and _mentions(LOCAL_RESOLUTION_RE, lowered):
+        role = "resolution"
+    elif not tentative and _mentions(LOCAL_INCIDENT_RE, lowered):
+        role = "incident"
+    else:
+        role = "discussion"
+
+    category = next((c for c, pattern in LOCAL_CATEGORY_RES.items() if _mentions(pattern, lowered, negatable=False)), "other")
+    severity = "high" if _mentions(LOCAL_HIGH_SEVERITY_RE, lowered) else ("medium" if role == "incident" else "low")
+    specificity = "vague" if lowered.strip(" .!") in LOCAL_VAGUE_RESOLUTIONS else "specific"
+
+    analysis = {
+        "role": role,
+        "category": category,
+        "severity": severity,
+        "specificity": specificity,
+        "title": _fallback_title(text),
+        "source": "local",
+    }
+    print(f"🧮 Local analysis (QuickML unavailable): {analysis}")
+    return analysis
+
+
+def unavailable_analysis(text: str) -> dict:
+    """Defaults used when the LLM call failed (marked like local_analyze_message)"""
+    return {**normalize_analysis({}, text), "source": "local"}
+
+
+def is_local_analysis(cls: dict) -> bool:
+    """True for keyword / default analyses: retries should ask the LLM again, not reuse them"""
+    return (cls or {}).get("source") == "local"
+
+
+def build_analysis_prompt(text: str) -> str:
+    return f"""Analyze this engineering message:
+
+Statement: "{text[:ANALYSIS_TEXT_MAX_CHARS]}"
 
 Return ONLY this JSON (no extra text):
-{{"role": "incident|discussion|resolution", "category": "database|cache|auth|network|security|deployment|other", "severity": "low|medium|high"}}
+{{"role": "incident|discussion|resolution", "category": "database|cache|auth|network|security|deployment|other", "severity": "low|medium|high", "specificity": "vague|specific", "title": "short incident title"}}
 
 Rules:
 - role:
@@ -687,83 +1058,291 @@ Rules:
   - "discussion" for everything else including: suggestions ("let's try"), questions ("should we?"), plans ("we need to"), explanations, acknowledgments, or any chat that is NOT an active incident report or a completion statement. Think from perspective of IT Employees . There can be technical and casual convos as well. 
 - category: database, cache, auth, network, security, deployment, or other
 - severity: low, medium, or high
+- specificity:
+  - "vague" = generic statement without mentioning what was fixed (e.g., "fixed", "done", "working now", "issue resolved")
+  - "specific" = mentions what was done or what issue was resolved (e.g., "restarted payment gateway", "fixed database timeout")
+- title: the main incident as a short title (max 10 words), e.g. "Production database is down", "Payment gateway connection refused"
 
 JSON:"""
 
+
+def _get_cached_analysis(text: str):
+    with _analysis_cache_lock:
+        cached = _analysis_cache.get(text)
+        if cached is None:
+            return None
+        _analysis_cache.move_to_end(text)
+    print(f"♻️ Reusing analysis for message: {cached}")
+    return dict(cached)
+
+
+def _cache_analysis(text: str, analysis: dict):
+    with _analysis_cache_lock:
+        _analysis_cache[text] = dict(analysis)
+        while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+
+
+def _analyze_message_single(text: str) -> dict:
+    """One QuickML request for one message (no batching)"""
     data = {
-        "prompt": prompt,
+        "prompt": build_analysis_prompt(text),
         "model": "crm-di-qwen_text_14b-fp8-it",
         "system_prompt": "You classify engineering messages.Your decisions lead to important IT Decisions. So Be very careful.  Return ONLY valid JSON. Be strict: 'resolution' means the problem is ALREADY solved, not planned or being worked on.",
         "top_p": 0.8,
         "top_k": 40,
         "best_of": 1,
         "temperature": 0.1,
-        "max_tokens": 128,
+        "max_tokens": 160,
     }
 
+    output_text = None
     try:
-        resp = requests.post(url, json=data, headers=headers, timeout=30)
-        print(f"LLM Status: {resp.status_code}")
-        
-        if resp.status_code != 200:
-            print(f"LLM Error Response: {resp.text}")
-            return {"role": "discussion", "category": "other", "severity": "low"}
-        
-        result = resp.json()
-        print(f"LLM Full Response: {json.dumps(result, indent=2)}")
-        
-        # Try different paths to find the output
-        output_text = None
-        
-        # Path 1: data.output_text
-        if "data" in result and "output_text" in result["data"]:
-            output_text = result["data"]["output_text"]
-        
-        # Path 2: direct output_text
-        elif "output_text" in result:
-            output_text = result["output_text"]
-        
-        # Path 3: response
-        elif "response" in result:
-            output_text = result["response"]
-        
+        output_text = quickml.chat(data)
         print(f"Extracted output_text: {output_text}")
-        
+
         if not output_text:
+            # Timed out, failed or breaker open: keywords beat a blanket "discussion"
             print("No output_text found in response")
-            return {"role": "discussion", "category": "other", "severity": "low"}
-        
-        # Clean the output (remove markdown, extra text)
-        output_text = output_text.strip()
-        
-        # Try to extract JSON if surrounded by text
-        if "{" in output_text and "}" in output_text:
-            start = output_text.index("{")
-            end = output_text.rindex("}") + 1
-            json_str = output_text[start:end]
-        else:
-            json_str = output_text
-        
-        print(f"Attempting to parse JSON: {json_str}")
-        classification = json.loads(json_str)
-        
-        # Validate fields
-        if "role" not in classification or "category" not in classification or "severity" not in classification:
-            print(f"Missing required fields in classification: {classification}")
-            return {"role": "discussion", "category": "other", "severity": "low"}
-        
-        print(f"✅ Parsed classification: {classification}")
-        return classification
-        
+            return local_analyze_message(text)
+
+        analysis = normalize_analysis(json.loads(_extract_json_object(output_text)), text)
+
     except json.JSONDecodeError as e:
         print(f"JSON parse error: {e}")
-        print(f"Failed to parse: {output_text if 'output_text' in locals() else 'N/A'}")
-        return {"role": "discussion", "category": "other", "severity": "low"}
+        print(f"Failed to parse: {output_text}")
+        return unavailable_analysis(text)
     except Exception as e:
-        print(f"LLM classification exception: {e}")
+        print(f"LLM analysis exception: {e}")
         import traceback
         traceback.print_exc()
-        return {"role": "discussion", "category": "other", "severity": "low"}
+        return unavailable_analysis(text)
+
+    print(f"✅ Parsed analysis: {analysis}")
+    _cache_analysis(text, analysis)
+    return analysis
+
+
+def build_batch_analysis_prompt(texts: list) -> str:
+    numbered = "\n".join(
+        f'{idx}. "{text[:ANALYSIS_TEXT_MAX_CHARS]}"' for idx, text in enumerate(texts, 1)
+    )
+    return f"""Analyze each of these {len(texts)} engineering messages independently:
+
+{numbered}
+
+Return ONLY a JSON array with one object per message, in the same order (no extra text):
+[{{"id": 1, "role": "incident|discussion|resolution", "category": "database|cache|auth|network|security|deployment|other", "severity": "low|medium|high", "specificity": "vague|specific", "title": "short incident title"}}]
+
+Rules:
+- role:
+  - "resolution" ONLY if the message explicitly states that a problem is ALREADY fixed, resolved, closed, working now, back to normal, or issue is gone. Discussing a possible cause or planning a fix is a discussion, not a resolution.
+  - "incident" if it reports an active problem, failure, error, outage, or something broken.
+  - "discussion" for everything else: suggestions, questions, plans, explanations, acknowledgments, casual chat.
+- category: database, cache, auth, network, security, deployment, or other
+- severity: low, medium, or high
+- specificity: "vague" for generic statements ("fixed", "done", "working now"), "specific" if it says what was done or fixed
+- title: the main incident as a short title (max 10 words)
+- id: the message number from the list above
+
+JSON:"""
+
+
+def _parse_batch_analysis(output_text: str, texts: list) -> list:
+    """
+    Map a JSON array response back onto the input messages.
+    Returns a list aligned with texts; entries that could not be
+    parsed are None so the caller can fall back to single calls.
+    """
+    results = [None] * len(texts)
+
+    output_text = output_text.strip()
+    if "[" in output_text and "]" in output_text:
+        output_text = output_text[output_text.index("["):output_text.rindex("]") + 1]
+
+    try:
+        items = json.loads(output_text)
+    except json.JSONDecodeError as e:
+        print(f"Batch JSON parse error: {e}")
+        return results
+
+    if not isinstance(items, list):
+        return results
+
+    for pos, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        try:
+            idx = int(item.get("id", pos + 1)) - 1
+        except (TypeError, ValueError):
+            idx = pos
+        if not 0 <= idx < len(texts) or results[idx] is not None:
+            continue
+        # Without a valid role the item is useless, retry it on its own
+        if str(item.get("role", "")).strip().lower() not in ANALYSIS_ROLES:
+            continue
+        results[idx] = normalize_analysis(item, texts[idx])
+
+    return results
+
+
+def analyze_messages_batch(texts: list) -> list:
+    """
+    Analyze several messages with one numbered QuickML prompt.
+    Messages missing from the (partially) parsed response are
+    analyzed one by one.
+    """
+    if not texts:
+        return []
+    if len(texts) == 1:
+        return [_analyze_message_single(texts[0])]
+
+    data = {
+        "prompt": build_batch_analysis_prompt(texts),
+        "model": "crm-di-qwen_text_14b-fp8-it",
+        "system_prompt": "You classify engineering messages in bulk. Return ONLY a valid JSON array. Be strict: 'resolution' means the problem is ALREADY solved, not planned or being worked on.",
+        "top_p": 0.8,
+        "top_k": 40,
+        "best_of": 1,
+        "temperature": 0.1,
+        "max_tokens": 160 * len(texts),
+    }
+
+    results = [None] * len(texts)
+    try:
+        # Larger prompt and output than a single message, so allow more time
+        output_text = quickml.chat(data, deadline=QUICKML_CHAT_DEADLINE_S * 2)
+        if output_text:
+            results = _parse_batch_analysis(output_text, texts)
+
+    except Exception as e:
+        print(f"LLM batch analysis exception: {e}")
+
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        print(f"⚠️ Batch analysis incomplete ({len(missing)}/{len(texts)} missing), falling back to single calls")
+    for text, analysis in zip(texts, results):
+        if analysis is not None:
+            _cache_analysis(text, analysis)
+    # Single calls cache their own LLM results (but not local fallbacks)
+    for i in missing:
+        results[i] = _analyze_message_single(texts[i])
+
+    print(f"✅ Batch analyzed {len(texts)} messages ({len(texts) - len(missing)} from one call)")
+    return results
+
+
+# ---------- Micro-batching ----------
+# During incident storms many Flask workers classify at once. Instead of one
+# QuickML request each, callers park on a Future while a collector thread
+# gathers whatever arrives within a short window into one batch prompt.
+
+LLM_BATCH_ENABLED = os.getenv("LLM_BATCH_ENABLED", "true").lower() == "true"
+LLM_BATCH_WINDOW_MS = int(os.getenv("LLM_BATCH_WINDOW_MS", "200"))
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+LLM_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", "4"))
+# Longest a caller waits for its batch (the batch call plus single-call retries)
+# before falling back to the keyword classifier
+LLM_BATCH_WAIT_S = float(os.getenv("LLM_BATCH_WAIT_S", str(QUICKML_CHAT_DEADLINE_S * 3 + 1)))
+
+
+class AnalysisBatcher:
+    def __init__(self, window_ms: int, max_size: int, concurrency: int):
+        self.window = window_ms / 1000.0
+        self.max_size = max(1, max_size)
+        self.pending = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm-batch")
+        self.lock = threading.Lock()
+        self.thread = None
+        self.inflight = 0
+        self.stats = {"messages": 0, "batches": 0, "timeouts": 0}
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._collect_loop, name="llm-batch-collector", daemon=True)
+                self.thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue a message for the next batch; the Future resolves to its analysis"""
+        self._ensure_started()
+        future = Future()
+        self.pending.put((text, future))
+        return future
+
+    def analyze(self, text: str) -> dict:
+        try:
+            return self.submit(text).result(timeout=LLM_BATCH_WAIT_S)
+        except concurrent.futures.TimeoutError:
+            with self.lock:
+                self.stats["timeouts"] += 1
+            print(f"⚠️ Batch analysis took over {LLM_BATCH_WAIT_S:g}s, using local analysis")
+            return local_analyze_message(text)
+
+    def _collect_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            # A lone message with nothing in flight goes out at once;
+            # only wait for company when traffic is actually concurrent
+            with self.lock:
+                idle = self.inflight == 0
+            deadline = time.monotonic() + (0 if idle and self.pending.empty() else self.window)
+
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            with self.lock:
+                self.inflight += 1
+            self.executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list):
+        with self.lock:
+            self.stats["messages"] += len(batch)
+            self.stats["batches"] += 1
+
+        texts = [text for text, _ in batch]
+        try:
+            results = analyze_messages_batch(texts)
+        except Exception as e:
+            print(f"❌ Batch dispatch error: {e}")
+            results = [unavailable_analysis(text) for text in texts]
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+        for (text, future), analysis in zip(batch, results):
+            future.set_result(analysis)
+
+
+analysis_batcher = AnalysisBatcher(LLM_BATCH_WINDOW_MS, LLM_BATCH_MAX_SIZE, LLM_BATCH_CONCURRENCY)
+
+
+def analyze_message_llm(text: str) -> dict:
+    """
+    Role, category, severity, specificity and title for a message.
+    Goes through the micro-batcher so concurrent callers share requests.
+    """
+    cached = _get_cached_analysis(text)
+    if cached is not None:
+        return cached
+
+    if breakers["quickml_chat"].is_open():
+        return local_analyze_message(text)
+
+    if LLM_BATCH_ENABLED:
+        return analysis_batcher.analyze(text)
+    return _analyze_message_single(text)
+
+
+def classify_message_llm(text: str) -> dict:
+    """Classify a message as incident/discussion/resolution (see analyze_message_llm)"""
+    return analyze_message_llm(text)
 
 
 
@@ -902,38 +1481,334 @@ def get_latest_open_issue_for_conversation(conversation_id: str):
 #         return {"role": "discussion", "category": "other", "severity": "low"}
 
 
-# ---------- Embedding + Qdrant ----------
+# ---------- Embedding + Qdrant ----------
+
+def embed_text(text: str) -> list[float]:
+    def _embed():
+        res = genai_client.models.embed_content(
+            model="gemini-embedding-001",
+            contents=text
+        )
+        return res.embeddings[0].values
+    return breakers["gemini_embed"].call(_embed)
+
+
+def embed_texts(texts: list) -> list:
+    """Embed several texts with one Gemini request (same order as texts)"""
+    def _embed():
+        res = genai_client.models.embed_content(
+            model="gemini-embedding-001",
+            contents=texts
+        )
+        return [e.values for e in res.embeddings]
+    return breakers["gemini_embed"].call(_embed)
+
+
+def embed_texts_or_none(texts: list) -> list:
+    """Batch version of embed_text_or_none; a failed batch yields None for every text"""
+    if not texts:
+        return []
+    try:
+        vectors = embed_texts(texts)
+        if len(vectors) == len(texts):
+            return vectors
+        print(f"⚠️ Embedding batch returned {len(vectors)}/{len(texts)} vectors")
+    except Exception as e:
+        print(f"⚠️ Batch embedding unavailable: {e}")
+    return [None] * len(texts)
+
+
+def embed_text_or_none(text: str):
+    """Embedding for the ingest path; None while Gemini is unavailable (the message gets queued)"""
+    try:
+        return embed_text(text)
+    except Exception as e:
+        print(f"⚠️ Embedding unavailable, queuing vector for later: {e}")
+        return None
+
+
+def ensure_qdrant_collection(vector_dim: int):
+    collections = qdrant.get_collections().collections
+    if not any(c.name == QDRANT_COLLECTION for c in collections):
+        qdrant.create_collection(
+            collection_name=QDRANT_COLLECTION,
+            vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE),
+        )
+        print(f"✅ Created Qdrant collection {QDRANT_COLLECTION}")
+    
+    for field in ["role", "category", "issue_id"]:
+        try:
+            qdrant.create_payload_index(
+                collection_name=QDRANT_COLLECTION,
+                field_name=field,
+                field_schema=PayloadSchemaType.KEYWORD,
+            )
+        except Exception:
+            pass
+
+
+def normalize_message_id(raw_id: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, raw_id))
+
+
+# ---------- Degraded Vector Path ----------
+# While Gemini or Qdrant is unavailable, messages still go to the Data Store
+# and get linked by keywords; their vectors are queued here and written to
+# Qdrant by a background thread once both breakers let calls through.
+
+VECTOR_BACKLOG_MAX = int(os.getenv("VECTOR_BACKLOG_MAX", "5000"))
+VECTOR_BACKLOG_RETRY_S = float(os.getenv("VECTOR_BACKLOG_RETRY_S", "10"))
+
+KeywordHit = namedtuple("KeywordHit", ["payload", "score"])
+
+KEYWORD_STOPWORDS = {
+    "the", "and", "for", "with", "this", "that", "from", "are", "was", "were", "has", "have",
+    "not", "but", "our", "all", "its", "it's", "into", "now", "again", "being", "been", "issue",
+}
+
+
+def _keywords(text: str) -> set:
+    words = "".join(ch if ch.isalnum() else " " for ch in (text or "").lower()).split()
+    return {w for w in words if len(w) >= 3 and w not in KEYWORD_STOPWORDS}
+
+
+def keyword_issue_hits(text: str, limit: int = 10) -> list:
+    """
+    Score open issues by keyword overlap with text. Returns hit-like objects
+    (payload + score) so the similarity-linking code can use them unchanged.
+    """
+    query = _keywords(text)
+    if not query:
+        return []
+    hits = []
+    for issue in fetch_open_issues():
+        words = _keywords(issue.get("title", ""))
+        if not words:
+            continue
+        score = len(query & words) / min(len(query), len(words))
+        if score > 0:
+            hits.append(KeywordHit({"issue_id": issue.get("issue_id"), "role": "incident"}, score))
+    hits.sort(key=lambda h: h.score, reverse=True)
+    print(f"🔤 Keyword linking over open issues: {len(hits)} candidate(s)")
+    return hits[:limit]
+
+
+def qdrant_search(query_vector=None, fallback_text: str = None, **kwargs):
+    """
+    qdrant.search through the breaker. When Qdrant (or the embedding) is
+    unavailable, falls back to keyword hits over open issues if fallback_text
+    is given, otherwise returns no hits.
+    """
+    if query_vector is not None:
+        try:
+            return breakers["qdrant"].call(qdrant.search, query_vector=query_vector, **kwargs)
+        except Exception as e:
+            print(f"⚠️ Qdrant search unavailable: {e}")
+    if fallback_text:
+        return keyword_issue_hits(fallback_text, kwargs.get("limit", 10))
+    return []
+
+
+def ensure_qdrant_collection_safe(vector) -> bool:
+    if vector is None:
+        return False
+    try:
+        breakers["qdrant"].call(ensure_qdrant_collection, len(vector))
+        return True
+    except Exception as e:
+        print(f"⚠️ Qdrant unavailable: {e}")
+        return False
+
+
+class VectorBacklog:
+    def __init__(self, max_items: int):
+        self.items = deque(maxlen=max_items)  # (point_id, vector or None, payload, text)
+        self.stats = {"queued": 0, "flushed": 0, "dropped": 0}
+        self.lock = threading.Lock()
+        self.started = False
+
+    def add(self, point_id: str, vector, payload: dict, text: str):
+        with self.lock:
+            if len(self.items) == self.items.maxlen:
+                self.stats["dropped"] += 1
+                print("⚠️ Vector backlog full, dropping oldest entry")
+            self.items.append((point_id, vector, payload, text))
+            self.stats["queued"] += 1
+            if not self.started:
+                self.started = True
+                threading.Thread(target=self._drain_loop, name="vector-backlog", daemon=True).start()
+        print(f"📥 Queued vector for {payload.get('message_id')} ({len(self.items)} pending)")
+
+    def _drain_loop(self):
+        while True:
+            time.sleep(VECTOR_BACKLOG_RETRY_S)
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"❌ Vector backlog drain error: {e}")
+
+    def drain(self):
+        while True:
+            if breakers["qdrant"].is_open() or breakers["gemini_embed"].is_open():
+                return
+            with self.lock:
+                if not self.items:
+                    return
+                point_id, vector, payload, text = self.items[0]
+            try:
+                if vector is None:
+                    vector = embed_text(text)
+                breakers["qdrant"].call(ensure_qdrant_collection, len(vector))
+                breakers["qdrant"].call(qdrant.upsert, QDRANT_COLLECTION, [PointStruct(id=point_id, vector=vector, payload=payload)])
+            except Exception as e:
+                print(f"⚠️ Vector backlog still blocked: {e}")
+                return
+            with self.lock:
+                if self.items and self.items[0][0] == point_id:
+                    self.items.popleft()
+                self.stats["flushed"] += 1
+            print(f"✅ Flushed queued vector for {payload.get('message_id')}")
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"pending": len(self.items), **self.stats}
+
+
+vector_backlog = VectorBacklog(VECTOR_BACKLOG_MAX)
+
+
+def upsert_message_points(points: list) -> list:
+    """Bulk upsert_message_point: points are (point_id, vector, payload, text); returns per-point success"""
+    ready = [p for p in points if p[1] is not None]
+    if ready:
+        try:
+            ensure_qdrant_collection_safe(ready[0][1])
+            breakers["qdrant"].call(
+                qdrant.upsert, QDRANT_COLLECTION,
+                [PointStruct(id=point_id, vector=vector, payload=payload) for point_id, vector, payload, _ in ready]
+            )
+            return [p[1] is not None or upsert_message_point(*p) for p in points]
+        except Exception as e:
+            print(f"⚠️ Qdrant bulk upsert unavailable: {e}")
+    return [upsert_message_point(*p) for p in points]
 
-def embed_text(text: str) -> list[float]:
-    res = genai_client.models.embed_content(
-        model="gemini-embedding-001",
-        contents=text
-    )
-    return res.embeddings[0].values
 
+def upsert_message_point(point_id: str, vector, payload: dict, text: str):
+    """Upsert one message vector, or queue it while Gemini/Qdrant are unavailable"""
+    if vector is not None:
+        try:
+            breakers["qdrant"].call(qdrant.upsert, QDRANT_COLLECTION, [PointStruct(id=point_id, vector=vector, payload=payload)])
+            return True
+        except Exception as e:
+            print(f"⚠️ Qdrant upsert unavailable: {e}")
+    vector_backlog.add(point_id, vector, payload, text)
+    return False
 
-def ensure_qdrant_collection(vector_dim: int):
-    collections = qdrant.get_collections().collections
-    if not any(c.name == QDRANT_COLLECTION for c in collections):
-        qdrant.create_collection(
-            collection_name=QDRANT_COLLECTION,
-            vectors_config=VectorParams(size=vector_dim, distance=Distance.COSINE),
-        )
-        print(f"✅ Created Qdrant collection {QDRANT_COLLECTION}")
-    
-    for field in ["role", "category", "issue_id"]:
+
+# ---------- Idempotency Ledger ----------
+# Only the Qdrant point id is naturally idempotent; Data Store inserts and
+# issue creation are plain POSTs. The ledger records, per message_id, which
+# stages already completed (analysis, issue link/creation, DS row, Qdrant
+# point, attachment analysis) so a redelivered or retried message resumes
+# after the last completed stage instead of repeating it.
+
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", "idempotency_ledger.db")
+IDEMPOTENCY_TTL_S = int(os.getenv("IDEMPOTENCY_TTL_S", str(7 * 24 * 3600)))
+DS_BULK_INSERT_MAX = int(os.getenv("DS_BULK_INSERT_MAX", "200"))
+
+
+class IdempotencyLedger:
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.ready = False
+        self.writes = 0
+        self.stats = {"hits": 0, "records": 0}
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        with self.lock:
+            if not self.ready:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS message_ledger (
+                        message_id TEXT PRIMARY KEY,
+                        stages TEXT NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                """)
+                self.ready = True
+                self._purge(conn)
+        return conn
+
+    def _purge(self, conn):
+        conn.execute("DELETE FROM message_ledger WHERE updated_at < ?", (time.time() - IDEMPOTENCY_TTL_S,))
+
+    def get(self, message_id) -> dict:
+        """Completed stages for message_id ({} if none)"""
+        if not message_id:
+            return {}
         try:
-            qdrant.create_payload_index(
-                collection_name=QDRANT_COLLECTION,
-                field_name=field,
-                field_schema=PayloadSchemaType.KEYWORD,
-            )
-        except Exception:
-            pass
+            row = self._conn().execute(
+                "SELECT stages FROM message_ledger WHERE message_id = ?", (str(message_id),)
+            ).fetchone()
+        except Exception as e:
+            print(f"⚠️ Idempotency ledger read failed: {e}")
+            return {}
+        if not row:
+            return {}
+        with self.lock:
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def record(self, message_id, **stages):
+        """
+        Merge completed stages into message_id's entry (a None value removes
+        the key; record "no issue" as issue_id=LEDGER_UNLINKED).
+        """
+        if not message_id:
+            return
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT stages FROM message_ledger WHERE message_id = ?", (str(message_id),)
+                ).fetchone()
+                entry = json.loads(row[0]) if row else {}
+                for key, value in stages.items():
+                    if value is None:
+                        entry.pop(key, None)
+                    else:
+                        entry[key] = value
+                conn.execute(
+                    "INSERT OR REPLACE INTO message_ledger (message_id, stages, updated_at) VALUES (?, ?, ?)",
+                    (str(message_id), json.dumps(entry), time.time())
+                )
+            with self.lock:
+                self.stats["records"] += 1
+                self.writes += 1
+                purge = self.writes % 1000 == 0
+            if purge:
+                self._purge(conn)
+        except Exception as e:
+            print(f"⚠️ Idempotency ledger write failed: {e}")
 
+    def snapshot(self) -> dict:
+        entries = self._conn().execute("SELECT COUNT(*) FROM message_ledger").fetchone()[0]
+        with self.lock:
+            return {"entries": entries, **self.stats}
 
-def normalize_message_id(raw_id: str) -> str:
-    return str(uuid.uuid5(uuid.NAMESPACE_URL, raw_id))
+
+# issue_id recorded for a message that was linked to no issue
+LEDGER_UNLINKED = ""
+
+message_ledger = IdempotencyLedger(IDEMPOTENCY_DB_PATH)
 
 
 # ---------- Data Store: Messages ----------
@@ -944,6 +1819,12 @@ def insert_message_into_datastore(conversation_id, message_id, sender_id, timest
         print("⚠️ Catalyst config missing; skipping DS insert")
         return None
 
+    # Already written by an earlier attempt (redelivery / retry)
+    row_id = message_ledger.get(message_id).get("row_id")
+    if row_id:
+        print(f"♻️ DS row for {message_id} already exists ({row_id}), skipping insert")
+        return row_id
+
     url = f"https://api.catalyst.zoho.com/baas/v1/project/{CATALYST_PROJECT_ID}/table/{CONVERSATIONS_TABLE}/row"
     headers = {
         "Authorization": f"Zoho-oauthtoken {get_catalyst_token()}",
@@ -966,11 +1847,69 @@ def insert_message_into_datastore(conversation_id, message_id, sender_id, timest
         resp = requests.post(url, headers=headers, json=body, timeout=10)
         print("DS message insert:", resp.status_code)
         if resp.status_code == 201:
-            return resp.json()[0].get("ROWID")
+            if issue_id:
+                issue_digests.note_message(issue_id, message_id, role, message_text)
+                issue_threads.discard(issue_id)
+            row_id = resp.json()[0].get("ROWID")
+            message_ledger.record(message_id, row_id=row_id)
+            return row_id
     except Exception as e:
         print("DS message insert exception:", e)
     return None
 
+def insert_messages_into_datastore(rows: list, note_digests: bool = True) -> list:
+    """
+    Bulk version of insert_message_into_datastore: rows are dicts with the
+    same fields. One POST per DS_BULK_INSERT_MAX rows; returns ROWIDs in
+    row order (None where the insert failed). note_digests=False when the
+    caller already fed the rows to the issue digests.
+    """
+    if not (CATALYST_TOKEN and CATALYST_PROJECT_ID):
+        print("⚠️ Catalyst config missing; skipping DS insert")
+        return [None] * len(rows)
+
+    url = f"https://api.catalyst.zoho.com/baas/v1/project/{CATALYST_PROJECT_ID}/table/{CONVERSATIONS_TABLE}/row"
+    headers = {
+        "Authorization": f"Zoho-oauthtoken {get_catalyst_token()}",
+        "Content-Type": "application/json",
+        "CATALYST-ORG": CATALYST_ORG_ID,
+    }
+
+    row_ids = [message_ledger.get(row["message_id"]).get("row_id") for row in rows]
+    todo = [i for i, row_id in enumerate(row_ids) if not row_id]
+
+    for start in range(0, len(todo), DS_BULK_INSERT_MAX):
+        chunk = todo[start:start + DS_BULK_INSERT_MAX]
+        body = [{
+            "conversation_id": rows[i]["conversation_id"],
+            "message_id": rows[i]["message_id"],
+            "sender_id": rows[i]["sender_id"],
+            "time_stamp": int(rows[i]["timestamp_ms"]),
+            "message_text": rows[i]["message_text"],
+            "role": rows[i]["role"],
+            "category": rows[i]["category"],
+            "severity": rows[i]["severity"],
+            "issue_id": rows[i]["issue_id"] or "",
+        } for i in chunk]
+
+        try:
+            resp = requests.post(url, headers=headers, json=body, timeout=30)
+            print(f"DS bulk insert ({len(chunk)} rows):", resp.status_code)
+            if resp.status_code != 201:
+                continue
+            for i, created in zip(chunk, resp.json()):
+                row = rows[i]
+                row_ids[i] = created.get("ROWID")
+                message_ledger.record(row["message_id"], row_id=row_ids[i])
+                if row["issue_id"] and note_digests:
+                    issue_digests.note_message(row["issue_id"], row["message_id"], row["role"], row["message_text"])
+                if row["issue_id"]:
+                    issue_threads.discard(row["issue_id"])
+        except Exception as e:
+            print("DS bulk insert exception:", e)
+
+    return row_ids
+
 def fetch_messages_by_issue_id(issue_id: str):
     if not (CATALYST_TOKEN and CATALYST_PROJECT_ID):
         return []
@@ -1060,6 +1999,12 @@ def create_issue_in_datastore(issue_id, title, source, category, severity, opene
     try:
         resp = requests.post(url, headers=headers, json=body, timeout=10)
         print("DS issue create:", resp.status_code)
+        if resp.status_code == 201:
+            try:
+                row_id = resp.json()[0].get("ROWID")
+            except Exception:
+                row_id = None
+            issue_cache.note_created({**body[0], "ROWID": row_id})
         return resp.status_code == 201
     except Exception as e:
         print("DS issue create exception:", e)
@@ -1127,6 +2072,7 @@ def close_issue_in_datastore(issue_id: str, resolved_at_ms: int) -> bool:
 
         if put_resp.status_code == 200:
             print(f"✅ Successfully updated issue {issue_id} to Resolved")
+            issue_cache.note_resolved(issue_id, resolved_at_ms)
             return True
         else:
             print(f"❌ PUT failed with status {put_resp.status_code}")
@@ -1338,10 +2284,14 @@ def fetch_open_issues():
         print("fetch_open_issues exception:", e)
         return []
 
-def fetch_all_issues():
-    """Fetch ALL issues (Open + Resolved), sorted by recency"""
+def fetch_all_issues(strict: bool = False):
+    """
+    Fetch ALL issues (Open + Resolved), sorted by recency. With strict=True
+    returns None when the table could not be read completely, instead of
+    an empty or partial list.
+    """
     if not (CATALYST_TOKEN and CATALYST_PROJECT_ID):
-        return []
+        return None if strict else []
 
     url = f"https://api.catalyst.zoho.com/baas/v1/project/{CATALYST_PROJECT_ID}/table/{ISSUES_TABLE}/row"
     headers = {
@@ -1361,6 +2311,8 @@ def fetch_all_issues():
             resp = requests.get(f"{url}?{params}", headers=headers, timeout=10)
             print(f"DS fetch all issues: {resp.status_code}")
             if resp.status_code != 200:
+                if strict:
+                    return None
                 break
 
             body = resp.json()
@@ -1383,7 +2335,261 @@ def fetch_all_issues():
 
     except Exception as e:
         print(f"fetch_all_issues exception: {e}")
-        return []
+        return None if strict else []
+
+
+class IssueSnapshot:
+    """
+    Issue lists fetched at most once and shared by every message of a Signals
+    batch. Issues created or closed while the batch is indexed are applied
+    locally, so later messages in the same batch see them.
+    """
+    def __init__(self):
+        self._all = None
+        self._open = None
+
+    def all_issues(self):
+        if self._all is None:
+            self._all = fetch_all_issues()
+        return self._all
+
+    def open_issues(self):
+        if self._open is None:
+            self._open = fetch_open_issues()
+        return self._open
+
+    def note_created(self, issue_id, title, source, category, severity, opened_at):
+        row = {
+            "issue_id": issue_id,
+            "title": title,
+            "source": source,
+            "category": category,
+            "severity": severity,
+            "status": "Open",
+            "opened_at": int(opened_at),
+            "resolved_at": 0,
+        }
+        if self._all is not None:
+            self._all.insert(0, dict(row))
+        if self._open is not None:
+            self._open.insert(0, row)
+
+    def note_closed(self, issue_id, resolved_at_ms):
+        if self._open is not None:
+            self._open[:] = [r for r in self._open if r.get("issue_id") != issue_id]
+        for row in self._all or []:
+            if row.get("issue_id") == issue_id:
+                row["status"] = "Resolved"
+                row["resolved_at"] = int(resolved_at_ms)
+
+
+# ---------- Issue Cache ----------
+# Denormalized issue records (title, category, severity, status, timestamps,
+# resolution summary) for read paths such as search. Loaded once from the
+# Data Store, then kept current by create_issue_in_datastore /
+# close_issue_in_datastore / store_resolution_summary (/clear_issues empties
+# it). A full reload happens every ISSUE_CACHE_REFRESH_S (changes made by
+# other instances) on a background thread while the current map is served,
+# or when an unknown issue_id is requested, at most once per
+# ISSUE_CACHE_MISS_RELOAD_S.
+# A reload that cannot read the whole table keeps the previous map and is
+# retried after ISSUE_CACHE_MISS_RELOAD_S.
+# `version` increases whenever any issue is created, closed or changed, so
+# responses built from the cache can be cached (and ETagged) per version.
+
+ISSUE_CACHE_REFRESH_S = int(os.getenv("ISSUE_CACHE_REFRESH_S", "300"))
+ISSUE_CACHE_MISS_RELOAD_S = int(os.getenv("ISSUE_CACHE_MISS_RELOAD_S", "30"))
+ISSUE_CACHE_FIELDS = ("issue_id", "title", "source", "category", "severity", "status",
+                      "opened_at", "resolved_at", "resolution_summary", "ROWID")
+
+
+class IssueCache:
+    def __init__(self):
+        self.issues = {}
+        self.loaded_at = 0.0
+        self.failed_at = 0.0
+        self.refreshing = False
+        self.version = 0
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0, "reload_failures": 0}
+
+    @staticmethod
+    def _record(row: dict) -> dict:
+        record = {key: row.get(key) for key in ISSUE_CACHE_FIELDS}
+        record["opened_at"] = int(record["opened_at"] or 0)
+        record["resolved_at"] = int(record["resolved_at"] or 0)
+        record["status"] = record["status"] or "Open"
+        return record
+
+    def _due(self, max_age: float) -> bool:
+        """Older than max_age, and no failed reload within ISSUE_CACHE_MISS_RELOAD_S"""
+        now = time.time()
+        return now - self.loaded_at > max_age and now - self.failed_at > ISSUE_CACHE_MISS_RELOAD_S
+
+    def reload(self, max_age: float = None):
+        """Full reload; with max_age, only if no other thread reloaded meanwhile"""
+        with self.reload_lock:
+            if max_age is not None and not self._due(max_age):
+                return
+            rows = fetch_all_issues(strict=True)
+            if rows is None:
+                # Keep serving the previous map rather than an empty or partial one
+                print("⚠️ Issue cache reload failed, keeping the previous issues")
+                with self.lock:
+                    self.failed_at = time.time()
+                    self.stats["reload_failures"] += 1
+                return
+            issues = {row.get("issue_id"): self._record(row) for row in rows if row.get("issue_id")}
+            with self.lock:
+                # Keep local writes newer than the load (created / closed meanwhile)
+                for issue_id, record in self.issues.items():
+                    if record.get("_local_at", 0) > self.loaded_at:
+                        issues[issue_id] = record
+                if self._comparable(issues) != self._comparable(self.issues):
+                    self.version += 1
+                self.issues = issues
+                self.loaded_at = time.time()
+                self.stats["reloads"] += 1
+
+    @staticmethod
+    def _comparable(issues: dict) -> dict:
+        return {iid: {k: v for k, v in r.items() if k != "_local_at"} for iid, r in issues.items()}
+
+    def _ensure_fresh(self):
+        if not self._due(ISSUE_CACHE_REFRESH_S):
+            return
+        if not self.loaded_at:
+            # Nothing to serve yet
+            self.reload(ISSUE_CACHE_REFRESH_S)
+            return
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh, name="issue-cache-refresh", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.reload(ISSUE_CACHE_REFRESH_S)
+        except Exception as e:
+            print(f"⚠️ Issue cache refresh failed: {e}")
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def get_many(self, issue_ids: list) -> dict:
+        """{issue_id: record} for the known ids (one reload if some are unknown)"""
+        self._ensure_fresh()
+        with self.lock:
+            found = {iid: dict(self.issues[iid]) for iid in issue_ids if iid in self.issues}
+            missing = len(issue_ids) - len(found)
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += missing
+            stale = self._due(ISSUE_CACHE_MISS_RELOAD_S)
+        if missing and stale:
+            self.reload(ISSUE_CACHE_MISS_RELOAD_S)
+            with self.lock:
+                found = {iid: dict(self.issues[iid]) for iid in issue_ids if iid in self.issues}
+        return found
+
+    def note_created(self, row: dict):
+        record = self._record(row)
+        record["_local_at"] = time.time()
+        with self.lock:
+            self.issues[record["issue_id"]] = record
+            self.version += 1
+
+    def note_resolved(self, issue_id: str, resolved_at_ms: int, summary: str = None):
+        with self.lock:
+            record = self.issues.get(issue_id)
+            if record is None:
+                return
+            record["status"] = "Resolved"
+            record["resolved_at"] = int(resolved_at_ms)
+            if summary:
+                record["resolution_summary"] = summary
+            record["_local_at"] = time.time()
+            self.version += 1
+
+    def note_summary(self, issue_id: str, summary: str):
+        with self.lock:
+            record = self.issues.get(issue_id)
+            if record is None or record.get("resolution_summary") == summary:
+                return
+            record["resolution_summary"] = summary
+            record["_local_at"] = time.time()
+            self.version += 1
+
+    def clear(self):
+        """Forget every issue (the table was emptied); the next read reloads"""
+        with self.lock:
+            self.issues = {}
+            self.loaded_at = 0.0
+            self.version += 1
+
+    def row_id(self, issue_id: str):
+        """Data Store ROWID of a known issue (no reload)"""
+        with self.lock:
+            record = self.issues.get(issue_id)
+            return record.get("ROWID") if record else None
+
+    def current_version(self) -> int:
+        self._ensure_fresh()
+        with self.lock:
+            return self.version
+
+    def open_issues(self):
+        """(version, open issue records newest first)"""
+        self._ensure_fresh()
+        with self.lock:
+            rows = [
+                dict(r) for r in self.issues.values()
+                if isinstance(r.get("status"), str) and r["status"].strip().lower() == "open"
+            ]
+            version = self.version
+        rows.sort(key=lambda r: r["opened_at"], reverse=True)
+        return version, rows
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "issues": len(self.issues),
+                "version": self.version,
+                "age_s": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+                **self.stats,
+            }
+
+
+issue_cache = IssueCache()
+
+
+def find_issue_row_id(issue_id: str):
+    """ROWID of an issue: from the issue cache, else by paging through the table (None if not found)"""
+    row_id = issue_cache.row_id(issue_id)
+    if row_id:
+        return row_id
+
+    url = f"https://api.catalyst.zoho.com/baas/v1/project/{CATALYST_PROJECT_ID}/table/{ISSUES_TABLE}/row"
+    headers = {
+        "Authorization": f"Zoho-oauthtoken {get_catalyst_token()}",
+        "CATALYST-ORG": CATALYST_ORG_ID,
+    }
+    next_token = None
+    while True:
+        params = "max_rows=300"
+        if next_token:
+            params += f"&next_token={next_token}"
+        resp = requests.get(f"{url}?{params}", headers=headers, timeout=10)
+        if resp.status_code != 200:
+            return None
+        body = resp.json()
+        row = next((r for r in body.get("data", []) if r.get("issue_id") == issue_id), None)
+        if row:
+            return row.get("ROWID")
+        next_token = body.get("next_token")
+        if not next_token:
+            return None
 
 
 # def fetch_open_issues():
@@ -1450,7 +2656,7 @@ def find_similar_open_incident(message_emb, threshold=0.75):
         must=[FieldCondition(key="role", match=MatchValue(value="incident"))]
     )
 
-    hits = qdrant.search(
+    hits = qdrant_search(
         collection_name=QDRANT_COLLECTION,
         query_vector=message_emb,
         query_filter=q_filter,
@@ -1532,14 +2738,6 @@ def summarize_resolution_with_llm(messages: list, current_resolution_text: str =
     
     print(f"📝 Summary components: incident={len(incident_text)} chars, discussions={len(discussion_text)} chars, resolutions={len(resolution_text)} chars")
     
-    # ✅ SAME URL AND HEADERS AS CLASSIFICATION
-    url = f"https://api.catalyst.zoho.com/quickml/v2/project/{CATALYST_PROJECT_ID}/llm/chat"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {get_catalyst_token()}",
-        "CATALYST-ORG": CATALYST_ORG_ID,
-    }
-    
     # ✅ SIMILAR PROMPT STRUCTURE TO CLASSIFICATION
     prompt = f"""Summarize this incident resolution in 1-2 sentences.
 
@@ -1558,80 +2756,423 @@ Summary:"""
         "prompt": prompt,
         "model": "crm-di-qwen_text_14b-fp8-it",
         "system_prompt": "You summarize incident resolutions clearly. Describe what was done to fix the problem and the outcome in 1-2 sentences.",
-        "top_p": 0.8,
-        "top_k": 40,
-        "best_of": 1,
+        "top_p": 0.8,
+        "top_k": 40,
+        "best_of": 1,
+        "temperature": 0.3,
+        "max_tokens": 150,
+    }
+    
+    try:
+        output_text = quickml.chat(data)
+        print(f"Extracted summary output_text: {output_text}")
+        
+        if not output_text:
+            # Request failed, timed out or came back empty: fall back to resolution text
+            print("No output_text found in summary response")
+            return resolution_text
+        
+        # Clean the output
+        summary = output_text.strip()
+        
+        # Remove any leading/trailing quotes or markdown
+        if summary.startswith('"') and summary.endswith('"'):
+            summary = summary[1:-1]
+        
+        if len(summary) > 10:
+            print(f"✅ Parsed summary: {summary[:100]}...")
+            return summary
+        else:
+            print(f"⚠️ Summary too short, using fallback")
+            return resolution_text
+        
+    except Exception as e:
+        print(f"LLM summary exception: {e}")
+        import traceback
+        traceback.print_exc()
+        return resolution_text
+
+
+
+
+# ---------- Resolution Summary Store ----------
+# Summaries are keyed on issue_id plus a fingerprint of the message set they
+# were built from, so search paths reuse them and only pay for a new LLM call
+# when messages have been linked to the issue since the last summary.
+
+def message_set_fingerprint(messages: list) -> str:
+    ids = sorted(str(m.get("message_id") or m.get("ROWID") or "") for m in messages)
+    return hashlib.sha1("\n".join(ids).encode()).hexdigest()
+
+
+class ResolutionSummaryStore:
+    def __init__(self):
+        self.entries = {}  # {issue_id: {"fingerprint": str | None, "summary": str}}
+        self.lock = threading.Lock()
+
+    def put(self, issue_id: str, summary: str, fingerprint: str = None):
+        with self.lock:
+            self.entries[issue_id] = {"fingerprint": fingerprint, "summary": summary}
+
+    def get(self, issue_id: str, issue: dict = None, messages: list = None):
+        """
+        Return a stored summary that is still valid for `messages`
+        (any stored summary if messages are not given), else None.
+        """
+        fingerprint = message_set_fingerprint(messages) if messages is not None else None
+
+        with self.lock:
+            entry = self.entries.get(issue_id)
+            if entry is None and issue and (issue.get("resolution_summary") or "").strip():
+                # Written by store_resolution_summary at close time; treat the
+                # messages we see now as the set it was built from
+                entry = {"fingerprint": fingerprint, "summary": issue["resolution_summary"]}
+                self.entries[issue_id] = entry
+
+            if entry is None:
+                return None
+            if fingerprint is None:
+                return entry["summary"]
+            if entry["fingerprint"] is None:
+                entry["fingerprint"] = fingerprint
+            if entry["fingerprint"] == fingerprint:
+                return entry["summary"]
+
+        print(f"🔄 New messages linked to {issue_id[:12]} since last summary")
+        return None
+
+
+resolution_summaries = ResolutionSummaryStore()
+summary_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary-writer")
+
+
+def get_resolution_summary(issue_id: str, messages: list = None, issue: dict = None):
+    """
+    Stored resolution summary for an issue. Regenerated with the LLM only
+    when `messages` differ from the set the stored summary was built from.
+    Returns None when nothing is stored and no messages were given.
+    """
+    summary = resolution_summaries.get(issue_id, issue=issue, messages=messages)
+    if summary:
+        print(f"♻️ Reusing resolution summary for {issue_id[:12]}")
+        return summary
+
+    if messages is None:
+        return None
+
+    summary = summarize_resolution_with_llm(messages)
+    resolution_summaries.put(issue_id, summary, message_set_fingerprint(messages))
+    # Write it back so other instances (and the next restart) reuse it
+    summary_writer.submit(persist_resolution_summary, issue_id, summary)
+    return summary
+
+
+
+
+# ---------- Rolling Issue Digest ----------
+# Each open issue keeps a small digest (incident text, recent investigation
+# notes, a folded summary of older notes and the ids of every linked message).
+# It is updated on a background thread whenever a message is linked, so
+# closing an issue needs one short "digest + resolution" prompt instead of a
+# full-table scan plus a summary over the whole thread.
+
+DIGEST_MAX_NOTES = int(os.getenv("DIGEST_MAX_NOTES", "6"))
+DIGEST_NOTE_CHARS = 200
+DIGEST_WAIT_S = float(os.getenv("DIGEST_WAIT_S", "2"))
+# Issues that never close must not pin their digest forever: least recently
+# updated digests beyond DIGEST_MAX_ISSUES, or idle for DIGEST_TTL_S, are
+# dropped (a later close then falls back to fetching the thread)
+DIGEST_MAX_ISSUES = int(os.getenv("DIGEST_MAX_ISSUES", "1000"))
+DIGEST_TTL_S = int(os.getenv("DIGEST_TTL_S", str(7 * 24 * 3600)))
+
+
+def fold_digest_with_llm(incident: str, digest: str, notes: list) -> str:
+    """Fold older investigation notes into the running digest (1-3 sentences)"""
+    notes_text = "; ".join(notes)
+    prompt = f"""Update the running investigation digest for this incident.
+
+Problem: "{incident[:150]}"
+
+Current digest: "{digest or 'None yet'}"
+
+New notes: "{notes_text[:600]}"
+
+Rewrite the digest in 1-3 sentences keeping findings, suspected causes and actions taken.
+
+Digest:"""
+
+    data = {
+        "prompt": prompt,
+        "model": "crm-di-qwen_text_14b-fp8-it",
+        "system_prompt": "You keep short running digests of incident investigations. Be factual and concise.",
+        "temperature": 0.2,
+        "max_tokens": 150,
+    }
+
+    output = quickml.chat(data)
+    if output and len(output.strip()) > 10:
+        return output.strip().strip('"')
+
+    # Fallback: keep the tail of the raw notes
+    return f"{digest} {notes_text}".strip()[-400:]
+
+
+class IssueDigestStore:
+    def __init__(self, max_issues: int = DIGEST_MAX_ISSUES, ttl_s: int = DIGEST_TTL_S):
+        # {issue_id: {"incident", "digest", "notes", "message_ids", "updated_at"}}, LRU
+        self.entries = OrderedDict()
+        self.pending = {}  # {issue_id: Future of the latest queued update}
+        self.max_issues = max_issues
+        self.ttl_s = ttl_s
+        self.lock = threading.Lock()
+        # One worker keeps updates for an issue in arrival order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="issue-digest")
+        # Thread fetches for issues that predate this process run beside it
+        self.seeder = ThreadPoolExecutor(max_workers=2, thread_name_prefix="issue-digest-seed")
+
+    def note_message(self, issue_id: str, message_id: str, role: str, message_text: str):
+        """Queue a digest update for a message that was just linked to issue_id"""
+        if not issue_id:
+            return
+        future = self.executor.submit(self._apply, issue_id, message_id, role, message_text)
+        with self.lock:
+            self.pending[issue_id] = future
+        future.add_done_callback(lambda f: self._clear_pending(issue_id, f))
+
+    def _clear_pending(self, issue_id: str, future: Future):
+        with self.lock:
+            if self.pending.get(issue_id) is future:
+                del self.pending[issue_id]
+
+    @staticmethod
+    def _new_entry() -> dict:
+        return {"incident": "", "digest": "", "notes": [], "message_ids": [], "updated_at": time.time()}
+
+    def _store(self, issue_id: str, entry: dict):
+        """Insert / touch an entry and evict stale or least recently used ones (lock held)"""
+        entry["updated_at"] = time.time()
+        self.entries[issue_id] = entry
+        self.entries.move_to_end(issue_id)
+        cutoff = time.time() - self.ttl_s
+        while self.entries:
+            oldest_id, oldest = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_issues and oldest["updated_at"] >= cutoff:
+                break
+            del self.entries[oldest_id]
+            print(f"🧹 Evicted digest for {oldest_id[:12]}")
+
+    def _seed(self, issue_id: str):
+        # Issue predates this process: rebuild from the DataStore on the
+        # seeder, then replay the updates that arrived while it ran
+        try:
+            rows = fetch_messages_by_issue_id(issue_id)
+        except Exception as e:
+            print(f"❌ Digest seed failed for {issue_id[:12]}: {e}")
+            rows = []
+        seeded = self._new_entry()
+        for m in sorted(rows, key=lambda r: int(r.get("time_stamp", 0) or 0)):
+            self._add(seeded, m.get("message_id", ""), m.get("role", "discussion"), m.get("message_text", ""))
+
+        with self.lock:
+            entry = self.entries.get(issue_id)
+            if entry is None or not entry.get("seeding"):
+                return  # discarded or evicted meanwhile
+            for message_id, role, message_text in entry["buffered"]:
+                if message_id not in seeded["message_ids"]:
+                    self._add(seeded, message_id, role, message_text)
+            self._store(issue_id, seeded)
+        print(f"🧾 Seeded digest for {issue_id[:12]} from {len(rows)} stored messages")
+
+    def _add(self, entry: dict, message_id: str, role: str, message_text: str):
+        if message_id and message_id not in entry["message_ids"]:
+            entry["message_ids"].append(message_id)
+        if role == "incident" and not entry["incident"]:
+            entry["incident"] = message_text[:DIGEST_NOTE_CHARS]
+        elif role == "discussion" and message_text:
+            entry["notes"].append(message_text[:DIGEST_NOTE_CHARS])
+
+    def _apply(self, issue_id: str, message_id: str, role: str, message_text: str):
+        try:
+            with self.lock:
+                entry = self.entries.get(issue_id)
+                if entry is None:
+                    entry = self._new_entry()
+                    if role != "incident":
+                        entry["seeding"] = True
+                        entry["buffered"] = []
+                        self.seeder.submit(self._seed, issue_id)
+                if entry.get("seeding"):
+                    entry["buffered"].append((message_id, role, message_text))
+                self._add(entry, message_id, role, message_text)
+                self._store(issue_id, entry)
+                fold = not entry.get("seeding") and len(entry["notes"]) > DIGEST_MAX_NOTES
+                if fold:
+                    # Keep the latest notes verbatim, fold the rest into the digest
+                    keep = DIGEST_MAX_NOTES // 2
+                    older, entry["notes"] = entry["notes"][:-keep], entry["notes"][-keep:]
+                    incident, digest = entry["incident"], entry["digest"]
+
+            if fold:
+                folded = fold_digest_with_llm(incident, digest, older)
+                with self.lock:
+                    entry["digest"] = folded
+                print(f"🧾 Folded {len(older)} notes into digest for {issue_id[:12]}")
+        except Exception as e:
+            print(f"❌ Digest update failed for {issue_id[:12]}: {e}")
+
+    def get(self, issue_id: str, wait: float = DIGEST_WAIT_S):
+        """Digest for an issue, after waiting briefly for queued updates. None if unknown or still seeding."""
+        with self.lock:
+            future = self.pending.get(issue_id)
+        if future is not None:
+            try:
+                future.result(timeout=wait)
+            except Exception:
+                print(f"⚠️ Digest for {issue_id[:12]} still updating, using what we have")
+        with self.lock:
+            entry = self.entries.get(issue_id)
+            if entry is None or entry.get("seeding"):
+                return None
+            return {**entry, "notes": list(entry["notes"]), "message_ids": list(entry["message_ids"])}
+
+    def discard(self, issue_id: str):
+        with self.lock:
+            self.entries.pop(issue_id, None)
+            self.pending.pop(issue_id, None)
+
+
+issue_digests = IssueDigestStore()
+
+
+def summarize_resolution_from_digest(digest: dict, resolution_text: str, specificity: str = "specific") -> str:
+    """
+    Close-time summary from the rolling digest. Skips the LLM entirely when
+    there was no investigation and the resolution already says what was done.
+    """
+    investigation = " ".join(filter(None, [digest.get("digest", ""), "; ".join(digest.get("notes", []))])).strip()
+
+    if not investigation and specificity == "specific":
+        print("📝 Digest has no investigation notes, using specific resolution as summary")
+        return resolution_text[:300]
+
+    prompt = f"""Summarize this incident resolution in 1-2 sentences.
+
+Problem: "{digest.get('incident', '')[:100] or 'Unknown issue'}"
+
+Investigation: "{investigation[:300] or 'No investigation notes'}"
+
+Resolution: "{resolution_text[:150]}"
+
+Provide a concise summary of how the issue was resolved (what was done and the outcome).
+
+Summary:"""
+
+    data = {
+        "prompt": prompt,
+        "model": "crm-di-qwen_text_14b-fp8-it",
+        "system_prompt": "You summarize incident resolutions clearly. Describe what was done to fix the problem and the outcome in 1-2 sentences.",
         "temperature": 0.3,
         "max_tokens": 150,
     }
-    
-    try:
-        resp = requests.post(url, json=data, headers=headers, timeout=30)
-        print(f"LLM Summary Status: {resp.status_code}")
-        
-        if resp.status_code != 200:
-            print(f"LLM Summary Error Response: {resp.text[:200]}")
-            # Fallback to resolution text
-            return resolution_text
-        
-        result = resp.json()
-        print(f"LLM Summary Full Response: {json.dumps(result, indent=2)}")
-        
-        # ✅ SAME RESPONSE PARSING AS CLASSIFICATION
-        output_text = None
-        
-        # Path 1: data.output_text
-        if "data" in result and "output_text" in result["data"]:
-            output_text = result["data"]["output_text"]
-        
-        # Path 2: direct output_text
-        elif "output_text" in result:
-            output_text = result["output_text"]
-        
-        # Path 3: response
-        elif "response" in result:
-            output_text = result["response"]
-        
-        print(f"Extracted summary output_text: {output_text}")
-        
-        if not output_text:
-            print("No output_text found in summary response")
-            return resolution_text
-        
-        # Clean the output
-        summary = output_text.strip()
-        
-        # Remove any leading/trailing quotes or markdown
+
+    output = quickml.chat(data)
+    if output and len(output.strip()) > 10:
+        summary = output.strip()
         if summary.startswith('"') and summary.endswith('"'):
             summary = summary[1:-1]
-        
-        if len(summary) > 10:
-            print(f"✅ Parsed summary: {summary[:100]}...")
-            return summary
-        else:
-            print(f"⚠️ Summary too short, using fallback")
-            return resolution_text
-        
-    except json.JSONDecodeError as e:
-        print(f"JSON parse error in summary: {e}")
-        return resolution_text
-    except Exception as e:
-        print(f"LLM summary exception: {e}")
-        import traceback
-        traceback.print_exc()
-        return resolution_text
+        return summary
+
+    return resolution_text[:150]
 
 
 
 
 # ========== ATTACHMENT HANDLING FUNCTIONS ==========
 
-def upload_to_stratus(local_path: str, object_key: str) -> str:
-    """Upload file to Stratus and return URL"""
+# ---------- Attachment Streaming ----------
+# Downloads are tee'd chunk by chunk: every chunk goes to a chunked Stratus
+# PUT running on a helper thread (through a small bounded queue, so a slow
+# upload throttles the download instead of piling chunks up in memory), and
+# only the first ATTACHMENT_BUFFER_MAX_BYTES are kept for vision / OCR.
+# Nothing touches the local disk. Attachments are hashed while streaming so
+# reposts of the same bytes reuse earlier uploads and analysis.
+
+STREAM_CHUNK_BYTES = 1024 * 1024
+STREAM_QUEUE_CHUNKS = int(os.getenv("STREAM_QUEUE_CHUNKS", "4"))
+ATTACHMENT_BUFFER_MAX_BYTES = int(os.getenv("ATTACHMENT_BUFFER_MAX_BYTES", str(20 * 1024 * 1024)))
+# Files up to this size are hashed before uploading (repost dedup); larger
+# ones start streaming to Stratus immediately
+STREAM_DEDUP_MAX_BYTES = int(os.getenv("STREAM_DEDUP_MAX_BYTES", str(STREAM_CHUNK_BYTES)))
+
+CONTENT_STORE_SIZE = int(os.getenv("CONTENT_STORE_SIZE", "512"))
+
+ATTACHMENT_IO_WORKERS = int(os.getenv("ATTACHMENT_IO_WORKERS", "16"))
+
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "bmp", "webp", "gif")
+DOCUMENT_EXTENSIONS = ("pdf", "doc", "docx", "txt")
+
+# Upload and analysis branches of an attachment run here side by side
+attachment_io = ThreadPoolExecutor(max_workers=ATTACHMENT_IO_WORKERS, thread_name_prefix="attachment-io")
+
+
+class StreamedAttachment(namedtuple("StreamedAttachment", ["upload", "content", "size", "truncated", "sha256", "reused"])):
+    @property
+    def url(self):
+        """Stratus URL (None if the upload failed); waits for an upload still in flight"""
+        return self.upload.result()
+
+
+def _done_future(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class ContentStore:
+    """
+    Results already computed for an attachment, keyed by the sha256 of its
+    bytes (Stratus URL, vision analysis, OCR text, embeddings). LRU-bounded.
+    """
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self.entries = OrderedDict()  # {sha256: {"url", "size", "vision", "ocr", "embeddings"}}
+        self.stats = {"hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+
+    def get(self, digest: str, count: bool = False) -> dict:
+        """Stored results for a hash; count=True records a hit/miss (once per attachment)"""
+        with self.lock:
+            entry = self.entries.get(digest)
+            if count:
+                self.stats["misses" if entry is None else "hits"] += 1
+            if entry is None:
+                return {}
+            self.entries.move_to_end(digest)
+            return dict(entry)
+
+    def update(self, digest: str, **fields):
+        with self.lock:
+            entry = self.entries.setdefault(digest, {})
+            entry.update(fields)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_items:
+                self.entries.popitem(last=False)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "max_items": self.max_items, **self.stats}
+
+
+content_store = ContentStore(CONTENT_STORE_SIZE)
+
+
+def upload_to_stratus(data, object_key: str, content_length: int = None) -> str:
+    """
+    Upload bytes or an iterator of chunks to Stratus and return URL.
+    Iterators are sent chunked unless content_length is known.
+    """
     try:
-        with open(local_path, "rb") as f:
-            file_content = f.read()
-        
         url = f"{BUCKET_URL}/{object_key}"
         headers = {
             "Authorization": f"Zoho-oauthtoken {get_catalyst_token()}",
@@ -1639,7 +3180,13 @@ def upload_to_stratus(local_path: str, object_key: str) -> str:
             "cache-control": "max-age=3600"
         }
         
-        resp = requests.put(url, data=file_content, headers=headers, timeout=120)
+        req = requests.Request("PUT", url, data=data, headers=headers).prepare()
+        if content_length is not None and not isinstance(data, (bytes, bytearray)):
+            # Known size: plain body, so a short stream can never look complete
+            req.headers.pop("Transfer-Encoding", None)
+            req.headers["Content-Length"] = str(content_length)
+        with requests.Session() as session:
+            resp = session.send(req, timeout=120)
         print(f"Stratus upload: {resp.status_code}")
         
         if resp.status_code in [200, 201, 204]:
@@ -1654,18 +3201,398 @@ def upload_to_stratus(local_path: str, object_key: str) -> str:
         return None
 
 
-def process_image_with_vision(local_path: str) -> str:
+def iter_file_chunks(stream, chunk_size: int = STREAM_CHUNK_BYTES):
+    """Chunk iterator over a file-like object (e.g. a Flask upload stream)"""
+    return iter(lambda: stream.read(chunk_size), b"")
+
+
+def stream_attachment_to_stratus(chunks, object_key: str, buffer_limit: int = ATTACHMENT_BUFFER_MAX_BYTES,
+                                 content_length: int = None) -> StreamedAttachment:
+    """
+    Tee an iterator of chunks into a streaming Stratus upload and a bounded
+    in-memory buffer, hashing as it goes. Files no larger than
+    STREAM_DEDUP_MAX_BYTES are hashed before uploading, so a repost reuses
+    the stored Stratus URL without uploading again; larger files start
+    uploading as soon as the first chunks arrive. Returns the upload (a
+    Future of the Stratus URL, None on failure), the buffered head of the
+    file, the total size, whether the buffer was truncated, the sha256 and
+    whether the URL was reused. If the source fails mid-stream the upload is
+    aborted (never committed truncated) and the error is raised.
+    """
+    chunks = iter(chunks)
+    hasher = hashlib.sha256()
+    buffer = bytearray()
+    size = 0
+    head = []  # chunks read before deciding whether to stream
+
+    def take(chunk):
+        nonlocal size
+        size += len(chunk)
+        hasher.update(chunk)
+        if len(buffer) < buffer_limit:
+            buffer.extend(chunk[:buffer_limit - len(buffer)])
+
+    exhausted = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        take(chunk)
+        head.append(chunk)
+        if size > STREAM_DEDUP_MAX_BYTES:
+            exhausted = False
+            break
+
+    if exhausted:
+        # Whole (small) file is in memory: look it up before uploading anything
+        digest = hasher.hexdigest()
+        content = bytes(buffer)
+        known_url = content_store.get(digest, count=True).get("url")
+        if known_url:
+            print(f"♻️ Known attachment {digest[:12]} ({size} bytes), reusing {known_url}")
+            return StreamedAttachment(_done_future(known_url), content, size, False, digest, True)
+
+        def upload():
+            url = upload_to_stratus(content, object_key)
+            if url:
+                content_store.update(digest, url=url, size=size)
+            return url
+
+        print(f"⬆️ Uploading {size} bytes to Stratus in the background")
+        return StreamedAttachment(attachment_io.submit(upload), content, size, False, digest, False)
+
+    pending = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    result = {"url": None}
+
+    def body():
+        while True:
+            chunk = pending.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                # Raising inside the body drops the connection before the
+                # request completes, so Stratus never commits the object
+                raise chunk
+            yield chunk
+
+    def upload():
+        result["url"] = upload_to_stratus(body(), object_key, content_length)
+
+    uploader = threading.Thread(target=upload, name="stratus-upload", daemon=True)
+    uploader.start()
+
+    def hand_off(item):
+        # Backpressure: wait for the uploader, unless it already gave up
+        while uploader.is_alive():
+            try:
+                pending.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    end = None
+    try:
+        for chunk in head:
+            hand_off(chunk)
+        head = None
+        for chunk in chunks:
+            if not chunk:
+                continue
+            take(chunk)
+            hand_off(chunk)
+        if content_length is not None and size != content_length:
+            raise IOError(f"download ended at {size} of {content_length} bytes")
+    except Exception as e:
+        end = e
+        raise
+    finally:
+        hand_off(IOError(f"source stream failed: {end}") if end is not None else None)
+        uploader.join()
+
+    digest = hasher.hexdigest()
+    content_store.get(digest, count=True)
+    if result["url"]:
+        content_store.update(digest, url=result["url"], size=size)
+    truncated = size > len(buffer)
+    print(f"✓ Streamed {size} bytes to Stratus (buffered {len(buffer)}{', truncated' if truncated else ''})")
+    return StreamedAttachment(_done_future(result["url"]), bytes(buffer), size, truncated, digest, False)
+
+
+def response_content_length(resp):
+    """Content-Length of a streamed download, None if absent or compressed"""
+    if resp.headers.get("Content-Encoding", "identity") != "identity":
+        return None  # iter_content yields decoded bytes
+    try:
+        return int(resp.headers["Content-Length"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def start_attachment_analysis(streamed: StreamedAttachment, ext: str, filename: str) -> dict:
+    """
+    Start the analysis branch for an attachment next to its upload: vision
+    for images, OCR for documents. Returns {"vision" | "ocr": Future}.
+    """
+    if ext in IMAGE_EXTENSIONS:
+        return {"vision": attachment_io.submit(attachment_vision, streamed)}
+    if ext in DOCUMENT_EXTENSIONS:
+        return {"ocr": attachment_io.submit(attachment_ocr, streamed, filename)}
+    return {}
+
+
+def attachment_vision(streamed: StreamedAttachment) -> str:
+    """Vision analysis for an attachment, reused when the same bytes were analyzed before"""
+    known = content_store.get(streamed.sha256).get("vision")
+    if known:
+        print(f"♻️ Reusing vision analysis for attachment {streamed.sha256[:12]}")
+        return known
+    if streamed.truncated:
+        print(f"⚠️ Image too large for vision analysis ({streamed.size} bytes)")
+        return ""
+
+    signature = compute_image_signature(streamed.content)
+    if signature is not None:
+        entry, distance = image_index.lookup(signature)
+        if entry:
+            print(f"♻️ Near-duplicate screenshot (distance {distance}), reusing vision analysis")
+            image_index.bind(streamed.sha256, entry)
+            content_store.update(streamed.sha256, vision=entry["analysis"])
+            return entry["analysis"]
+
+    analysis = process_image_with_vision(streamed.content)
+    if analysis:
+        content_store.update(streamed.sha256, vision=analysis)
+        if signature is not None:
+            image_index.add(signature, streamed.sha256, analysis)
+    return analysis
+
+
+def attachment_ocr(streamed: StreamedAttachment, filename: str) -> str:
+    """OCR text for an attachment, reused when the same bytes were OCR'd before"""
+    known = content_store.get(streamed.sha256).get("ocr")
+    if known:
+        print(f"♻️ Reusing OCR text for attachment {streamed.sha256[:12]}")
+        return known
+    if streamed.truncated:
+        print(f"⚠️ Document too large for OCR ({streamed.size} bytes)")
+        return ""
+    text = ocr_document(streamed.content, filename)
+    if text:
+        content_store.update(streamed.sha256, ocr=text)
+    return text
+
+
+def attachment_embedding(streamed: StreamedAttachment, text: str):
+    """Embedding of text derived from an attachment, reused for reposts of the same bytes"""
+    embeddings = content_store.get(streamed.sha256).get("embeddings", {})
+    if text in embeddings:
+        print(f"♻️ Reusing embedding for attachment {streamed.sha256[:12]}")
+        return embeddings[text]
+    emb = embed_text_or_none(text)
+    if emb is not None:
+        content_store.update(streamed.sha256, embeddings={**embeddings, text: emb})
+    return emb
+
+
+# ---------- Image Normalization ----------
+# Screenshots arrive as multi-megabyte PNGs; the vision model gains nothing
+# from 4K pixels but the base64 request body and upload time grow with them.
+# Before vision analysis, images are downscaled to VISION_MAX_EDGE,
+# re-encoded as JPEG (which also drops EXIF) and images too small to show an
+# incident are skipped. Decoding and encoding are CPU-bound, so they run in
+# a process pool instead of blocking the attachment threads.
+
+VISION_MAX_EDGE = int(os.getenv("VISION_MAX_EDGE", "1568"))
+VISION_MIN_EDGE = int(os.getenv("VISION_MIN_EDGE", "48"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "2"))
+CPU_TASK_TIMEOUT_S = 30
+
+_cpu_pool = None
+_cpu_pool_lock = threading.Lock()
+
+
+def normalize_image_bytes(data: bytes, max_edge: int = VISION_MAX_EDGE,
+                          min_edge: int = VISION_MIN_EDGE, quality: int = VISION_JPEG_QUALITY):
+    """
+    Downscale, re-encode and strip metadata from one image (runs in a worker
+    process). Returns the JPEG bytes, or None when the image is too small.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img.seek(0)  # first frame of animated GIF / WebP
+        img = ImageOps.exif_transpose(img)  # keep orientation once EXIF is gone
+        if min(img.size) < min_edge:
+            return None
+
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+        return out.getvalue()
+
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """Process pool for CPU-bound attachment work (images, hashing, text extraction)"""
+    global _cpu_pool
+    with _cpu_pool_lock:
+        if _cpu_pool is None:
+            # Spawn, not fork: this process already runs many threads and a
+            # forked child can inherit a lock some other thread was holding
+            _cpu_pool = ProcessPoolExecutor(max_workers=CPU_POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _cpu_pool
+
+
+def normalize_image_for_vision(data: bytes):
+    """
+    Normalized bytes to send to the vision model, None if the image is too
+    small to analyze. Falls back to the original bytes if normalization fails.
+    """
+    try:
+        normalized = get_cpu_pool().submit(normalize_image_bytes, data).result(timeout=CPU_TASK_TIMEOUT_S)
+    except Exception as e:
+        print(f"⚠️ Image normalization failed, sending original: {e}")
+        return data
+
+    if normalized is None:
+        print(f"🖼️ Image below {VISION_MIN_EDGE}px, skipping vision")
+        return None
+    print(f"🖼️ Normalized image {len(data) / 1024:.0f}KB → {len(normalized) / 1024:.0f}KB")
+    return normalized
+
+
+def _dhash_bits(gray, hash_size: int) -> int:
+    small = gray.resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+
+def image_signature(data: bytes):
+    """
+    (64-bit dHash, 256-bit dHash, (width, height)) of an image (runs in a
+    worker process). The coarse hash finds candidates, the fine hash and the
+    size confirm them.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        size = img.size
+        img.draft("L", (128, 128))  # cheap JPEG decode at reduced size
+        img.seek(0)
+        gray = img.convert("L")
+        return _dhash_bits(gray, 8), _dhash_bits(gray, 16), size
+
+
+def compute_image_signature(data: bytes):
+    try:
+        return get_cpu_pool().submit(image_signature, data).result(timeout=CPU_TASK_TIMEOUT_S)
+    except Exception as e:
+        print(f"⚠️ Perceptual hash failed: {e}")
+        return None
+
+
+# ---------- Near-duplicate Screenshots ----------
+# Screenshots of the same dashboard or error page taken minutes apart are
+# never byte-identical, so the content hash misses them. Recent images are
+# indexed by a 64-bit dHash. Different error dialogs on a text-heavy screen
+# hash close together, so a candidate within PHASH_MAX_DISTANCE bits must
+# also have exactly the same pixel size and a 256-bit dHash within
+# PHASH_CONFIRM_MAX_DISTANCE bits. A confirmed match reuses the earlier
+# vision analysis and classification, and links to the same issue.
+
+PHASH_INDEX_SIZE = int(os.getenv("PHASH_INDEX_SIZE", "500"))
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "2"))
+PHASH_CONFIRM_MAX_DISTANCE = int(os.getenv("PHASH_CONFIRM_MAX_DISTANCE", "4"))
+PHASH_TTL_S = int(os.getenv("PHASH_TTL_S", str(6 * 3600)))
+
+
+class PerceptualImageIndex:
+    def __init__(self, max_items: int, max_distance: int):
+        self.max_distance = max_distance
+        self.entries = deque(maxlen=max_items)  # {"dhash", "fine", "size", "analysis", "classification", "issue_id", "at"}
+        self.by_sha = OrderedDict()  # {sha256: entry} for every attachment that used an entry
+        self.max_items = max_items
+        self.stats = {"lookups": 0, "hits": 0, "rejected": 0}
+        self.lock = threading.Lock()
+
+    def lookup(self, signature: tuple):
+        """Closest recent confirmed entry, as (entry, distance of the fine hash)"""
+        dhash, fine, size = signature
+        cutoff = time.time() - PHASH_TTL_S
+        best, best_distance = None, None
+        with self.lock:
+            self.stats["lookups"] += 1
+            for entry in self.entries:
+                if entry["at"] < cutoff or bin(entry["dhash"] ^ dhash).count("1") > self.max_distance:
+                    continue
+                distance = bin(entry["fine"] ^ fine).count("1")
+                if distance > PHASH_CONFIRM_MAX_DISTANCE or tuple(entry["size"]) != tuple(size):
+                    self.stats["rejected"] += 1
+                    continue
+                if best is None or distance < best_distance:
+                    best, best_distance = entry, distance
+            if best is not None:
+                self.stats["hits"] += 1
+        return best, best_distance
+
+    def add(self, signature: tuple, sha256: str, analysis: str) -> dict:
+        dhash, fine, size = signature
+        entry = {"dhash": dhash, "fine": fine, "size": size, "analysis": analysis,
+                 "classification": None, "issue_id": None, "at": time.time()}
+        with self.lock:
+            self.entries.append(entry)
+            self._bind(sha256, entry)
+        return entry
+
+    def bind(self, sha256: str, entry: dict):
+        with self.lock:
+            self._bind(sha256, entry)
+
+    def _bind(self, sha256: str, entry: dict):
+        self.by_sha[sha256] = entry
+        self.by_sha.move_to_end(sha256)
+        while len(self.by_sha) > self.max_items:
+            self.by_sha.popitem(last=False)
+
+    def get(self, sha256: str) -> dict:
+        """Classification / issue recorded for this attachment's image family"""
+        with self.lock:
+            entry = self.by_sha.get(sha256)
+            return dict(entry) if entry else {}
+
+    def update(self, sha256: str, **fields):
+        with self.lock:
+            entry = self.by_sha.get(sha256)
+            if entry is not None:
+                entry.update(fields, at=time.time())
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "max_distance": self.max_distance,
+                    "confirm_max_distance": PHASH_CONFIRM_MAX_DISTANCE, **self.stats}
+
+
+image_index = PerceptualImageIndex(PHASH_INDEX_SIZE, PHASH_MAX_DISTANCE)
+
+
+def process_image_with_vision(image_bytes: bytes, normalize: bool = True) -> str:
     """Analyze image using Qwen Vision model"""
     try:
-        with open(local_path, "rb") as f:
-            b64img = base64.b64encode(f.read()).decode()
-        
-        url = f"https://api.catalyst.zoho.com/quickml/v1/project/{CATALYST_PROJECT_ID}/vlm/chat"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {get_catalyst_token()}",
-            "CATALYST-ORG": CATALYST_ORG_ID
-        }
+        if normalize:
+            image_bytes = normalize_image_for_vision(image_bytes)
+            if image_bytes is None:
+                return "No incident detected (image too small to analyze)"
+        b64img = base64.b64encode(image_bytes).decode()
         
         data = {
             "prompt": "Analyze this image for IT incidents, errors, logs, or system issues. If you find any production problems, database issues, network errors, or service outages, describe them clearly. If it's just a casual image, say 'No incident detected'.",
@@ -1678,16 +3605,13 @@ def process_image_with_vision(local_path: str) -> str:
             "max_tokens": 500
         }
         
-        resp = requests.post(url, json=data, headers=headers, timeout=90)
-        print(f"Vision model: {resp.status_code}")
+        output = quickml.vlm(data)
         
-        if resp.status_code == 200:
-            result = resp.json()
-            output = result.get("data", {}).get("output_text", "") or result.get("response", "")
+        if output:
             print(f"Vision analysis: {output[:100]}...")
             return output.strip()
         else:
-            print(f"Vision error: {resp.text[:200]}")
+            print("Vision error: no analysis returned")
             return ""
             
     except Exception as e:
@@ -1697,8 +3621,14 @@ def process_image_with_vision(local_path: str) -> str:
         return ""
 
 
-def ocr_document(local_path: str, filename: str) -> str:
-    """Run OCR on document/PDF and return extracted text"""
+def _ocr_request(content: bytes, filename: str) -> str:
+    """One Catalyst OCR request for a document/image; returns extracted text"""
+    breaker = breakers["catalyst_ocr"]
+    if not breaker.allow():
+        print(f"🔌 OCR skipped for {filename}, breaker {breaker.name} is open")
+        return ""
+    start = time.monotonic()
+    recorded = False
     try:
         url = f"https://api.catalyst.zoho.com/baas/v1/project/{CATALYST_PROJECT_ID}/ml/ocr"
         headers = {
@@ -1723,18 +3653,21 @@ def ocr_document(local_path: str, filename: str) -> str:
         else:
             content_type = "application/octet-stream"
         
-        print(f"📄 OCR for {filename} (type: {content_type}, size: {os.path.getsize(local_path)} bytes)")
+        print(f"📄 OCR for {filename} (type: {content_type}, size: {len(content)} bytes)")
         
         # ✅ FIELD NAME MUST BE "image" (not "file") per docs
-        with open(local_path, "rb") as f:
-            files = {
-                "image": (filename, f, content_type)
-            }
-            data = {
-                "language": "eng"
-            }
-            
-            resp = requests.post(url, headers=headers, files=files, data=data, timeout=120)
+        files = {
+            "image": (filename, content, content_type)
+        }
+        data = {
+            "language": "eng"
+        }
+        
+        start = time.monotonic()
+        resp = requests.post(url, headers=headers, files=files, data=data, timeout=120)
+        # 4xx is about this file, only server errors count against the service
+        breaker.record(resp.status_code < 500, (time.monotonic() - start) * 1000)
+        recorded = True
         
         print(f"OCR response: {resp.status_code}")
         
@@ -1779,7 +3712,191 @@ def ocr_document(local_path: str, filename: str) -> str:
         import traceback
         traceback.print_exc()
         return ""
+    finally:
+        # Token or request errors count as failures (and release a half-open probe)
+        if not recorded:
+            breaker.record(False, (time.monotonic() - start) * 1000)
+
+
+
+# ---------- Page-parallel PDF OCR ----------
+# Multi-page PDFs are split locally and only the first OCR_MAX_PAGES pages
+# are sent, one request per page, OCR_PAGE_CONCURRENCY at a time. Pages come
+# back in order and stop once OCR_CHAR_BUDGET characters are collected (the
+# summarizers only read the first few hundred), so long runbooks neither time
+# out nor pay for pages nobody reads. Page results are cached by page hash.
+
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "5"))
+OCR_PAGE_CONCURRENCY = int(os.getenv("OCR_PAGE_CONCURRENCY", "3"))
+OCR_CHAR_BUDGET = int(os.getenv("OCR_CHAR_BUDGET", "2000"))
+OCR_PAGE_CACHE_SIZE = int(os.getenv("OCR_PAGE_CACHE_SIZE", "1000"))
+
+ocr_pool = ThreadPoolExecutor(max_workers=OCR_PAGE_CONCURRENCY, thread_name_prefix="ocr-page")
+_ocr_page_cache = OrderedDict()  # {page sha256: text}, LRU
+_ocr_page_cache_lock = threading.Lock()
+
+
+def split_pdf_pages(content: bytes, max_pages: int, indexes: list = None) -> list:
+    """First max_pages pages of a PDF (or just `indexes`) as standalone single-page PDFs"""
+    reader = PdfReader(io.BytesIO(content))
+    if indexes is None:
+        indexes = range(min(max_pages, len(reader.pages)))
+    pages = []
+    for i in indexes:
+        writer = PdfWriter()
+        writer.add_page(reader.pages[i])
+        out = io.BytesIO()
+        writer.write(out)
+        pages.append(out.getvalue())
+    print(f"📄 Split PDF into {len(pages)} of {len(reader.pages)} page(s) for OCR")
+    return pages
+
+
+def _ocr_page(page_bytes: bytes, filename: str) -> str:
+    digest = hashlib.sha256(page_bytes).hexdigest()
+    with _ocr_page_cache_lock:
+        if digest in _ocr_page_cache:
+            _ocr_page_cache.move_to_end(digest)
+            print(f"♻️ Reusing OCR for {filename}")
+            return _ocr_page_cache[digest]
+
+    text = _ocr_request(page_bytes, filename)
+    if text:
+        with _ocr_page_cache_lock:
+            _ocr_page_cache[digest] = text
+            while len(_ocr_page_cache) > OCR_PAGE_CACHE_SIZE:
+                _ocr_page_cache.popitem(last=False)
+    return text
+
+
+def iter_pdf_ocr_pages(pages: list, filename: str, char_budget: int = OCR_CHAR_BUDGET, indexes: list = None):
+    """
+    OCR pages concurrently and yield their text in page order as soon as
+    each is ready. Pages still pending once char_budget is reached are cancelled.
+    """
+    indexes = indexes or range(len(pages))
+    futures = [ocr_pool.submit(_ocr_page, page, f"{filename}#p{i + 1}") for i, page in zip(indexes, pages)]
+    collected = 0
+    try:
+        for future in futures:
+            text = future.result()
+            collected += len(text)
+            yield text
+            if collected >= char_budget:
+                print(f"✂️ OCR budget of {char_budget} chars reached, skipping remaining pages")
+                return
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+# ---------- Local Text Extraction ----------
+# Plain-text logs, .docx files and PDFs with a text layer don't need remote
+# OCR at all: their text is read locally on the CPU pool, and only PDF pages
+# without a usable text layer (scans, screenshots) are sent to OCR.
+
+LOCAL_TEXT_EXTENSIONS = ("txt", "docx", "pdf")
+LOCAL_TEXT_MIN_PAGE_CHARS = int(os.getenv("LOCAL_TEXT_MIN_PAGE_CHARS", "40"))
+
+DOCX_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _decode_text(content: bytes) -> str:
+    # UTF-16 only with a BOM: without one, almost any even-length byte
+    # string "decodes" as UTF-16 and cp1252 logs come out as CJK noise
+    if content.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        try:
+            return content.decode("utf-16")
+        except UnicodeDecodeError:
+            pass
+    try:
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return content.decode("cp1252", errors="replace")
+
+
+def _docx_text(content: bytes) -> str:
+    with zipfile.ZipFile(io.BytesIO(content)) as docx:
+        root = ElementTree.fromstring(docx.read("word/document.xml"))
+    paragraphs = []
+    for para in root.iter(f"{DOCX_NS}p"):
+        text = "".join(node.text or "" for node in para.iter(f"{DOCX_NS}t"))
+        if text:
+            paragraphs.append(text)
+    return "\n".join(paragraphs)
+
+
+def extract_text_locally(content: bytes, ext: str, max_pages: int, char_budget: int):
+    """
+    Read document text without OCR (runs in a worker process). Returns
+    (page_texts, scanned_pages): one text per page (a single entry for txt /
+    docx) and the indexes of PDF pages whose text layer is missing or too thin.
+    Like the OCR path, stops once char_budget characters are collected.
+    """
+    if ext in ("txt", "docx"):
+        text = _decode_text(content) if ext == "txt" else _docx_text(content)
+        return [" ".join(text.split())[:char_budget]], []
+
+    reader = PdfReader(io.BytesIO(content))
+    page_texts, scanned = [], []
+    collected = 0
+    for i, page in enumerate(reader.pages[:max_pages]):
+        text = page.extract_text() or ""
+        if len(text.strip()) < LOCAL_TEXT_MIN_PAGE_CHARS:
+            scanned.append(i)
+        page_texts.append(text)
+        collected += len(text)
+        if collected >= char_budget:
+            break
+    return page_texts, scanned
+
+
+def extract_document_text(content: bytes, filename: str):
+    """
+    Local text for txt / docx / text-layer PDFs, OCR only for scanned PDF
+    pages. Returns None when the file can't be read locally (caller OCRs it).
+    """
+    ext = filename.split(".")[-1].lower() if "." in filename else ""
+    if ext not in LOCAL_TEXT_EXTENSIONS:
+        return None
+    try:
+        page_texts, scanned = get_cpu_pool().submit(
+            extract_text_locally, content, ext, OCR_MAX_PAGES, OCR_CHAR_BUDGET
+        ).result(timeout=CPU_TASK_TIMEOUT_S)
+    except Exception as e:
+        print(f"⚠️ Local text extraction failed for {filename}: {e}")
+        return None
+
+    if len(scanned) == len(page_texts) and ext == "pdf":
+        return None  # image-only PDF, OCR the whole thing
+
+    local_chars = sum(len(page_texts[i]) for i in range(len(page_texts)) if i not in scanned)
+    print(f"📝 Extracted {local_chars} chars locally from {filename} ({len(scanned)} scanned page(s))")
+
+    if scanned and local_chars < OCR_CHAR_BUDGET:
+        pages = split_pdf_pages(content, OCR_MAX_PAGES, indexes=scanned)
+        ocr_texts = iter_pdf_ocr_pages(pages, filename, OCR_CHAR_BUDGET - local_chars, indexes=scanned)
+        for i, text in zip(scanned, ocr_texts):
+            page_texts[i] = text
 
+    return " ".join(" ".join(page_texts).split())[:OCR_CHAR_BUDGET]
+
+
+def ocr_document(content: bytes, filename: str) -> str:
+    """Extract text from a document/PDF: locally where possible, OCR otherwise (PDFs page by page)"""
+    text = extract_document_text(content, filename)
+    if text is not None:
+        return text
+
+    if filename.lower().endswith(".pdf"):
+        try:
+            pages = split_pdf_pages(content, OCR_MAX_PAGES)
+        except Exception as e:
+            print(f"⚠️ Could not split PDF, sending it whole: {e}")
+            pages = []
+        if len(pages) > 1:
+            return " ".join(t for t in iter_pdf_ocr_pages(pages, filename) if t)
+    return _ocr_request(content, filename)
 
 
 # def ocr_document(local_path: str, filename: str) -> str:
@@ -1885,8 +4002,20 @@ def ocr_document(local_path: str, filename: str) -> str:
 #         return ""
 
 
-def process_attachment(attachment: dict, conversation_id: str, sender_id: str, timestamp_ms: int):
-    """Process single attachment: download, upload to Stratus, analyze"""
+INCIDENT_IMAGE_KEYWORDS = ["error", "failed", "down", "outage", "critical", "production",
+                           "database", "timeout", "crash", "exception"]
+ATTACHMENT_FANOUT_WORKERS = int(os.getenv("ATTACHMENT_FANOUT_WORKERS", "4"))
+
+# Attachments of one message are prepared here in parallel (separate from
+# attachment_io, whose branches these tasks wait on)
+message_attachment_pool = ThreadPoolExecutor(max_workers=ATTACHMENT_FANOUT_WORKERS, thread_name_prefix="message-attachment")
+
+
+def prepare_attachment(attachment: dict):
+    """
+    Download, upload to Stratus and analyze one attachment. Returns a dict
+    describing it (nothing stored yet), or None if it could not be processed.
+    """
     try:
         att_url = attachment.get("url")
         filename = attachment.get("name", f"attachment_{uuid.uuid4()}")
@@ -1894,108 +4023,145 @@ def process_attachment(attachment: dict, conversation_id: str, sender_id: str, t
         
         if not att_url:
             print("⚠️ No attachment URL")
-            return
+            return None
+        
+        # Uploaded and analyzed by an earlier attempt
+        prepared = message_ledger.get(f"att_{file_id}").get("prepared")
+        if prepared:
+            print(f"♻️ Reusing earlier analysis of attachment {filename}")
+            return prepared
         
         print(f"📎 Processing attachment: {filename}")
         
         # Determine file extension
         ext = filename.split(".")[-1].lower() if "." in filename else "bin"
         
-        # Download to temp file
-        temp_path = tempfile.mktemp(suffix=f".{ext}")
+        # Stream download straight into Stratus (handles large files)
+        print(f"⬇️ Downloading: {att_url[:50]}...")
+        resp = requests.get(att_url, stream=True, timeout=120)
         
         try:
-            # Stream download (handles large files)
-            print(f"⬇️ Downloading: {att_url[:50]}...")
-            resp = requests.get(att_url, stream=True, timeout=120)
-            
-            with open(temp_path, "wb") as f:
-                for chunk in resp.iter_content(chunk_size=1024*1024):  # 1MB chunks
-                    if chunk:
-                        f.write(chunk)
-            
-            file_size = os.path.getsize(temp_path)
-            print(f"✓ Downloaded {file_size} bytes")
-            
-            # Upload to Stratus
             stratus_key = f"attachments/{file_id}_{filename}"
-            stratus_url = upload_to_stratus(temp_path, stratus_key)
+            streamed = stream_attachment_to_stratus(
+                resp.iter_content(chunk_size=STREAM_CHUNK_BYTES), stratus_key, content_length=response_content_length(resp)
+            )
+            branches = start_attachment_analysis(streamed, ext, filename)
+            stratus_url = streamed.url
             
             if not stratus_url:
                 print("⚠️ Stratus upload failed, skipping analysis")
-                return
+                return None
+            
+            prepared = {"file_id": file_id, "filename": filename, "stratus_url": stratus_url, "is_incident": False}
+            # Fallback results are used now but not stored, so a retry tries vision / OCR again
+            degraded = False
             
             # Process based on file type
-            if ext in ("png", "jpg", "jpeg", "bmp", "webp", "gif"):
+            if ext in IMAGE_EXTENSIONS:
                 # Image: Vision model
                 print("🖼️ Processing image with Vision model...")
-                analysis = process_image_with_vision(temp_path)
+                analysis = branches["vision"].result()
                 
                 if not analysis:
                     analysis = "Image uploaded (analysis unavailable)"
+                    degraded = True
                 
                 # Check if incident detected
                 analysis_lower = analysis.lower()
-                is_incident = any(keyword in analysis_lower for keyword in 
-                    ["error", "failed", "down", "outage", "critical", "production", 
-                     "database", "timeout", "crash", "exception"])
+                is_incident = any(keyword in analysis_lower for keyword in INCIDENT_IMAGE_KEYWORDS)
                 
-                if is_incident and "no incident" not in analysis_lower:
-                    # Create incident from image
-                    print(f"🚨 Incident detected in image!")
-                    message_text = f"[Image Analysis] {analysis}"
-                    index_message(conversation_id, f"img_{file_id}", sender_id, timestamp_ms, message_text)
-                else:
-                    # Discussion
-                    message_text = f"User shared image: {stratus_url}\n\nVision analysis: {analysis}"
-                    insert_message_into_datastore(
-                        conversation_id, f"img_{file_id}", sender_id, timestamp_ms,
-                        message_text, "discussion", "other", "low", None
-                    )
-                    print(f"💬 Image stored as discussion")
+                prepared.update(kind="image", analysis=analysis,
+                                is_incident=is_incident and "no incident" not in analysis_lower)
             
-            elif ext in ("pdf", "doc", "docx", "txt"):
+            elif ext in DOCUMENT_EXTENSIONS:
                 # Document: OCR
                 print(f"📄 Processing document with OCR...")
-                ocr_text = ocr_document(temp_path, filename)
+                ocr_text = branches["ocr"].result()
                 
                 if not ocr_text:
                     ocr_text = "Document uploaded (OCR failed)"
+                    degraded = True
                 
                 # Summarize with LLM
                 summary_prompt = f"Summarize this document in 2-3 sentences: {ocr_text[:1000]}"
                 summary_resp = classify_message_llm(summary_prompt)
+                degraded = degraded or is_local_analysis(summary_resp)
                 
                 summary = f"Document '{filename}' uploaded. Category: {summary_resp.get('category', 'other')}. Content: {ocr_text[:200]}..."
-                
-                # Always discussion for documents
-                message_text = f"User shared document: {stratus_url}\n\n{summary}"
-                insert_message_into_datastore(
-                    conversation_id, f"doc_{file_id}", sender_id, timestamp_ms,
-                    message_text, "discussion", summary_resp.get("category", "other"), 
-                    summary_resp.get("severity", "low"), None
-                )
-                print(f"📑 Document stored as discussion")
+                prepared.update(kind="document", summary=summary,
+                                category=summary_resp.get("category", "other"),
+                                severity=summary_resp.get("severity", "low"))
             
             else:
-                # Other files
-                message_text = f"User shared file: {filename} ({stratus_url})"
-                insert_message_into_datastore(
-                    conversation_id, f"file_{file_id}", sender_id, timestamp_ms,
-                    message_text, "discussion", "other", "low", None
-                )
-                print(f"📦 File stored as discussion")
+                prepared.update(kind="file")
+            
+            if not degraded:
+                message_ledger.record(f"att_{file_id}", prepared=prepared)
+            return prepared
         
         finally:
-            # Cleanup temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                print(f"🗑️ Cleaned up temp file")
+            resp.close()
     
     except Exception as e:
         print(f"❌ Attachment processing error: {e}")
         import traceback
         traceback.print_exc()
+        return None
+
+
+def process_attachments(attachments: list, message_id: str, conversation_id: str, sender_id: str, timestamp_ms: int):
+    """
+    Process all attachments of one message: prepare them in parallel, index
+    incident screenshots as ONE classified message, and store the rest as
+    discussions linked to that incident's issue. Returns that issue_id.
+    """
+    futures = [message_attachment_pool.submit(prepare_attachment, att) for att in attachments]
+    prepared = [p for p in (f.result() for f in futures) if p]
+    
+    incidents = [p for p in prepared if p["is_incident"]]
+    issue_id = None
+    
+    if incidents:
+        print(f"🚨 Incident detected in {len(incidents)} image(s)!")
+        if len(incidents) == 1:
+            message_text = f"[Image Analysis] {incidents[0]['analysis']}"
+            incident_message_id = f"img_{incidents[0]['file_id']}"
+        else:
+            # Related screenshots of one message become one incident message
+            message_text = "[Image Analysis]\n\n" + "\n\n".join(
+                f"({i}/{len(incidents)}) {p['analysis']}" for i, p in enumerate(incidents, 1)
+            )
+            incident_message_id = f"img_{message_id or incidents[0]['file_id']}"
+        issue_id = index_message(conversation_id, incident_message_id, sender_id, timestamp_ms, message_text)
+    
+    for p in prepared:
+        if p["is_incident"]:
+            continue
+        if p["kind"] == "image":
+            message_text = f"User shared image: {p['stratus_url']}\n\nVision analysis: {p['analysis']}"
+            insert_message_into_datastore(
+                conversation_id, f"img_{p['file_id']}", sender_id, timestamp_ms,
+                message_text, "discussion", "other", "low", issue_id
+            )
+            print(f"💬 Image stored as discussion")
+        elif p["kind"] == "document":
+            # Always discussion for documents
+            message_text = f"User shared document: {p['stratus_url']}\n\n{p['summary']}"
+            insert_message_into_datastore(
+                conversation_id, f"doc_{p['file_id']}", sender_id, timestamp_ms,
+                message_text, "discussion", p["category"], p["severity"], issue_id
+            )
+            print(f"📑 Document stored as discussion")
+        else:
+            message_text = f"User shared file: {p['filename']} ({p['stratus_url']})"
+            insert_message_into_datastore(
+                conversation_id, f"file_{p['file_id']}", sender_id, timestamp_ms,
+                message_text, "discussion", "other", "low", issue_id
+            )
+            print(f"📦 File stored as discussion")
+    
+    print(f"✅ Processed {len(prepared)}/{len(attachments)} attachment(s)")
+    return issue_id
 
 
 
@@ -2184,16 +4350,113 @@ def process_attachment(attachment: dict, conversation_id: str, sender_id: str, t
 #     return "Resolution completed (summary unavailable)."
 
 
+# ---------- Bulk Indexing ----------
+# Used by bulk history imports: index_message(writer=...) links messages as
+# usual but buffers their Data Store rows and Qdrant points, which are then
+# written in bulk. Linking never waits for a flush: the writer remembers each
+# conversation's latest issue, similarity search also scores the incidents
+# still in the buffer, and issue digests are updated as rows are added (a
+# resolution flushes only when it has to read its thread from the Data Store).
+# Issue rows are created synchronously by create_issue_in_datastore as usual.
+
+def cosine_similarity(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+    return dot / norm if norm else 0.0
+
+
+class BulkIndexWriter:
+    def __init__(self, max_buffer: int = 200):
+        self.max_buffer = max_buffer
+        self.buffer = []           # (row dict, vector)
+        self.last_issue = {}       # {conversation_id: issue_id of its latest linked message}
+        self.stats = {"rows": 0, "points": 0, "flushes": 0, "row_failures": 0}
+
+    def last_issue_id(self, conversation_id: str):
+        """Like get_issue_id_from_last_message, but aware of this import's messages"""
+        if conversation_id in self.last_issue:
+            return self.last_issue[conversation_id]
+        return get_issue_id_from_last_message(conversation_id)
+
+    def incident_hits(self, vector) -> list:
+        """Buffered incidents scored like Qdrant hits (they are not in Qdrant yet)"""
+        if vector is None:
+            return []
+        return [
+            KeywordHit({"issue_id": row["issue_id"], "role": "incident", "message_id": row["message_id"]},
+                       cosine_similarity(vector, buffered))
+            for row, buffered in self.buffer
+            if row["role"] == "incident" and row["issue_id"] and buffered is not None
+        ]
+
+    def add(self, row: dict, vector):
+        self.buffer.append((row, vector))
+        if row["issue_id"]:
+            self.last_issue[row["conversation_id"]] = row["issue_id"]
+            issue_digests.note_message(row["issue_id"], row["message_id"], row["role"], row["message_text"])
+        if len(self.buffer) >= self.max_buffer:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        row_ids = insert_messages_into_datastore([row for row, _ in batch], note_digests=False)
+
+        points = []
+        for (row, vector), row_id in zip(batch, row_ids):
+            if not row_id:
+                self.stats["row_failures"] += 1
+            payload = {
+                "conversation_id": row["conversation_id"],
+                "sender_id": row["sender_id"],
+                "role": row["role"],
+                "category": row["category"],
+                "severity": row["severity"],
+                "issue_id": row["issue_id"] or "",
+                "row_id": row_id,
+                "message_id": row["message_id"],
+            }
+            points.append((normalize_message_id(row["message_id"]), vector, payload, row["message_text"]))
+
+        indexed = upsert_message_points(points)
+        for (_, _, payload, _), ok in zip(points, indexed):
+            # Without its DS row the message is not done: a later run must insert it
+            if ok and payload["row_id"]:
+                message_ledger.record(payload["message_id"], qdrant=True, emb=None)
+
+        self.stats["rows"] += len(batch)
+        self.stats["points"] += sum(indexed)
+        self.stats["flushes"] += 1
+
+
 # ---------- Main Indexing Pipeline ----------
-def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_text):
+def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_text, cls=None, emb=None, snapshot=None, writer=None):
     """
-    1. Classify with LLM
-    2. Embed message
+    1. Classify with LLM (skipped if the caller already analyzed the message)
+    2. Embed message (skipped if the caller passes a batch embedding)
     3. Link to issue (or create new issue)
     4. Store in DS + Qdrant
+    snapshot: shared IssueSnapshot when indexing a batch of messages.
+    writer: BulkIndexWriter that buffers the DS row and Qdrant point (bulk imports).
+    Returns the linked issue_id (None if unlinked).
     """
-    # 1. LLM Classification
-    cls = classify_message_llm(message_text)
+    if snapshot is None:
+        snapshot = IssueSnapshot()
+    last_issue_id = writer.last_issue_id if writer else get_issue_id_from_last_message
+    
+    done = message_ledger.get(message_id)
+    if done.get("row_id") and done.get("qdrant"):
+        print(f"♻️ {message_id} already fully indexed, skipping")
+        return done.get("issue_id") or None
+    
+    # 1. LLM Classification (role, category, severity + specificity in one call)
+    if cls is None:
+        cls = done.get("cls")
+    if cls is None:
+        cls = analyze_message_llm(message_text)
+    if "cls" not in done and not is_local_analysis(cls):
+        message_ledger.record(message_id, cls=cls)
     role = cls.get("role", "discussion")
     category = cls.get("category", "other")
     severity = cls.get("severity", "low")
@@ -2201,15 +4464,37 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
     print(f"📋 Role: {role}, Category: {category}, Severity: {severity}")
     
     # 2. Embed
-    emb = embed_text(message_text)
-    ensure_qdrant_collection(len(emb))
+    if emb is None:
+        emb = done.get("emb")
+    if emb is None:
+        emb = embed_text_or_none(message_text)
+    if emb is not None and "emb" not in done:
+        message_ledger.record(message_id, emb=emb)
+    ensure_qdrant_collection_safe(emb)
     
     issue_id = None
     
 
-    if role == "incident":
+    if "issue_id" in done:
+        # Linking (and any issue creation / close) finished on an earlier attempt
+        issue_id = done["issue_id"] or None  # LEDGER_UNLINKED: linked to nothing
+        print(f"♻️ Resuming {message_id} after linking (issue={issue_id})")
+
+    elif role == "incident" and done.get("pending_issue_id"):
+        # An earlier attempt picked a new issue id and died around creating
+        # it: reuse the id, and create the row only if it never got written
+        issue_id = done["pending_issue_id"]
+        if not any(r.get("issue_id") == issue_id for r in snapshot.all_issues()):
+            title = message_text[:100] + ("..." if len(message_text) > 100 else "")
+            if create_issue_in_datastore(issue_id, title, "Cliq", category, severity, timestamp_ms) is False:
+                raise RuntimeError(f"issue {issue_id} could not be created, will retry")
+            snapshot.note_created(issue_id, title, "Cliq", category, severity, timestamp_ms)
+        message_ledger.record(message_id, issue_id=issue_id, issue_created=True)
+        print(f"♻️ Resuming {message_id} with its new issue {issue_id}")
+
+    elif role == "incident":
         # ✅ Check for duplicate title (including RECENTLY CLOSED ones)
-        all_issues = fetch_all_issues()  # Get ALL issues (open + resolved)
+        all_issues = snapshot.all_issues()  # Get ALL issues (open + resolved)
         normalized_title = message_text.strip().lower()
         
         # Check last 5 issues (including recently closed)
@@ -2239,14 +4524,18 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
         
         # If not found, try similarity (only for open issues)
         if not issue_id:
-            existing_open = fetch_open_issues()
+            existing_open = snapshot.open_issues()
             q_filter = Filter(must=[FieldCondition(key="role", match=MatchValue(value="incident"))])
-            hits = qdrant.search(
+            hits = qdrant_search(
                 collection_name=QDRANT_COLLECTION,
                 query_vector=emb,
                 query_filter=q_filter,
                 limit=5,
+                fallback_text=message_text,
             )
+            if writer:
+                # Incidents of this import still in the buffer are not in Qdrant yet
+                hits = list(hits) + writer.incident_hits(emb)
             open_ids = {r.get("issue_id") for r in existing_open if r.get("issue_id")}
             best_issue_id = None
             best_score = 0.0
@@ -2267,7 +4556,13 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
         if not issue_id:
             issue_id = str(uuid.uuid4())
             title = message_text[:100] + ("..." if len(message_text) > 100 else "")
-            create_issue_in_datastore(issue_id, title, "Cliq", category, severity, timestamp_ms)
+            # Recorded before the insert, so a retry reuses this id instead of creating a second issue
+            message_ledger.record(message_id, pending_issue_id=issue_id)
+            # False: the row may be missing; the retry checks and creates it (None: no Data Store configured)
+            if create_issue_in_datastore(issue_id, title, "Cliq", category, severity, timestamp_ms) is False:
+                raise RuntimeError(f"issue {issue_id} could not be created, will retry")
+            message_ledger.record(message_id, issue_id=issue_id, issue_created=True)
+            snapshot.note_created(issue_id, title, "Cliq", category, severity, timestamp_ms)
             print(f"🆕 Created new issue: {issue_id}")
 
     
@@ -2315,19 +4610,23 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
             print(f"💬 Discussion detected, finding best matching issue via similarity...")
             
             # Get all open issues
-            open_issues = fetch_open_issues()
+            open_issues = snapshot.open_issues()
             
             if open_issues:
                 print(f"🔍 Searching across {len(open_issues)} open issue(s)...")
                 
                 # Search for similar incidents/discussions in Qdrant
                 q_filter = Filter(must=[FieldCondition(key="role", match=MatchValue(value="incident"))])
-                hits = qdrant.search(
+                hits = qdrant_search(
                     collection_name=QDRANT_COLLECTION,
                     query_vector=emb,
                     query_filter=q_filter,
                     limit=10,
+                    fallback_text=message_text,
                 )
+                if writer:
+                    # Incidents of this import still in the buffer are not in Qdrant yet
+                    hits = list(hits) + writer.incident_hits(emb)
                 
                 # Filter to only open issues
                 open_issue_ids = {issue.get("issue_id") for issue in open_issues}
@@ -2355,7 +4654,7 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
                 else:
                     # ✅ FALLBACK: Get from previous message
                     print(f"⚠️ Low similarity (best: {best_score:.3f}), checking previous message...")
-                    issue_id = get_issue_id_from_last_message(conversation_id)
+                    issue_id = last_issue_id(conversation_id)
                     
                     if issue_id:
                         print(f"🔗 Linked to issue from previous message: {issue_id[:12]}")
@@ -2365,7 +4664,7 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
             else:
                 # No open issues - check previous messages
                 print(f"⚠️ No open issues, checking previous messages...")
-                issue_id = get_issue_id_from_last_message(conversation_id)
+                issue_id = last_issue_id(conversation_id)
                 
                 if issue_id:
                     print(f"🔗 Linked to issue from previous message: {issue_id[:12]}")
@@ -2498,14 +4797,14 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
     # ✅ RESOLUTION: Use LLM to check if it's vague or specific
             print(f"✅ Resolution detected: '{message_text[:60]}...'")
             
-            specificity = check_resolution_specificity(message_text)
-            is_vague = specificity.get("specificity") == "vague"
+            # Specificity comes from the same analysis call as the classification
+            is_vague = cls.get("specificity", "specific") == "vague"
             
             if is_vague:
                 print(f"🎯 Vague resolution (LLM determined) - using previous message's issue")
                 
                 # Get issue from previous message
-                issue_id = get_issue_id_from_last_message(conversation_id)
+                issue_id = last_issue_id(conversation_id)
                 
                 if issue_id:
                     print(f"🔗 Resolving issue from previous message: {issue_id[:12]}")
@@ -2515,19 +4814,23 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
                 # Specific resolution - use similarity search
                 print(f"🎯 Specific resolution (LLM determined) - using similarity search")
                 
-                open_issues = fetch_open_issues()
+                open_issues = snapshot.open_issues()
                 issue_id = None
                 
                 if open_issues:
                     print(f"🔍 Searching across {len(open_issues)} open issue(s)...")
                     
                     q_filter = Filter(must=[FieldCondition(key="role", match=MatchValue(value="incident"))])
-                    hits = qdrant.search(
+                    hits = qdrant_search(
                         collection_name=QDRANT_COLLECTION,
                         query_vector=emb,
                         query_filter=q_filter,
                         limit=10,
+                        fallback_text=message_text,
                     )
+                    if writer:
+                        # Incidents of this import still in the buffer are not in Qdrant yet
+                        hits = list(hits) + writer.incident_hits(emb)
                     
                     open_issue_ids = {issue.get("issue_id") for issue in open_issues}
                     
@@ -2551,7 +4854,7 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
                     else:
                         # Fallback: previous message
                         print(f"⚠️ No similarity match (best: {best_score:.3f}), checking previous messages...")
-                        issue_id = get_issue_id_from_last_message(conversation_id)
+                        issue_id = last_issue_id(conversation_id)
                         
                         if issue_id:
                             print(f"🔗 Linked to issue from previous message: {issue_id[:12]}")
@@ -2560,7 +4863,7 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
                 else:
                     # No open issues - check previous messages
                     print(f"⚠️ No open issues, checking previous messages...")
-                    issue_id = get_issue_id_from_last_message(conversation_id)
+                    issue_id = last_issue_id(conversation_id)
                     
                     if issue_id:
                         print(f"🔗 Linked to issue from previous message: {issue_id[:12]}")
@@ -2571,23 +4874,60 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
             if issue_id:
                 print(f"🔧 Processing resolution for issue {issue_id[:12]}...")
                 
-                # Fetch existing messages
-                messages = fetch_messages_by_issue_id(issue_id)
-                print(f"📥 Found {len(messages)} existing messages for summary")
-                
-                # Generate summary INCLUDING current resolution message
-                summary = summarize_resolution_with_llm(messages, current_resolution_text=message_text)
+                digest = issue_digests.get(issue_id)
+                if digest and digest.get("incident"):
+                    # Rolling digest is already up to date, no thread fetch needed
+                    print(f"🧾 Using rolling digest ({len(digest['message_ids'])} linked messages)")
+                    messages = [{"message_id": mid} for mid in digest["message_ids"]]
+                    summary = summarize_resolution_from_digest(
+                        digest, message_text, cls.get("specificity", "specific")
+                    )
+                else:
+                    if writer:
+                        # The thread is read from the Data Store, so write buffered rows first
+                        writer.flush()
+                    # Fetch existing messages
+                    messages = fetch_messages_by_issue_id(issue_id)
+                    print(f"📥 Found {len(messages)} existing messages for summary")
+                    
+                    # Generate summary INCLUDING current resolution message
+                    summary = summarize_resolution_with_llm(messages, current_resolution_text=message_text)
                 print(f"✅ Generated summary: {summary[:100]}...")
                 
+                # Remember which message set it covers so searches can reuse it
+                resolution_summaries.put(
+                    issue_id, summary,
+                    message_set_fingerprint(messages + [{"message_id": message_id}])
+                )
+                
                 # Store summary and close issue
                 ok = store_resolution_summary(issue_id, summary, timestamp_ms)
                 if ok:
+                    issue_digests.discard(issue_id)
+                    snapshot.note_closed(issue_id, timestamp_ms)
                     print(f"✅ Closed issue {issue_id[:12]} with summary")
                 else:
                     print(f"❌ Failed to close issue {issue_id[:12]}")
 
 
     
+    if "issue_id" not in done:
+        message_ledger.record(message_id, issue_id=issue_id or LEDGER_UNLINKED)
+    
+    if writer:
+        writer.add({
+            "conversation_id": conversation_id,
+            "message_id": message_id,
+            "sender_id": sender_id,
+            "timestamp_ms": timestamp_ms,
+            "message_text": message_text,
+            "role": role,
+            "category": category,
+            "severity": severity,
+            "issue_id": issue_id,
+        }, emb)
+        return issue_id
+    
     # ✅ 4. Store in Data Store (ALWAYS, for ALL roles)
     row_id = insert_message_into_datastore(
         conversation_id, message_id, sender_id, timestamp_ms,
@@ -2596,22 +4936,20 @@ def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_
     
     # ✅ 5. Store in Qdrant (ALWAYS, for ALL roles)
     qdrant_id = normalize_message_id(message_id)
-    point = PointStruct(
-        id=qdrant_id,
-        vector=emb,
-        payload={
-            "conversation_id": conversation_id,
-            "sender_id": sender_id,
-            "role": role,
-            "category": category,
-            "severity": severity,
-            "issue_id": issue_id or "",
-            "row_id": row_id,
-            "message_id": message_id,
-        },
-    )
-    qdrant.upsert(QDRANT_COLLECTION, [point])
-    print(f"✅ Indexed in Qdrant: {message_id} (role={role})")
+    indexed = upsert_message_point(qdrant_id, emb, {
+        "conversation_id": conversation_id,
+        "sender_id": sender_id,
+        "role": role,
+        "category": category,
+        "severity": severity,
+        "issue_id": issue_id or "",
+        "row_id": row_id,
+        "message_id": message_id,
+    }, message_text)
+    if indexed:
+        message_ledger.record(message_id, qdrant=True, emb=None)
+        print(f"✅ Indexed in Qdrant: {message_id} (role={role})")
+    return issue_id
 
 
 # def index_message(conversation_id, message_id, sender_id, timestamp_ms, message_text):
@@ -2823,7 +5161,7 @@ def handle_search_command(query: str, chat: dict, user: dict):
         must=[FieldCondition(key="role", match=MatchValue(value="incident"))]
     )
     
-    hits = qdrant.search(
+    hits = qdrant_search(
         collection_name=QDRANT_COLLECTION,
         query_vector=q_emb,
         query_filter=q_filter,
@@ -2841,6 +5179,9 @@ def handle_search_command(query: str, chat: dict, user: dict):
     
     lines = [f"*Past incidents similar to:* `{query}`\n"]
     
+    # Issue records carry the summary saved at close time
+    issues_by_id = issue_cache.get_many(issue_ids[:3])
+    
     for idx, issue_id in enumerate(issue_ids[:3], 1):
         # Fetch all messages for this issue
         messages = fetch_messages_by_issue_id(issue_id)
@@ -2859,7 +5200,7 @@ def handle_search_command(query: str, chat: dict, user: dict):
         # Check if resolved
         resolution_msgs = [m for m in messages if m.get("role") == "resolution"]
         if resolution_msgs:
-            resolution_summary = summarize_resolution_with_llm(messages)
+            resolution_summary = get_resolution_summary(issue_id, messages=messages, issue=issues_by_id.get(issue_id))
             resolved_at_ts = max([m.get("time_stamp", 0) for m in resolution_msgs])
             resolved_at = datetime.fromtimestamp(resolved_at_ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
             status = "Resolved"
@@ -3163,6 +5504,241 @@ def oauth_callback():
     return "OAuth Successful!"
 
 
+# ========= Signals Publisher =========
+# /bot/events only hands the event to this publisher and answers Deluge.
+# A background thread posts to Signals over a pooled session, several events
+# per POST when SIGNALS_PUBLISH_BATCH_MAX > 1, retrying with backoff. Events
+# that still fail (or arrive while Signals is down) are appended to a spill
+# file and re-published once Signals answers again. While the spill file has
+# events, new ones are appended behind them instead of being posted, so
+# Signals always receives a conversation's events in order.
+# Crash-loss window: an event is acknowledged to Deluge once it is queued in
+# memory. A crash loses at most the queued events (SIGNALS_PUBLISH_QUEUE_MAX;
+# a full queue spills to disk instead) plus the batch being posted; a normal
+# shutdown writes the queue to the spill file.
+
+SIGNALS_PUBLISH_QUEUE_MAX = int(os.getenv("SIGNALS_PUBLISH_QUEUE_MAX", "1000"))
+SIGNALS_PUBLISH_BATCH_MAX = int(os.getenv("SIGNALS_PUBLISH_BATCH_MAX", "1"))
+SIGNALS_PUBLISH_WINDOW_MS = int(os.getenv("SIGNALS_PUBLISH_WINDOW_MS", "50"))
+SIGNALS_PUBLISH_TIMEOUT_S = float(os.getenv("SIGNALS_PUBLISH_TIMEOUT_S", "5"))
+SIGNALS_PUBLISH_RETRIES = int(os.getenv("SIGNALS_PUBLISH_RETRIES", "4"))
+SIGNALS_PUBLISH_BACKOFF_S = float(os.getenv("SIGNALS_PUBLISH_BACKOFF_S", "0.5"))
+SIGNALS_SPILL_PATH = os.getenv("SIGNALS_SPILL_PATH", "signals_spill.jsonl")
+SIGNALS_SPILL_RETRY_S = float(os.getenv("SIGNALS_SPILL_RETRY_S", "30"))
+
+breakers["signals_publish"] = CircuitBreaker("signals_publish", float(os.getenv("BREAKER_SIGNALS_SLOW_MS", "3000")))
+
+
+class SignalsPublisher:
+    def __init__(self, url: str, max_pending: int):
+        self.url = url
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.session = requests.Session()
+        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.spill_lock = threading.Lock()
+        self.spilling = False      # spill file has events: new ones go behind them (spill_lock)
+        self.lock = threading.Lock()
+        self.started = False
+        self.stats = {"published": 0, "posts": 0, "retries": 0, "spilled": 0, "replayed": 0, "dropped": 0}
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        self._recover_replay()
+        with self.spill_lock:
+            self.spilling = os.path.exists(SIGNALS_SPILL_PATH)
+        atexit.register(self._spill_pending)
+        threading.Thread(target=self._publish_loop, name="signals-publisher", daemon=True).start()
+        threading.Thread(target=self._spill_loop, name="signals-spill", daemon=True).start()
+
+    def publish(self, event_payload: dict):
+        """Queue one event for Signals (never blocks on the network)"""
+        self._ensure_started()
+        with self.spill_lock:
+            if self.spilling:
+                # Older events are waiting on disk: keep the order
+                self._append_spill([event_payload])
+                return
+            try:
+                self.pending.put_nowait(event_payload)
+                return
+            except queue.Full:
+                print("⚠️ Signals publish queue full, spilling events to disk")
+                self._append_spill(self._drain_pending() + [event_payload])
+
+    def _drain_pending(self) -> list:
+        events = []
+        while True:
+            try:
+                events.append(self.pending.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _spill_pending(self):
+        """On shutdown: write events still queued in memory to the spill file"""
+        with self.spill_lock:
+            events = self._drain_pending()
+            if events:
+                self._append_spill(events)
+
+    def _publish_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + SIGNALS_PUBLISH_WINDOW_MS / 1000.0
+            while len(batch) < SIGNALS_PUBLISH_BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            with self.spill_lock:
+                if self.spilling:
+                    self._append_spill(batch)
+                    continue
+            try:
+                if not self._send(batch):
+                    self._spill(batch)
+            except Exception as e:
+                print(f"❌ Signals publisher error: {e}")
+                self._spill(batch)
+
+    def _post(self, batch: list) -> bool:
+        """One POST; True on success, False on a retryable failure, None if Signals rejected it"""
+        body = batch[0] if len(batch) == 1 else {"events": batch}
+        resp = breakers["signals_publish"].call(
+            self.session.post, self.url, json=body, timeout=SIGNALS_PUBLISH_TIMEOUT_S
+        )
+        with self.lock:
+            self.stats["posts"] += 1
+        print("Signals response:", resp.status_code)
+        if resp.status_code < 300:
+            return True
+        if resp.status_code == 429 or resp.status_code >= 500:
+            return False
+        print(f"❌ Signals rejected {len(batch)} event(s): {resp.status_code} {resp.text[:200]}")
+        return None
+
+    def _send(self, batch: list) -> bool:
+        """Post with retries; False means the batch should be spilled"""
+        for attempt in range(SIGNALS_PUBLISH_RETRIES + 1):
+            if attempt:
+                with self.lock:
+                    self.stats["retries"] += 1
+                time.sleep(min(30.0, SIGNALS_PUBLISH_BACKOFF_S * 2 ** (attempt - 1)))
+            try:
+                ok = self._post(batch)
+            except BreakerOpenError:
+                return False
+            except Exception as e:
+                print("Error publishing to Signals:", e)
+                continue
+            if ok is None:
+                with self.lock:
+                    self.stats["dropped"] += len(batch)
+                return True
+            if ok:
+                with self.lock:
+                    self.stats["published"] += len(batch)
+                return True
+        return False
+
+    def _spill(self, batch: list):
+        """A batch that could not be sent; the events queued behind it follow it to disk"""
+        with self.spill_lock:
+            self._append_spill(batch + self._drain_pending())
+
+    def _append_spill(self, events: list):
+        """Append to the spill file and switch to spilling (spill_lock held)"""
+        with open(SIGNALS_SPILL_PATH, "a", encoding="utf-8") as f:
+            for event_payload in events:
+                f.write(json.dumps(event_payload) + "\n")
+        self.spilling = True
+        with self.lock:
+            self.stats["spilled"] += len(events)
+        print(f"💾 Spilled {len(events)} Signals event(s) to {SIGNALS_SPILL_PATH}")
+
+    def _spill_loop(self):
+        while True:
+            time.sleep(SIGNALS_SPILL_RETRY_S)
+            try:
+                self.replay_spill()
+            except Exception as e:
+                print(f"❌ Signals spill replay error: {e}")
+
+    def _recover_replay(self):
+        """Put the events of an unfinished replay back in front of the spill file"""
+        replaying = SIGNALS_SPILL_PATH + ".replaying"
+        with self.spill_lock:
+            if not os.path.exists(replaying):
+                return
+            tmp = SIGNALS_SPILL_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as out:
+                for path in (replaying, SIGNALS_SPILL_PATH):
+                    if os.path.exists(path):
+                        with open(path, encoding="utf-8") as f:
+                            out.writelines(line for line in f if line.strip())
+            os.replace(tmp, SIGNALS_SPILL_PATH)
+            os.remove(replaying)
+        print("♻️ Put unsent Signals events back in the spill file")
+
+    def replay_spill(self):
+        """
+        Re-publish spilled events in order while Signals accepts them. The
+        file is moved aside (not deleted) while it is replayed and removed
+        only once every event was sent or re-spilled, so a crash mid-replay
+        loses nothing (events sent before the crash may go out twice).
+        Events spilled meanwhile are replayed next; once the spill file is
+        empty, new events are posted directly again.
+        """
+        if breakers["signals_publish"].is_open():
+            return
+        replaying = SIGNALS_SPILL_PATH + ".replaying"
+        while True:
+            with self.spill_lock:
+                if not os.path.exists(SIGNALS_SPILL_PATH):
+                    self.spilling = False
+                    return
+                os.replace(SIGNALS_SPILL_PATH, replaying)
+            with open(replaying, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f if line.strip()]
+
+            if events:
+                print(f"♻️ Re-publishing {len(events)} spilled Signals event(s)")
+            step = max(1, SIGNALS_PUBLISH_BATCH_MAX)
+            for start in range(0, len(events), step):
+                batch = events[start:start + step]
+                if not self._send(batch):
+                    # Still down: the rest goes back in front of anything spilled meanwhile
+                    tmp = replaying + ".tmp"
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        for event_payload in events[start:]:
+                            f.write(json.dumps(event_payload) + "\n")
+                    os.replace(tmp, replaying)
+                    self._recover_replay()
+                    return
+                with self.lock:
+                    self.stats["replayed"] += len(batch)
+            os.remove(replaying)
+
+    def snapshot(self) -> dict:
+        spilled = 0
+        with self.spill_lock:
+            for path in (SIGNALS_SPILL_PATH, SIGNALS_SPILL_PATH + ".replaying"):
+                if os.path.exists(path):
+                    with open(path, encoding="utf-8") as f:
+                        spilled += sum(1 for line in f if line.strip())
+        with self.lock:
+            return {"pending": self.pending.qsize(), "spill_file_events": spilled, **self.stats}
+
+
+signals_publisher = SignalsPublisher(SIGNALS_EVENT_URL, SIGNALS_PUBLISH_QUEUE_MAX)
+
+
 # ========= Producer: Deluge → Signals =========
 
 @app.route('/bot/events', methods=['POST'])
@@ -3186,15 +5762,7 @@ def bot_events():
     event_payload = {"data": inner_data}
     
     if SIGNALS_EVENT_URL:
-        try:
-            resp = requests.post(
-                SIGNALS_EVENT_URL,
-                headers={"Content-Type": "application/json"},
-                json=event_payload
-            )
-            print("Signals response:", resp.status_code)
-        except Exception as e:
-            print("Error publishing to Signals:", e)
+        signals_publisher.publish(event_payload)
     
     return jsonify({"status": "ok"})
 
@@ -3202,16 +5770,168 @@ def bot_events():
 # ========= Consumer: Signals → Indexing =========
 
 
-@app.route('/signals/consume', methods=['POST'])
-def signals_consume():
-    payload = request.get_json()
-    print("==== Signals delivered queued event ====")
-    
-    events = payload.get("events", [])
-    if not events:
-        return jsonify({"status": "no_events"}), 200
-    
-    event_obj = events[0]
+# ========= Capture & Ingest Decisions =========
+# With SIGNALS_CAPTURE_PATH set, every delivery to /signals/consume is
+# appended (redacted) to a JSONL file, followed by the linking decision made
+# for each message once it is indexed. replay_signals.py sends a capture back
+# to an instance at a chosen rate and compares its decisions (read from
+# /admin/ingest_decisions) with the captured ones. Records are written by a
+# background thread; at SIGNALS_CAPTURE_MAX_BYTES the file rotates to
+# <path>.1, so a capture never takes more than twice that on disk.
+
+SIGNALS_CAPTURE_PATH = os.getenv("SIGNALS_CAPTURE_PATH", "")
+SIGNALS_CAPTURE_MAX_BYTES = int(os.getenv("SIGNALS_CAPTURE_MAX_BYTES", str(256 * 1024 * 1024)))
+SIGNALS_CAPTURE_QUEUE_MAX = int(os.getenv("SIGNALS_CAPTURE_QUEUE_MAX", "10000"))
+# Key for user pseudonyms; without it a random per-process key is used, so
+# pseudonyms stay stable only within one run
+SIGNALS_CAPTURE_SALT = os.getenv("SIGNALS_CAPTURE_SALT", "")
+CAPTURE_PSEUDONYM_KEY = (SIGNALS_CAPTURE_SALT or secrets.token_hex(32)).encode()
+INGEST_DECISIONS_MAX = int(os.getenv("INGEST_DECISIONS_MAX", "20000"))
+
+CAPTURE_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+CAPTURE_PHONE_RE = re.compile(r"\+?\d[\d -]{8,}\d")
+CAPTURE_SECRET_RE = re.compile(r"(?i)\b(bearer|token|password|passwd|secret|api[_-]?key)\b([\s:=]+)\S+")
+CAPTURE_USER_KEYS = ("id", "zoho_user_id")
+
+ingest_decisions = deque(maxlen=INGEST_DECISIONS_MAX)
+
+
+def _pseudonym(value) -> str:
+    # Keyed, so user ids cannot be recovered by hashing every possible id
+    return "anon_" + hmac.new(CAPTURE_PSEUDONYM_KEY, str(value).encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def redact_text(text: str) -> str:
+    text = CAPTURE_EMAIL_RE.sub("<email>", text)
+    text = CAPTURE_PHONE_RE.sub("<phone>", text)
+    return CAPTURE_SECRET_RE.sub(lambda m: f"{m.group(1)}{m.group(2)}<redacted>", text)
+
+
+def redact_signals_event(event_obj: dict) -> dict:
+    """
+    Copy of a Signals event that is safe to keep: user identities become
+    stable pseudonyms (so per-sender behaviour replays the same), names,
+    emails and chat titles are dropped, message text is scrubbed of emails,
+    phone numbers and secrets, and attachment URLs are removed.
+    """
+    event_obj = json.loads(json.dumps(event_obj))
+    inner_data = event_obj.get("data", {}).get("data", {})
+    try:
+        user = json.loads(inner_data.get("user") or "{}")
+        inner_data["user"] = json.dumps({k: _pseudonym(user[k]) for k in CAPTURE_USER_KEYS if user.get(k)})
+        
+        chat = json.loads(inner_data.get("chat") or "{}")
+        inner_data["chat"] = json.dumps({"id": chat.get("id"), "type": chat.get("type")})
+        
+        raw = json.loads(inner_data.get("raw") or "{}")
+        message_obj = raw.get("message", {})
+        content = message_obj.get("content")
+        if isinstance(content, dict) and isinstance(content.get("text"), str):
+            content["text"] = redact_text(content["text"])
+        for att in message_obj.get("attachments", []) or []:
+            att.pop("url", None)
+            if att.get("name"):
+                ext = att["name"].rsplit(".", 1)[-1] if "." in att["name"] else "bin"
+                att["name"] = f"attachment.{ext}"
+        if isinstance(raw.get("user"), dict):
+            raw["user"] = {}
+        inner_data["raw"] = json.dumps(raw)
+    except Exception:
+        return {"data": {"data": {}}}
+    return event_obj
+
+
+class CaptureWriter:
+    def __init__(self, path: str, max_bytes: int, max_pending: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.started = False
+        self.stats = {"written": 0, "dropped": 0, "rotations": 0}
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        threading.Thread(target=self._write_loop, name="signals-capture", daemon=True).start()
+
+    def write(self, record: dict):
+        """Queue one record (never blocks the caller; dropped when the queue is full)"""
+        self._ensure_started()
+        try:
+            self.pending.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.stats["dropped"] += 1
+
+    def _write_loop(self):
+        f = None
+        while True:
+            records = [self.pending.get()]
+            while True:
+                try:
+                    records.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if f is None:
+                    f = open(self.path, "a", encoding="utf-8")
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                with self.lock:
+                    self.stats["written"] += len(records)
+                if f.tell() >= self.max_bytes:
+                    f.close()
+                    f = None
+                    os.replace(self.path, self.path + ".1")
+                    with self.lock:
+                        self.stats["rotations"] += 1
+            except Exception as e:
+                print(f"⚠️ Signals capture failed: {e}")
+                if f is not None:
+                    f.close()
+                    f = None
+
+
+capture_writer = CaptureWriter(SIGNALS_CAPTURE_PATH, SIGNALS_CAPTURE_MAX_BYTES, SIGNALS_CAPTURE_QUEUE_MAX)
+
+
+def capture_signals_delivery(events: list):
+    if not SIGNALS_CAPTURE_PATH:
+        return
+    try:
+        capture_writer.write({
+            "type": "delivery",
+            "captured_at": time.time(),
+            "events": [redact_signals_event(ev) for ev in events],
+        })
+    except Exception as e:
+        print(f"⚠️ Signals capture failed: {e}")
+
+
+def note_ingest_decision(message_id, conversation_id, status, role=None, issue_id=None):
+    """Remember how a message was linked (for replay comparison) and capture it"""
+    decision = {
+        "message_id": message_id,
+        "conversation_id": conversation_id,
+        "status": status,
+        "role": role,
+        "issue_id": issue_id,
+        "indexed_at": time.time(),
+    }
+    ingest_decisions.append(decision)
+    if SIGNALS_CAPTURE_PATH:
+        capture_writer.write({"type": "decision", **decision})
+
+
+def parse_signals_event(event_obj: dict) -> dict:
+    """
+    Unpack one Signals event into the message fields used for indexing.
+    Returns {"status": ...} only when the event cannot be indexed.
+    """
     outer_data = event_obj.get("data", {})
     inner_data = outer_data.get("data", {})
     
@@ -3220,79 +5940,809 @@ def signals_consume():
     chat_str = inner_data.get("chat")
     
     if not (raw_str and user_str and chat_str):
-        return jsonify({"status": "ignored"}), 200
+        return {"status": "ignored"}
     
     try:
         raw = json.loads(raw_str)
         user = json.loads(user_str)
         chat = json.loads(chat_str)
     except Exception as e:
-        return jsonify({"status": "parse_error"}), 200
+        return {"status": "parse_error"}
     
     # Get message details
     message_obj = raw.get("message", {})
-    message_id = message_obj.get("id")
-    timestamp_ms = raw.get("time")
-    sender_id = user.get("zoho_user_id") or user.get("id")
-    conversation_id = chat.get("id")
-    
-    # ✅ CHECK FOR ATTACHMENTS
-    attachments = message_obj.get("attachments", [])
-    if attachments:
-        print(f"📎 Found {len(attachments)} attachment(s)")
-        for att in attachments:
-            process_attachment(att, conversation_id, sender_id, timestamp_ms)
-        return jsonify({"status": "processed_attachments"})
-    
-    # Regular text message processing
     try:
         message_text = message_obj.get("content", {}).get("text", "")
     except:
-        return jsonify({"status": "bad_raw"}), 200
-    
-    if not message_text:
-        return jsonify({"status": "no_text"}), 200
-    
-    # Skip bot commands
-    txt_lower = message_text.lower()
-    if "@workspace-vita" in txt_lower or "{@b-" in message_text:
-        print(f"Skipping bot command from indexing: {message_text[:50]}")
-        return jsonify({"status": "command_skipped"}), 200
-    
-    # Check if already indexed
-    qdrant_id = normalize_message_id(message_id)
+        message_text = None
+    
+    return {
+        "status": "parsed",
+        "message_id": message_obj.get("id"),
+        "timestamp_ms": raw.get("time"),
+        "sender_id": user.get("zoho_user_id") or user.get("id"),
+        "conversation_id": chat.get("id"),
+        "attachments": message_obj.get("attachments", []),
+        "message_text": message_text,
+    }
+
+
+def already_indexed_ids(message_ids: list) -> set:
+    """message_ids that already have a Qdrant point (one retrieve for the whole batch)"""
+    ids_by_point = {normalize_message_id(mid): mid for mid in message_ids if mid}
+    if not ids_by_point:
+        return set()
     try:
         existing = qdrant.retrieve(
             collection_name=QDRANT_COLLECTION,
-            ids=[qdrant_id]
+            ids=list(ids_by_point)
         )
-        if existing:
-            print(f"⚠️ Message {message_id} already indexed, skipping")
-            return jsonify({"status": "already_indexed"}), 200
+        return {ids_by_point.get(str(p.id)) for p in existing}
     except Exception:
-        pass
+        return set()
+
+
+def analyze_text_batch(texts: list) -> list:
+    """analyze_message_llm for a whole batch: cached first, the rest in one prompt"""
+    results = [_get_cached_analysis(text) for text in texts]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        if breakers["quickml_chat"].is_open():
+            fresh = [local_analyze_message(texts[i]) for i in missing]
+        else:
+            fresh = analyze_messages_batch([texts[i] for i in missing])
+        for i, analysis in zip(missing, fresh):
+            results[i] = analysis
+    return results
+
+
+def consume_signals_events(events: list, checkpoints: list = None, on_stage=None) -> list:
+    """
+    Index every event of one Signals delivery. Classification and embedding
+    run once for the whole batch; linking and writes then run in delivery
+    order against one shared issue snapshot. Returns one status per event.
+    checkpoints: per-event {"cls", "emb"} saved by an earlier attempt; those
+    stages are not run again. on_stage(i, stage, data) is called as each
+    stage completes so the caller can persist it.
+    Once a message fails, later messages of the same conversation are
+    "deferred" (not attempted) so a retry keeps the conversation in order.
+    """
+    checkpoints = checkpoints or [{} for _ in events]
+    results = [None] * len(events)
+    parsed = []
+    seen = set()
+    conversations = {}
+    
+    for i, event_obj in enumerate(events):
+        ev = parse_signals_event(event_obj)
+        if ev["status"] != "parsed":
+            results[i] = {"message_id": None, "status": ev["status"]}
+            continue
+        
+        message_id = ev["message_id"]
+        conversations[i] = ev["conversation_id"]
+        if message_id in seen:
+            results[i] = {"message_id": message_id, "status": "duplicate_in_batch"}
+            continue
+        seen.add(message_id)
+        parsed.append((i, ev))
+    
+    work = []
+    for i, ev in parsed:
+        # ✅ CHECK FOR ATTACHMENTS (processed in order with the text messages below)
+        if ev["attachments"]:
+            work.append((i, ev))
+            continue
+        
+        # Regular text message processing
+        message_text = ev["message_text"]
+        if message_text is None:
+            results[i] = {"message_id": ev["message_id"], "status": "bad_raw"}
+            continue
+        if not message_text:
+            results[i] = {"message_id": ev["message_id"], "status": "no_text"}
+            continue
+        
+        # Skip bot commands
+        txt_lower = message_text.lower()
+        if "@workspace-vita" in txt_lower or "{@b-" in message_text:
+            print(f"Skipping bot command from indexing: {message_text[:50]}")
+            results[i] = {"message_id": ev["message_id"], "status": "command_skipped"}
+            continue
+        
+        work.append((i, ev))
     
-    print(f"📨 '{message_text}'")
+    # Check if already indexed
+    indexed = already_indexed_ids([ev["message_id"] for _, ev in work if not ev["attachments"]])
+    pending = []
+    for i, ev in work:
+        if ev["message_id"] in indexed and not ev["attachments"]:
+            print(f"⚠️ Message {ev['message_id']} already indexed, skipping")
+            results[i] = {"message_id": ev["message_id"], "status": "already_indexed"}
+        else:
+            pending.append((i, ev))
+    
+    # Messages that stop here get a decision too (a replay waits for one per
+    # message); a duplicate_in_batch is covered by its first copy's decision
+    for i, result in enumerate(results):
+        if result and result["message_id"] and result["status"] != "duplicate_in_batch":
+            note_ingest_decision(result["message_id"], conversations.get(i), result["status"])
+    
+    texts = [(i, ev) for i, ev in pending if not ev["attachments"]]
+    analyses, vectors = {}, {}
+    if texts:
+        for i, ev in texts:
+            # Stages finished by an earlier delivery of the same message count too
+            for key, value in message_ledger.get(ev["message_id"]).items():
+                if key in ("cls", "emb"):
+                    checkpoints[i].setdefault(key, value)
+        for i, _ in texts:
+            if checkpoints[i].get("cls") is not None:
+                analyses[i] = checkpoints[i]["cls"]
+        todo = [(i, ev) for i, ev in texts if i not in analyses]
+        for (i, _), cls in zip(todo, analyze_text_batch([ev["message_text"] for _, ev in todo])):
+            analyses[i] = cls
+            if on_stage and not is_local_analysis(cls):
+                on_stage(i, "analyzed", {"cls": cls})
+        
+        for i, _ in texts:
+            if checkpoints[i].get("emb") is not None:
+                vectors[i] = checkpoints[i]["emb"]
+        todo = [(i, ev) for i, ev in texts if i not in vectors]
+        for (i, _), emb in zip(todo, embed_texts_or_none([ev["message_text"] for _, ev in todo])):
+            vectors[i] = emb
+            if on_stage and emb is not None:
+                on_stage(i, "embedded", {"emb": emb})
+    
+    snapshot = IssueSnapshot()
+    failed_conversations = set()
+    
+    for i, ev in pending:
+        if ev["conversation_id"] in failed_conversations:
+            results[i] = {"message_id": ev["message_id"], "status": "deferred"}
+            continue
+        try:
+            if ev["attachments"]:
+                print(f"📎 Found {len(ev['attachments'])} attachment(s)")
+                issue_id = process_attachments(ev["attachments"], ev["message_id"], ev["conversation_id"], ev["sender_id"], ev["timestamp_ms"])
+                results[i] = {"message_id": ev["message_id"], "status": "processed_attachments"}
+                note_ingest_decision(ev["message_id"], ev["conversation_id"], "processed_attachments", issue_id=issue_id)
+                continue
+            
+            print(f"📨 '{ev['message_text']}'")
+            issue_id = index_message(
+                ev["conversation_id"], ev["message_id"], ev["sender_id"], ev["timestamp_ms"],
+                ev["message_text"], cls=analyses[i], emb=vectors.get(i), snapshot=snapshot
+            )
+            results[i] = {"message_id": ev["message_id"], "status": "processed"}
+            note_ingest_decision(ev["message_id"], ev["conversation_id"], "processed", analyses[i].get("role"), issue_id)
+        except Exception as e:
+            print(f"❌ Indexing failed for {ev['message_id']}: {e}")
+            results[i] = {"message_id": ev["message_id"], "status": "error"}
+            note_ingest_decision(ev["message_id"], ev["conversation_id"], "error")
+            failed_conversations.add(ev["conversation_id"])
+    
+    return results
+
+
+# ========= Durable Ingest Queue =========
+# /signals/consume only appends the delivered events to a local SQLite (WAL)
+# queue and acknowledges. Worker threads claim jobs in batches and index them
+# at-least-once: each stage (analysis, embedding) is checkpointed on the job,
+# and jobs left running by a crash are replayed. A claim is a lease: a
+# running job whose updated_at is older than INGEST_LEASE_S is taken back by
+# any process sharing the queue file, so a live process keeps its own jobs
+# (its workers refresh the lease as stages complete).
+#
+# Jobs are sharded onto INGEST_LANES lanes by conversation_id, one worker per
+# lane. A lane runs its jobs strictly in arrival order (incident → discussion
+# → resolution stay in sequence) while different lanes run in parallel.
+
+INGEST_QUEUE_ENABLED = os.getenv("INGEST_QUEUE_ENABLED", "true").lower() == "true"
+INGEST_DB_PATH = os.getenv("INGEST_DB_PATH", "ingest_queue.db")
+INGEST_LANES = int(os.getenv("INGEST_LANES", "4"))
+INGEST_BATCH_MAX = int(os.getenv("INGEST_BATCH_MAX", "16"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+INGEST_POLL_S = float(os.getenv("INGEST_POLL_S", "0.5"))
+INGEST_DONE_TTL_S = int(os.getenv("INGEST_DONE_TTL_S", "86400"))
+INGEST_LEASE_S = float(os.getenv("INGEST_LEASE_S", "300"))
+# Failed jobs wait INGEST_RETRY_BASE_S * 2^attempts (capped) before the next
+# try, so an outage does not burn every attempt within milliseconds
+INGEST_RETRY_BASE_S = float(os.getenv("INGEST_RETRY_BASE_S", "2"))
+INGEST_RETRY_MAX_S = float(os.getenv("INGEST_RETRY_MAX_S", "300"))
+
+# Terminal statuses from consume_signals_events; anything else is retried
+INGEST_RETRY_STATUSES = ("error", "deferred")
+
+
+def ingest_lane(conversation_id, lanes: int = None) -> int:
+    """Stable lane for a conversation (same lane across restarts)"""
+    lanes = lanes or INGEST_LANES
+    if not conversation_id:
+        return 0
+    return int(hashlib.md5(str(conversation_id).encode()).hexdigest()[:8], 16) % lanes
+
+
+class IngestQueue:
+    def __init__(self, path: str, lanes: int):
+        self.path = path
+        self.lanes = max(1, lanes)
+        self.local = threading.local()
+        self.claim_lock = threading.Lock()
+        self.wakeups = [threading.Event() for _ in range(self.lanes)]
+        self.lock = threading.Lock()
+        self.started = False
+        self.stats = {"enqueued": 0, "done": 0, "retried": 0, "failed": 0, "replayed": 0}
+        self.lane_stats = [{"processed": 0, "batches": 0, "busy_s": 0.0} for _ in range(self.lanes)]
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.create_function("ingest_lane", 1, lambda cid: ingest_lane(cid, self.lanes))
+            self.local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT,
+                conversation_id TEXT,
+                lane INTEGER NOT NULL DEFAULT 0,
+                event TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                stage TEXT NOT NULL DEFAULT 'queued',
+                checkpoint TEXT NOT NULL DEFAULT '{}',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Queue files written before lanes existed
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+        if "conversation_id" not in columns:
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN conversation_id TEXT")
+        if "lane" not in columns:
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN lane INTEGER NOT NULL DEFAULT 0")
+        if "next_attempt_at" not in columns:
+            conn.execute("ALTER TABLE ingest_jobs ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+        conn.execute("DROP INDEX IF EXISTS ingest_jobs_state")
+        conn.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_lane ON ingest_jobs (state, lane, id)")
+        
+        # Jobs a previous process was working on when it died
+        self.stats["replayed"] += self._reclaim(conn)
+        # INGEST_LANES may have changed since the jobs were queued
+        conn.execute("UPDATE ingest_jobs SET lane = ingest_lane(conversation_id) WHERE state = 'pending'")
+
+    def _reclaim(self, conn) -> int:
+        """Running jobs whose lease expired (their process died) go back to pending"""
+        now = time.time()
+        replayed = conn.execute(
+            "UPDATE ingest_jobs SET state = 'pending', updated_at = ? WHERE state = 'running' AND updated_at < ?",
+            (now, now - INGEST_LEASE_S)
+        ).rowcount
+        if replayed:
+            print(f"♻️ Replaying {replayed} unfinished ingest job(s)")
+        return replayed
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self._init_db()
+            for lane in range(self.lanes):
+                threading.Thread(target=self._worker_loop, args=(lane,), name=f"ingest-lane-{lane}", daemon=True).start()
+        print(f"📥 Ingest queue started ({self.lanes} lane(s), {self.path})")
+
+    def enqueue(self, events: list) -> int:
+        """Persist a delivery's events; returns how many were queued"""
+        self.start()
+        now = time.time()
+        rows = []
+        for ev in events:
+            message_id, conversation_id = signals_event_keys(ev)
+            rows.append((message_id, conversation_id, ingest_lane(conversation_id, self.lanes), json.dumps(ev), now, now))
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO ingest_jobs (message_id, conversation_id, lane, event, enqueued_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        with self.lock:
+            self.stats["enqueued"] += len(rows)
+        for lane in {row[2] for row in rows}:
+            self.wakeups[lane].set()
+        return len(rows)
+
+    def _claim(self, lane: int) -> list:
+        # Jobs still backing off are skipped, and so is everything queued
+        # after them in the same conversation (it must not overtake them)
+        conn = self._conn()
+        now = time.time()
+        with self.claim_lock, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            replayed = self._reclaim(conn)
+            jobs = conn.execute("""
+                SELECT id, event, checkpoint, attempts FROM ingest_jobs AS j
+                WHERE state = 'pending' AND lane = ? AND next_attempt_at <= ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM ingest_jobs AS e
+                      WHERE e.state = 'pending' AND e.lane = j.lane AND e.id < j.id
+                        AND e.conversation_id IS j.conversation_id AND e.next_attempt_at > ?
+                  )
+                ORDER BY id LIMIT ?
+            """, (lane, now, now, INGEST_BATCH_MAX)).fetchall()
+            if jobs:
+                conn.executemany(
+                    "UPDATE ingest_jobs SET state = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    [(time.time(), job[0]) for job in jobs]
+                )
+        if replayed:
+            with self.lock:
+                self.stats["replayed"] += replayed
+        return jobs
+
+    def _checkpoint(self, job_id: int, checkpoint: dict, stage: str):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE ingest_jobs SET checkpoint = ?, stage = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(checkpoint), stage, time.time(), job_id)
+            )
+
+    def _renew(self, job_ids: list):
+        """Extend the lease of jobs this worker is still running"""
+        with self._conn() as conn:
+            conn.executemany(
+                "UPDATE ingest_jobs SET updated_at = ? WHERE id = ? AND state = 'running'",
+                [(time.time(), job_id) for job_id in job_ids]
+            )
+
+    def _finish(self, job_id: int, attempts: int, status: str, error: str = None):
+        if status == "deferred":
+            # Never attempted: an earlier message of its conversation failed
+            with self._conn() as conn:
+                conn.execute(
+                    "UPDATE ingest_jobs SET state = 'pending', attempts = ?, updated_at = ? WHERE id = ?",
+                    (attempts, time.time(), job_id)
+                )
+            return
+        if status not in INGEST_RETRY_STATUSES:
+            state, stat = "done", "done"
+        elif attempts + 1 >= INGEST_MAX_ATTEMPTS:
+            state, stat = "failed", "failed"
+            print(f"❌ Ingest job {job_id} failed after {attempts + 1} attempt(s)")
+        else:
+            state, stat = "pending", "retried"
+        delay = min(INGEST_RETRY_MAX_S, INGEST_RETRY_BASE_S * 2 ** attempts) if state == "pending" else 0
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE ingest_jobs SET state = ?, stage = ?, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (state, status, error, time.time() + delay, time.time(), job_id)
+            )
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _worker_loop(self, lane: int):
+        last_purge = 0.0
+        while True:
+            try:
+                jobs = self._claim(lane)
+                if not jobs:
+                    self.wakeups[lane].wait(INGEST_POLL_S)
+                    self.wakeups[lane].clear()
+                    if lane == 0 and time.time() - last_purge > 600:
+                        last_purge = time.time()
+                        self.purge()
+                    continue
+                start = time.time()
+                self._run(jobs)
+                with self.lock:
+                    self.lane_stats[lane]["processed"] += len(jobs)
+                    self.lane_stats[lane]["batches"] += 1
+                    self.lane_stats[lane]["busy_s"] += time.time() - start
+            except Exception as e:
+                print(f"❌ Ingest lane {lane} error: {e}")
+                time.sleep(INGEST_POLL_S)
+
+    def _run(self, jobs: list):
+        events = [json.loads(job[1]) for job in jobs]
+        checkpoints = [json.loads(job[2]) for job in jobs]
+
+        def on_stage(i, stage, data):
+            checkpoints[i].update(data)
+            self._checkpoint(jobs[i][0], checkpoints[i], stage)
+            self._renew([job[0] for job in jobs])
+
+        try:
+            results = consume_signals_events(events, checkpoints, on_stage)
+        except Exception as e:
+            print(f"❌ Ingest batch failed: {e}")
+            for job in jobs:
+                self._finish(job[0], job[3], "error", str(e))
+            return
+
+        for job, result in zip(jobs, results):
+            self._finish(job[0], job[3], result["status"])
+        print(f"✅ Ingested {len(jobs)} job(s): {[r['status'] for r in results]}")
+
+    def purge(self):
+        """Drop finished jobs older than INGEST_DONE_TTL_S"""
+        with self._conn() as conn:
+            conn.execute(
+                "DELETE FROM ingest_jobs WHERE state = 'done' AND updated_at < ?",
+                (time.time() - INGEST_DONE_TTL_S,)
+            )
+
+    def snapshot(self) -> dict:
+        self.start()
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM ingest_jobs GROUP BY state").fetchall())
+        oldest = conn.execute("SELECT MIN(enqueued_at) FROM ingest_jobs WHERE state = 'pending'").fetchone()[0]
+        depth = {
+            lane: (pending, oldest_at)
+            for lane, pending, oldest_at in conn.execute(
+                "SELECT lane, COUNT(*), MIN(enqueued_at) FROM ingest_jobs WHERE state IN ('pending', 'running') GROUP BY lane"
+            )
+        }
+        now = time.time()
+        with self.lock:
+            stats = dict(self.stats)
+            lanes = [
+                {
+                    "lane": lane,
+                    "depth": depth.get(lane, (0, None))[0],
+                    "oldest_age_s": round(now - depth[lane][1], 1) if lane in depth else 0,
+                    **{k: round(v, 2) if isinstance(v, float) else v for k, v in self.lane_stats[lane].items()},
+                }
+                for lane in range(self.lanes)
+            ]
+        return {
+            "states": counts,
+            "oldest_pending_age_s": round(now - oldest, 1) if oldest else 0,
+            "lanes": lanes,
+            **stats,
+        }
+
+
+ingest_queue = IngestQueue(INGEST_DB_PATH, INGEST_LANES)
+
+
+def signals_event_keys(event_obj: dict):
+    """Best-effort (message_id, conversation_id) of a raw Signals event, for queue bookkeeping"""
+    try:
+        inner_data = event_obj.get("data", {}).get("data", {})
+        raw = json.loads(inner_data.get("raw") or "{}")
+        chat = json.loads(inner_data.get("chat") or "{}")
+        return raw.get("message", {}).get("id"), chat.get("id")
+    except Exception:
+        return None, None
+
+
+@app.route('/signals/consume', methods=['POST'])
+def signals_consume():
+    payload = request.get_json()
+    print("==== Signals delivered queued event ====")
     
-    index_message(conversation_id, message_id, sender_id, timestamp_ms, message_text)
+    events = payload.get("events", [])
+    if not events:
+        return jsonify({"status": "no_events"}), 200
     
-    return jsonify({"status": "processed"})
+    print(f"📦 {len(events)} event(s) in delivery")
+    capture_signals_delivery(events)
+    if INGEST_QUEUE_ENABLED:
+        try:
+            queued = ingest_queue.enqueue(events)
+            return jsonify({"status": "queued", "queued": queued}), 200
+        except Exception as e:
+            print(f"⚠️ Ingest queue unavailable, indexing inline: {e}")
+    
+    results = consume_signals_events(events)
+    
+    # A single-event delivery keeps its event status at the top level
+    status = results[0]["status"] if len(results) == 1 else "processed_batch"
+    # Errors are isolated per event, but the delivery is only acknowledged
+    # when nothing failed or was deferred: a non-2xx makes Signals redeliver
+    # it, and the events that did succeed are skipped as already indexed
+    code = 500 if any(r["status"] in INGEST_RETRY_STATUSES for r in results) else 200
+    return jsonify({"status": status, "results": results}), code
+
+# ========= Attachment Jobs =========
+# The attachment endpoints only validate the request, enqueue a job and
+# answer 202 with a job id; download, upload, analysis and indexing run on a
+# bounded worker pool. Jobs are keyed by message_id so a redelivered request
+# returns the existing job instead of processing the file twice.
+#
+# Jobs live in a SQLite (WAL) table, so a job id handed out with a 202 still
+# resolves after a restart. Like ingest jobs, an unfinished job is leased to
+# the process running it (refreshed every ATTACHMENT_JOB_LEASE_S / 3); once
+# the lease expires any process sharing the file takes it back. Cliq jobs are
+# re-run from their stored form; upload jobs only had their bytes in a local
+# spool, so they are marked failed and the sender's redelivery queues them
+# again under the same job id.
+
+ATTACHMENT_WORKERS = int(os.getenv("ATTACHMENT_WORKERS", "4"))
+ATTACHMENT_QUEUE_MAX = int(os.getenv("ATTACHMENT_QUEUE_MAX", "200"))
+ATTACHMENT_JOB_RETRIES = int(os.getenv("ATTACHMENT_JOB_RETRIES", "2"))
+ATTACHMENT_JOB_TTL_S = int(os.getenv("ATTACHMENT_JOB_TTL_S", "3600"))
+ATTACHMENT_JOB_LEASE_S = float(os.getenv("ATTACHMENT_JOB_LEASE_S", "300"))
+ATTACHMENT_JOBS_DB_PATH = os.getenv("ATTACHMENT_JOBS_DB_PATH", "attachment_jobs.db")
+ATTACHMENT_SPOOL_MAX_MEMORY = int(os.getenv("ATTACHMENT_SPOOL_MAX_MEMORY", str(4 * 1024 * 1024)))
+
+ATTACHMENT_JOB_COLUMNS = ("job_id", "message_id", "kind", "status", "attempts", "http_status",
+                          "result", "error", "created_at", "updated_at")
+
+
+def _job_response(rv):
+    """Turn a handler's jsonify(...) / (jsonify(...), code) return into (body, code)"""
+    resp, code = rv if isinstance(rv, tuple) else (rv, rv.status_code)
+    return resp.get_json(silent=True) or {}, code
+
+
+class AttachmentJobQueue:
+    def __init__(self, path: str, workers: int, max_pending: int):
+        self.path = path
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attachment-job")
+        self.local = threading.local()
+        self.replayers = {}   # {kind: fn(payload)} for jobs that can be re-run from their stored payload
+        self.owned = set()    # job ids queued or running in this process
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.started = False
+        self.stats = {"replayed": 0, "lost": 0}
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            conn = self._conn()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS attachment_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    message_id TEXT,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    http_status INTEGER,
+                    result TEXT,
+                    error TEXT,
+                    payload TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS attachment_jobs_message ON attachment_jobs (message_id)")
+            self.started = True
+        threading.Thread(target=self._lease_loop, name="attachment-job-lease", daemon=True).start()
+        # Jobs a previous process accepted but never finished
+        self._recover()
+
+    def _job(self, row) -> dict:
+        job = dict(zip(ATTACHMENT_JOB_COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def submit(self, message_id: str, kind: str, fn, *args, cleanup=None, payload=None):
+        """
+        Queue fn(*args) as a job. Returns (job, created); job is None when the
+        queue is full. A message_id whose job is queued, running or done gets
+        that job back; a failed one is queued again under the same job id.
+        payload (JSON) is stored so a replayer registered for kind can re-run
+        the job after a restart.
+        """
+        self.start()
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire(conn)
+            row = conn.execute(
+                f"SELECT {', '.join(ATTACHMENT_JOB_COLUMNS)} FROM attachment_jobs WHERE message_id = ? ORDER BY created_at DESC LIMIT 1",
+                (message_id,)
+            ).fetchone() if message_id else None
+            if row and row[3] != "failed":
+                return self._job(row), False
+            with self.lock:
+                if self.pending >= self.max_pending:
+                    return None, False
+                self.pending += 1
+                job_id = row[0] if row else str(uuid.uuid4())
+                self.owned.add(job_id)
+            conn.execute(
+                "INSERT OR REPLACE INTO attachment_jobs (job_id, message_id, kind, status, attempts, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', 0, ?, ?, ?)",
+                (job_id, message_id, kind, json.dumps(payload) if payload is not None else None, now, now)
+            )
+            job = {column: None for column in ATTACHMENT_JOB_COLUMNS}
+            job.update(job_id=job_id, message_id=message_id, kind=kind, status="queued",
+                       attempts=0, created_at=now, updated_at=now)
+
+        self.executor.submit(self._run, job_id, fn, args, cleanup)
+        print(f"📥 Queued {kind} attachment job {job_id[:8]} ({self.pending} pending)")
+        return job, True
+
+    def _update(self, job_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"]) if fields["result"] is not None else None
+        fields["updated_at"] = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                f"UPDATE attachment_jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE job_id = ?",
+                (*fields.values(), job_id)
+            )
+
+    def _run(self, job_id: str, fn, args, cleanup, attempt: int = 1):
+        finished = True
+        try:
+            self._update(job_id, status="running", attempts=attempt)
+            try:
+                with app.app_context():
+                    body, code = _job_response(fn(*args))
+            except Exception as e:
+                body, code = {"error": str(e)}, 500
+
+            if code < 500:
+                # Done, or a client error that retrying cannot fix
+                self._update(job_id, status="done" if code < 400 else "failed",
+                             http_status=code, result=body, error=body.get("error"))
+                print(f"✅ Attachment job {job_id[:8]} finished ({code})")
+                return
+
+            if attempt <= ATTACHMENT_JOB_RETRIES:
+                # Back off off the pool: the worker slot is free for other jobs
+                # meanwhile. Stages that already completed are skipped on the
+                # retry by the message ledger.
+                delay = 2 ** attempt
+                print(f"🔁 Attachment job {job_id[:8]} failed ({body.get('error')}), retry {attempt}/{ATTACHMENT_JOB_RETRIES} in {delay}s")
+                self._update(job_id, status="retrying", http_status=code, error=body.get("error"))
+                timer = threading.Timer(delay, self.executor.submit, (self._run, job_id, fn, args, cleanup, attempt + 1))
+                timer.daemon = True
+                timer.start()
+                finished = False
+                return
+
+            self._update(job_id, status="failed", http_status=code, result=body, error=body.get("error"))
+            print(f"❌ Attachment job {job_id[:8]} failed after {ATTACHMENT_JOB_RETRIES + 1} attempts")
+        except Exception as e:
+            # The job table itself failed; the lease lapses and another pass replays it
+            print(f"⚠️ Attachment job {job_id[:8]} could not be recorded: {e}")
+        finally:
+            if finished:
+                with self.lock:
+                    self.pending -= 1
+                    self.owned.discard(job_id)
+                if cleanup:
+                    cleanup()
+
+    def _lease_loop(self):
+        while True:
+            time.sleep(ATTACHMENT_JOB_LEASE_S / 3)
+            try:
+                with self.lock:
+                    owned = list(self.owned)
+                with self._conn() as conn:
+                    conn.executemany(
+                        "UPDATE attachment_jobs SET updated_at = ? WHERE job_id = ? AND status IN ('queued', 'running', 'retrying')",
+                        [(time.time(), job_id) for job_id in owned]
+                    )
+                self._recover()
+            except Exception as e:
+                print(f"⚠️ Attachment job lease refresh failed: {e}")
+
+    def _recover(self):
+        """Take back unfinished jobs whose lease expired: replay them, or mark them lost"""
+        conn = self._conn()
+        now = time.time()
+        replay, lost = [], []
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT job_id, kind, payload FROM attachment_jobs WHERE status IN ('queued', 'running', 'retrying') AND updated_at < ?",
+                (now - ATTACHMENT_JOB_LEASE_S,)
+            ).fetchall()
+            for job_id, kind, payload in rows:
+                if payload is not None and kind in self.replayers:
+                    replay.append((job_id, kind, json.loads(payload)))
+                else:
+                    lost.append(job_id)
+            conn.executemany(
+                "UPDATE attachment_jobs SET status = 'queued', attempts = 0, updated_at = ? WHERE job_id = ?",
+                [(now, job_id) for job_id, _, _ in replay]
+            )
+            conn.executemany(
+                "UPDATE attachment_jobs SET status = 'failed', http_status = 500, error = ?, updated_at = ? WHERE job_id = ?",
+                [("Interrupted by a restart, resend the attachment", now, job_id) for job_id in lost]
+            )
+        if not rows:
+            return
+        with self.lock:
+            self.pending += len(replay)
+            self.owned.update(job_id for job_id, _, _ in replay)
+            self.stats["replayed"] += len(replay)
+            self.stats["lost"] += len(lost)
+        for job_id, kind, payload in replay:
+            self.executor.submit(self._run, job_id, self.replayers[kind], (payload,), None)
+        print(f"♻️ Replaying {len(replay)} unfinished attachment job(s), {len(lost)} lost")
+
+    def _expire(self, conn):
+        conn.execute(
+            "DELETE FROM attachment_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - ATTACHMENT_JOB_TTL_S,)
+        )
+
+    def get(self, job_id: str):
+        self.start()
+        row = self._conn().execute(
+            f"SELECT {', '.join(ATTACHMENT_JOB_COLUMNS)} FROM attachment_jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return self._job(row) if row else None
+
+
+attachment_jobs = AttachmentJobQueue(ATTACHMENT_JOBS_DB_PATH, ATTACHMENT_WORKERS, ATTACHMENT_QUEUE_MAX)
+
+
+def accepted_job_response(job: dict, created: bool):
+    if job is None:
+        return jsonify({"error": "Attachment queue is full, retry later"}), 503
+    return jsonify({
+        "status": "accepted" if created else "duplicate",
+        "job_id": job["job_id"],
+        "job_status": job["status"],
+        "status_url": f"/attachment_jobs/{job['job_id']}",
+    }), 202
+
+
+@app.route('/attachment_jobs/<job_id>', methods=['GET'])
+def attachment_job_status(job_id):
+    """Status and result of a queued attachment job"""
+    job = attachment_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job_id"}), 404
+    return jsonify(job)
+
 
 @app.route('/process_attachment_cliq', methods=['POST'])
 def process_attachment_cliq():
-    """Process attachment from Cliq Participation Handler (URL-based)"""
+    """Accept an attachment from the Cliq Participation Handler (URL-based) and queue it"""
+    form = request.form.to_dict()
+    if not form.get('file_url'):
+        return jsonify({"error": "No file URL"}), 400
+
+    job, created = attachment_jobs.submit(form.get('message_id'), "cliq", run_cliq_attachment_job, form, payload=form)
+    return accepted_job_response(job, created)
+
+
+def run_cliq_attachment_job(form: dict):
+    """Process attachment from Cliq Participation Handler (URL-based); runs on the job pool"""
     try:
         print("\n" + "="*60)
         print("📎 CLIQ ATTACHMENT RECEIVED")
         print("="*60)
         
         # Get parameters
-        file_url = request.form.get('file_url')
-        file_name = request.form.get('file_name', f'attachment_{uuid.uuid4()}')
-        conversation_id = request.form.get('conversation_id')
-        sender_id = request.form.get('sender_id')
-        timestamp_ms = int(request.form.get('timestamp', 0))
-        message_id = request.form.get('message_id')
+        file_url = form.get('file_url')
+        file_name = form.get('file_name', f'attachment_{uuid.uuid4()}')
+        conversation_id = form.get('conversation_id')
+        sender_id = form.get('sender_id')
+        timestamp_ms = int(form.get('timestamp', 0))
+        message_id = form.get('message_id')
         
         print(f"File: {file_name}")
         print(f"URL: {file_url[:80]}...")
@@ -3301,25 +6751,24 @@ def process_attachment_cliq():
         if not file_url:
             return jsonify({"error": "No file URL"}), 400
         
-        # Download file from Cliq
+        # Stream the Cliq download straight into Stratus
         ext = file_name.split(".")[-1].lower() if "." in file_name else "bin"
-        temp_path = tempfile.mktemp(suffix=f".{ext}")
         
         print(f"⬇️ Downloading from Cliq...")
         resp = requests.get(file_url, stream=True, timeout=60)
         
-        with open(temp_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=1024*1024):
-                if chunk:
-                    f.write(chunk)
-        
-        file_size = os.path.getsize(temp_path)
-        print(f"✓ Downloaded {file_size} bytes")
-        
         try:
-            # Upload to Stratus
             stratus_key = f"attachments/{message_id}_{file_name}"
-            stratus_url = upload_to_stratus(temp_path, stratus_key)
+            streamed = stream_attachment_to_stratus(
+                resp.iter_content(chunk_size=STREAM_CHUNK_BYTES), stratus_key, content_length=response_content_length(resp)
+            )
+            
+            # Upload, analysis and issue lookup run in parallel; the URL is
+            # only needed once message text is built
+            branches = start_attachment_analysis(streamed, ext, file_name)
+            branches["issue"] = attachment_io.submit(get_latest_open_issue_for_conversation, conversation_id)
+            
+            stratus_url = streamed.url
             
             if not stratus_url:
                 return jsonify({"error": "Stratus upload failed"}), 500
@@ -3327,7 +6776,7 @@ def process_attachment_cliq():
             print(f"✓ Uploaded to Stratus: {stratus_url}")
             
             # ✅ GET LATEST OPEN ISSUE FOR LINKING
-            latest_issue = get_latest_open_issue_for_conversation(conversation_id)
+            latest_issue = branches["issue"].result()
             issue_id = latest_issue.get("issue_id") if latest_issue else None
             
             if issue_id:
@@ -3339,16 +6788,12 @@ def process_attachment_cliq():
 
             if ext in ("png", "jpg", "jpeg", "bmp", "webp", "gif"):
                 print("🖼️ Processing image with Vision model...")
-                analysis = process_image_with_vision(temp_path)
+                analysis = branches["vision"].result()
                 
                 if not analysis:
                     analysis = "Image uploaded (vision analysis unavailable)"
                     print("⚠️ Vision model returned empty, treating as discussion")
                     
-                    # Get latest issue for linking discussions
-                    latest_issue = get_latest_open_issue_for_conversation(conversation_id)
-                    issue_id = latest_issue.get("issue_id") if latest_issue else None
-                    
                     # Store as discussion
                     message_text = f"User shared image: {stratus_url}\n\nVision analysis unavailable."
                     
@@ -3357,25 +6802,20 @@ def process_attachment_cliq():
                         message_text, "discussion", "other", "low", issue_id
                     )
                     
-                    # Index in Qdrant
-                    emb = embed_text(message_text)
-                    ensure_qdrant_collection(len(emb))
+                    # Index in Qdrant (no analysis to embed, so embed the file's context)
+                    emb = attachment_embedding(streamed, f"User shared image {file_name}")
+                    ensure_qdrant_collection_safe(emb)
                     
                     qdrant_id = normalize_message_id(f"img_{message_id}")
-                    point = PointStruct(
-                        id=qdrant_id,
-                        vector=emb,
-                        payload={
-                            "conversation_id": conversation_id,
-                            "sender_id": sender_id,
-                            "role": "discussion",
-                            "category": "other",
-                            "severity": "low",
-                            "issue_id": issue_id or "",
-                            "message_id": f"img_{message_id}",
-                        },
-                    )
-                    qdrant.upsert(QDRANT_COLLECTION, [point])
+                    upsert_message_point(qdrant_id, emb, {
+                        "conversation_id": conversation_id,
+                        "sender_id": sender_id,
+                        "role": "discussion",
+                        "category": "other",
+                        "severity": "low",
+                        "issue_id": issue_id or "",
+                        "message_id": f"img_{message_id}",
+                    }, message_text)
                     
                     return jsonify({
                         "status": "discussion_created",
@@ -3386,8 +6826,14 @@ def process_attachment_cliq():
                 print(f"Vision analysis: {analysis[:150]}...")
                 
                 # ✅ USE LLM TO CLASSIFY THE VISION ANALYSIS OUTPUT
-                print("🤖 Classifying vision analysis with LLM...")
-                classification = classify_message_llm(analysis)
+                near_duplicate = image_index.get(streamed.sha256)
+                if near_duplicate.get("classification"):
+                    print("♻️ Reusing classification of near-duplicate screenshot")
+                    classification = near_duplicate["classification"]
+                else:
+                    print("🤖 Classifying vision analysis with LLM...")
+                    classification = analyze_message_llm(analysis)
+                    image_index.update(streamed.sha256, classification=classification)
                 
                 role = classification.get("role", "discussion")
                 category = classification.get("category", "other")
@@ -3402,15 +6848,22 @@ def process_attachment_cliq():
                     print("🚨 LLM DETECTED INCIDENT IN IMAGE!")
                     
                     # Embed the vision analysis
-                    incident_emb = embed_text(analysis)
-                    ensure_qdrant_collection(len(incident_emb))
+                    incident_emb = attachment_embedding(streamed, analysis)
+                    ensure_qdrant_collection_safe(incident_emb)
                     
                     # ✅ STEP 1: Get ALL open issues
                     open_issues = fetch_open_issues()
                     
                     matched_issue_id = None
+                    recent_matches = []
                     
-                    if open_issues:
+                    # Same screenshot family as an image already linked to an open issue
+                    near_issue_id = near_duplicate.get("issue_id")
+                    if near_issue_id and any(i.get("issue_id") == near_issue_id for i in open_issues):
+                        matched_issue_id = near_issue_id
+                        print(f"🎯 Near-duplicate of a screenshot on open issue {near_issue_id[:12]}")
+                    
+                    if open_issues and not matched_issue_id:
                         print(f"🔍 Checking for recent incidents and similarity with {len(open_issues)} open issue(s)...")
                         
                         # ✅ PRIORITY 1: Check for RECENT incident (within last 2 minutes) with same category
@@ -3449,11 +6902,12 @@ def process_attachment_cliq():
                             print("🔍 No recent match, using similarity search...")
                             
                             q_filter = Filter(must=[FieldCondition(key="role", match=MatchValue(value="incident"))])
-                            hits = qdrant.search(
+                            hits = qdrant_search(
                                 collection_name=QDRANT_COLLECTION,
                                 query_vector=incident_emb,
                                 query_filter=q_filter,
                                 limit=10,
+                                fallback_text=analysis,
                             )
                             
                             # Get set of open issue IDs
@@ -3495,27 +6949,23 @@ def process_attachment_cliq():
                         
                         # Index in Qdrant
                         qdrant_id = normalize_message_id(f"img_{message_id}")
-                        point = PointStruct(
-                            id=qdrant_id,
-                            vector=incident_emb,
-                            payload={
-                                "conversation_id": conversation_id,
-                                "sender_id": sender_id,
-                                "role": "discussion",
-                                "category": category,
-                                "severity": severity,
-                                "issue_id": matched_issue_id,
-                                "message_id": f"img_{message_id}",
-                            },
-                        )
-                        qdrant.upsert(QDRANT_COLLECTION, [point])
+                        upsert_message_point(qdrant_id, incident_emb, {
+                            "conversation_id": conversation_id,
+                            "sender_id": sender_id,
+                            "role": "discussion",
+                            "category": category,
+                            "severity": severity,
+                            "issue_id": matched_issue_id,
+                            "message_id": f"img_{message_id}",
+                        }, message_text)
                         
                         print(f"✅ Linked image to existing issue: {matched_issue_id[:12]}")
+                        image_index.update(streamed.sha256, issue_id=matched_issue_id)
                         
                         return jsonify({
                             "status": "linked_to_existing_issue",
                             "issue_id": matched_issue_id[:12],
-                            "method": "recent_match" if recent_matches else "similarity",
+                            "method": "near_duplicate" if matched_issue_id == near_issue_id else ("recent_match" if recent_matches else "similarity"),
                             "analysis": analysis[:200],
                             "stratus_url": stratus_url
                         })
@@ -3524,13 +6974,15 @@ def process_attachment_cliq():
                     else:
                         print("🆕 No similar issue found, creating new incident")
                         
-                        # Extract concise title from vision analysis
-                        incident_title = extract_incident_title_from_analysis(analysis)
+                        # Title came back with the classification, no extra LLM call
+                        incident_title = classification.get("title") or extract_incident_title_from_analysis(analysis)
                         
                         message_text = f"{incident_title}\n\n[Image Analysis Details]\n{analysis}\n\nImage: {stratus_url}"
                         
-                        # Create new incident using index_message
-                        index_message(conversation_id, f"img_{message_id}", sender_id, timestamp_ms, message_text)
+                        # Create new incident using index_message (reuse the image classification)
+                        new_issue_id = index_message(conversation_id, f"img_{message_id}", sender_id, timestamp_ms, message_text,
+                                                     cls=classification)
+                        image_index.update(streamed.sha256, issue_id=new_issue_id)
                         
                         return jsonify({
                             "status": "incident_created",
@@ -3668,8 +7120,7 @@ def process_attachment_cliq():
 
                 
                 else:
-                    # ✅ DISCUSSION - Link to latest open issue
-                    latest_issue = get_latest_open_issue_for_conversation(conversation_id)
+                    # ✅ DISCUSSION - Link to latest open issue (looked up alongside the upload)
                     issue_id = latest_issue.get("issue_id") if latest_issue else None
                     
                     print(f"💬 Image classified as {role}")
@@ -3685,24 +7136,19 @@ def process_attachment_cliq():
                     )
                     
                     # Index in Qdrant
-                    emb = embed_text(message_text)
-                    ensure_qdrant_collection(len(emb))
+                    emb = attachment_embedding(streamed, message_text)
+                    ensure_qdrant_collection_safe(emb)
                     
                     qdrant_id = normalize_message_id(f"img_{message_id}")
-                    point = PointStruct(
-                        id=qdrant_id,
-                        vector=emb,
-                        payload={
-                            "conversation_id": conversation_id,
-                            "sender_id": sender_id,
-                            "role": role,
-                            "category": category,
-                            "severity": severity,
-                            "issue_id": issue_id or "",
-                            "message_id": f"img_{message_id}",
-                        },
-                    )
-                    qdrant.upsert(QDRANT_COLLECTION, [point])
+                    upsert_message_point(qdrant_id, emb, {
+                        "conversation_id": conversation_id,
+                        "sender_id": sender_id,
+                        "role": role,
+                        "category": category,
+                        "severity": severity,
+                        "issue_id": issue_id or "",
+                        "message_id": f"img_{message_id}",
+                    }, message_text)
                     print(f"✅ Indexed image {role} in Qdrant")
                     
                     return jsonify({
@@ -3915,7 +7361,7 @@ def process_attachment_cliq():
             
             elif ext in ("pdf", "doc", "docx", "txt"):
                 print("📄 Processing document with OCR...")
-                ocr_text = ocr_document(temp_path, file_name)
+                ocr_text = branches["ocr"].result()
                 
                 if ocr_text:
                     print(f"✓ OCR extracted {len(ocr_text)} characters")
@@ -3929,8 +7375,8 @@ def process_attachment_cliq():
                 print("🔍 Finding best matching issue for document via similarity...")
                 
                 # Embed the document content
-                doc_emb = embed_text(summary + " " + ocr_text[:500] if ocr_text else summary)
-                ensure_qdrant_collection(len(doc_emb))
+                doc_emb = attachment_embedding(streamed, summary + " " + ocr_text[:500] if ocr_text else summary)
+                ensure_qdrant_collection_safe(doc_emb)
                 
                 # Get all open issues
                 open_issues = fetch_open_issues()
@@ -3941,11 +7387,12 @@ def process_attachment_cliq():
                     
                     # Search for similar incidents
                     q_filter = Filter(must=[FieldCondition(key="role", match=MatchValue(value="incident"))])
-                    hits = qdrant.search(
+                    hits = qdrant_search(
                         collection_name=QDRANT_COLLECTION,
                         query_vector=doc_emb,
                         query_filter=q_filter,
                         limit=10,
+                        fallback_text=summary,
                     )
                     
                     # Filter to only open issues
@@ -3986,20 +7433,15 @@ def process_attachment_cliq():
                 
                 # Index in Qdrant
                 qdrant_id = normalize_message_id(f"doc_{message_id}")
-                point = PointStruct(
-                    id=qdrant_id,
-                    vector=doc_emb,
-                    payload={
-                        "conversation_id": conversation_id,
-                        "sender_id": sender_id,
-                        "role": "discussion",
-                        "category": "other",
-                        "severity": "low",
-                        "issue_id": matched_issue_id or "",
-                        "message_id": f"doc_{message_id}",
-                    },
-                )
-                qdrant.upsert(QDRANT_COLLECTION, [point])
+                upsert_message_point(qdrant_id, doc_emb, {
+                    "conversation_id": conversation_id,
+                    "sender_id": sender_id,
+                    "role": "discussion",
+                    "category": "other",
+                    "severity": "low",
+                    "issue_id": matched_issue_id or "",
+                    "message_id": f"doc_{message_id}",
+                }, message_text)
                 print(f"✅ Indexed document discussion in Qdrant")
                 
                 return jsonify({
@@ -4066,24 +7508,19 @@ def process_attachment_cliq():
                 )
                 
                 # Index in Qdrant
-                emb = embed_text(message_text)
-                ensure_qdrant_collection(len(emb))
+                emb = attachment_embedding(streamed, message_text)
+                ensure_qdrant_collection_safe(emb)
                 
                 qdrant_id = normalize_message_id(f"file_{message_id}")
-                point = PointStruct(
-                    id=qdrant_id,
-                    vector=emb,
-                    payload={
-                        "conversation_id": conversation_id,
-                        "sender_id": sender_id,
-                        "role": "discussion",
-                        "category": "other",
-                        "severity": "low",
-                        "issue_id": issue_id or "",
-                        "message_id": f"file_{message_id}",
-                    },
-                )
-                qdrant.upsert(QDRANT_COLLECTION, [point])
+                upsert_message_point(qdrant_id, emb, {
+                    "conversation_id": conversation_id,
+                    "sender_id": sender_id,
+                    "role": "discussion",
+                    "category": "other",
+                    "severity": "low",
+                    "issue_id": issue_id or "",
+                    "message_id": f"file_{message_id}",
+                }, message_text)
                 
                 return jsonify({
                     "status": "discussion_created",
@@ -4091,9 +7528,7 @@ def process_attachment_cliq():
                 })
         
         finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                print("🗑️ Cleaned up temp file")
+            resp.close()
     
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -4102,6 +7537,8 @@ def process_attachment_cliq():
         return jsonify({"error": str(e)}), 500
 
 
+# Cliq jobs only need their form, so they can be re-run after a restart
+attachment_jobs.replayers["cliq"] = run_cliq_attachment_job
 
 
 # @app.route('/process_attachment_cliq', methods=['POST'])
@@ -4232,163 +7669,166 @@ def process_attachment_cliq():
 
 
 
+def parse_deluge_metadata(metadata_str: str) -> dict:
+    """Parse the metadata map the Deluge handler sends as a string"""
+    try:
+        # Clean Deluge map format
+        metadata_str = metadata_str.replace("=", ":")
+        return json.loads(metadata_str)
+    except:
+        # Fallback: try to parse manually
+        metadata = {}
+        for pair in metadata_str.split(","):
+            if "=" in pair:
+                k, v = pair.split("=", 1)
+                metadata[k.strip()] = v.strip()
+        return metadata
+
+
 @app.route('/process_attachment_upload', methods=['POST'])
 def process_attachment_upload():
-    """Receive attachment uploaded from Deluge Participation Handler"""
+    """Accept an attachment uploaded from the Deluge Participation Handler and queue it"""
+    metadata_str = request.form.get('metadata', '{}')
+    print(f"Metadata string: {metadata_str}")
+    metadata = parse_deluge_metadata(metadata_str)
+
+    # Get uploaded file (Deluge sends as 'file')
+    uploaded_file = next(iter(request.files.values()), None)
+    if not uploaded_file:
+        print("❌ No file found in request")
+        return jsonify({"error": "No file uploaded"}), 400
+
+    # The request body is gone once we return, so spool it for the worker
+    # (memory up to ATTACHMENT_SPOOL_MAX_MEMORY, disk beyond that)
+    spool = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_MAX_MEMORY)
+    for chunk in iter_file_chunks(uploaded_file.stream):
+        spool.write(chunk)
+    filename = uploaded_file.filename or f"attachment_{uuid.uuid4()}"
+
+    job, created = attachment_jobs.submit(
+        metadata.get('message_id', ''), "upload", run_upload_attachment_job,
+        metadata, filename, spool, cleanup=spool.close,
+    )
+    if not created:
+        spool.close()
+    return accepted_job_response(job, created)
+
+
+def run_upload_attachment_job(metadata: dict, filename: str, spool):
+    """Process an attachment uploaded from the Deluge Participation Handler; runs on the job pool"""
     try:
         print("\n" + "="*60)
         print("📎 ATTACHMENT UPLOAD RECEIVED")
         print("="*60)
         
-        # Parse metadata from form
-        metadata_str = request.form.get('metadata', '{}')
-        print(f"Metadata string: {metadata_str}")
-        
-        # Parse metadata (Deluge sends as string)
-        try:
-            # Clean Deluge map format
-            metadata_str = metadata_str.replace("=", ":")
-            metadata = json.loads(metadata_str)
-        except:
-            # Fallback: try to parse manually
-            metadata = {}
-            for pair in metadata_str.split(","):
-                if "=" in pair:
-                    k, v = pair.split("=", 1)
-                    metadata[k.strip()] = v.strip()
-        
         conversation_id = metadata.get('conversation_id', '')
         sender_id = metadata.get('sender_id', '')
         timestamp_ms = int(metadata.get('timestamp', 0))
         message_id = metadata.get('message_id', '')
         
         print(f"Parsed: conv={conversation_id}, sender={sender_id}, ts={timestamp_ms}")
+        print(f"📎 Processing: {filename}")
         
-        # Get uploaded file (Deluge sends as 'file')
-        uploaded_file = None
-        for key in request.files:
-            print(f"Found file key: {key}")
-            uploaded_file = request.files[key]
-            break
+        # Stream the spooled upload straight into Stratus
+        ext = filename.split(".")[-1].lower() if "." in filename else "bin"
+        spool.seek(0)  # retries re-read from the start
         
-        if not uploaded_file:
-            print("❌ No file found in request")
-            return jsonify({"error": "No file uploaded"}), 400
+        stratus_key = f"attachments/{message_id}_{filename}"
+        streamed = stream_attachment_to_stratus(iter_file_chunks(spool), stratus_key)
+        branches = start_attachment_analysis(streamed, ext, filename)
+        stratus_url = streamed.url
         
-        filename = uploaded_file.filename or f"attachment_{uuid.uuid4()}"
-        print(f"📎 Processing: {filename}")
+        if not stratus_url:
+            print("❌ Stratus upload failed")
+            return jsonify({"error": "Stratus upload failed"}), 500
         
-        # Save to temp file
-        ext = filename.split(".")[-1].lower() if "." in filename else "bin"
-        temp_path = tempfile.mktemp(suffix=f".{ext}")
-        uploaded_file.save(temp_path)
+        print(f"✓ Uploaded to Stratus: {stratus_url}")
         
-        try:
-            file_size = os.path.getsize(temp_path)
-            print(f"✓ Saved {file_size} bytes to {temp_path}")
+        # Process based on file type
+        if ext in ("png", "jpg", "jpeg", "bmp", "webp", "gif"):
+            print("🖼️ Processing image with Vision model...")
+            analysis = branches["vision"].result()
             
-            # Upload to Stratus
-            stratus_key = f"attachments/{message_id}_{filename}"
-            stratus_url = upload_to_stratus(temp_path, stratus_key)
+            if not analysis:
+                analysis = "Image uploaded (vision analysis unavailable)"
             
-            if not stratus_url:
-                print("❌ Stratus upload failed")
-                return jsonify({"error": "Stratus upload failed"}), 500
+            print(f"Vision result: {analysis[:100]}...")
             
-            print(f"✓ Uploaded to Stratus: {stratus_url}")
+            # Check for incident keywords
+            analysis_lower = analysis.lower()
+            incident_keywords = ["error", "failed", "down", "outage", "critical", 
+                                "production", "timeout", "crash", "exception", "database"]
             
-            # Process based on file type
-            if ext in ("png", "jpg", "jpeg", "bmp", "webp", "gif"):
-                print("🖼️ Processing image with Vision model...")
-                analysis = process_image_with_vision(temp_path)
-                
-                if not analysis:
-                    analysis = "Image uploaded (vision analysis unavailable)"
-                
-                print(f"Vision result: {analysis[:100]}...")
-                
-                # Check for incident keywords
-                analysis_lower = analysis.lower()
-                incident_keywords = ["error", "failed", "down", "outage", "critical", 
-                                    "production", "timeout", "crash", "exception", "database"]
-                
-                is_incident = any(kw in analysis_lower for kw in incident_keywords)
-                
-                if is_incident and "no incident" not in analysis_lower:
-                    print("🚨 Incident detected in image!")
-                    message_text = f"[Image Analysis] {analysis}"
-                    index_message(conversation_id, f"img_{message_id}", sender_id, timestamp_ms, message_text)
-                    
-                    return jsonify({
-                        "status": "incident_created",
-                        "analysis": analysis,
-                        "stratus_url": stratus_url
-                    })
-                else:
-                    print("💬 Image stored as discussion")
-                    message_text = f"User shared image: {stratus_url}\n\nVision analysis: {analysis}"
-                    insert_message_into_datastore(
-                        conversation_id, f"img_{message_id}", sender_id, timestamp_ms,
-                        message_text, "discussion", "other", "low", None
-                    )
-                    
-                    return jsonify({
-                        "status": "discussion_created",
-                        "analysis": analysis,
-                        "stratus_url": stratus_url
-                    })
+            is_incident = any(kw in analysis_lower for kw in incident_keywords)
             
-            elif ext in ("pdf", "doc", "docx", "txt"):
-                print("📄 Processing document with OCR...")
-                ocr_text = ocr_document(temp_path, filename)
-                
-                if ocr_text:
-                    print(f"✓ OCR extracted {len(ocr_text)} characters")
-                    summary = f"Document '{filename}' contains: {ocr_text[:200]}..."
-                else:
-                    print("⚠️ OCR failed or empty")
-                    summary = f"Document '{filename}' uploaded (OCR unavailable)"
-                
-                message_text = f"User shared document: {stratus_url}\n\n{summary}"
-                insert_message_into_datastore(
-                    conversation_id, f"doc_{message_id}", sender_id, timestamp_ms,
-                    message_text, "discussion", "other", "low", None
-                )
-                
-                print("📑 Document stored as discussion")
+            if is_incident and "no incident" not in analysis_lower:
+                print("🚨 Incident detected in image!")
+                message_text = f"[Image Analysis] {analysis}"
+                index_message(conversation_id, f"img_{message_id}", sender_id, timestamp_ms, message_text)
                 
                 return jsonify({
-                    "status": "discussion_created",
-                    "summary": summary,
+                    "status": "incident_created",
+                    "analysis": analysis,
                     "stratus_url": stratus_url
                 })
-            
             else:
-                print(f"📦 Other file type: {ext}")
-                message_text = f"User shared file: {filename} ({stratus_url})"
+                print("💬 Image stored as discussion")
+                message_text = f"User shared image: {stratus_url}\n\nVision analysis: {analysis}"
                 insert_message_into_datastore(
-                    conversation_id, f"file_{message_id}", sender_id, timestamp_ms,
+                    conversation_id, f"img_{message_id}", sender_id, timestamp_ms,
                     message_text, "discussion", "other", "low", None
                 )
                 
                 return jsonify({
                     "status": "discussion_created",
-                    "file_type": ext,
+                    "analysis": analysis,
                     "stratus_url": stratus_url
                 })
         
-        finally:
-            # Cleanup
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                print(f"🗑️ Cleaned up temp file")
+        elif ext in ("pdf", "doc", "docx", "txt"):
+            print("📄 Processing document with OCR...")
+            ocr_text = branches["ocr"].result()
+            
+            if ocr_text:
+                print(f"✓ OCR extracted {len(ocr_text)} characters")
+                summary = f"Document '{filename}' contains: {ocr_text[:200]}..."
+            else:
+                print("⚠️ OCR failed or empty")
+                summary = f"Document '{filename}' uploaded (OCR unavailable)"
+            
+            message_text = f"User shared document: {stratus_url}\n\n{summary}"
+            insert_message_into_datastore(
+                conversation_id, f"doc_{message_id}", sender_id, timestamp_ms,
+                message_text, "discussion", "other", "low", None
+            )
+            
+            print("📑 Document stored as discussion")
+            
+            return jsonify({
+                "status": "discussion_created",
+                "summary": summary,
+                "stratus_url": stratus_url
+            })
+        
+        else:
+            print(f"📦 Other file type: {ext}")
+            message_text = f"User shared file: {filename} ({stratus_url})"
+            insert_message_into_datastore(
+                conversation_id, f"file_{message_id}", sender_id, timestamp_ms,
+                message_text, "discussion", "other", "low", None
+            )
+            
+            return jsonify({
+                "status": "discussion_created",
+                "file_type": ext,
+                "stratus_url": stratus_url
+            })
     
     except Exception as e:
         print(f"❌ Attachment processing error: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
-
 # @app.route('/signals/consume', methods=['POST'])
 # def signals_consume():
 #     payload = request.get_json()
@@ -4494,41 +7934,228 @@ def process_attachment_upload():
 
 ##
 
+# ---------- Widget pagination ----------
+# limit + opaque cursor over the list's sort key, optional ?fields= projection,
+# and a JSON encoder that streams items so the first bytes go out at once.
+# Without limit / cursor / fields the endpoints return the full list as before.
+# Paging an issue's conversation reuses its sorted thread for
+# ISSUE_THREAD_TTL_S instead of scanning the messages table for every page;
+# messages linked by this instance drop the cached thread, those linked by
+# other instances show up once it expires.
+
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "200"))
+PAGE_PARAMS = ("limit", "cursor", "fields")
+ISSUE_THREAD_TTL_S = float(os.getenv("ISSUE_THREAD_TTL_S", "30"))
+ISSUE_THREAD_CACHE_MAX = int(os.getenv("ISSUE_THREAD_CACHE_MAX", "256"))
+
+
+class BadPageRequest(ValueError):
+    pass
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_types: tuple) -> tuple:
+    """Cursor -> sort key; it must match key_types, e.g. (int, str)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = tuple(json.loads(base64.urlsafe_b64decode(padded.encode())))
+    except Exception:
+        raise BadPageRequest("invalid cursor")
+    if len(key) != len(key_types) or any(
+        type(value) is not key_type for value, key_type in zip(key, key_types)
+    ):
+        raise BadPageRequest("invalid cursor")
+    return key
+
+
+def page_args(allowed_fields: tuple, default_fields: tuple, cursor_types: tuple):
+    """(limit, cursor key or None, fields) from the query string"""
+    try:
+        limit = int(request.args.get("limit", PAGE_DEFAULT_LIMIT))
+    except ValueError:
+        raise BadPageRequest("invalid limit")
+    limit = max(1, min(limit, PAGE_MAX_LIMIT))
+    
+    cursor = request.args.get("cursor")
+    cursor_key = decode_cursor(cursor, cursor_types) if cursor else None
+    
+    fields_arg = request.args.get("fields", "").strip()
+    fields = tuple(f.strip() for f in fields_arg.split(",") if f.strip()) if fields_arg else default_fields
+    unknown = [f for f in fields if f not in allowed_fields]
+    if unknown:
+        raise BadPageRequest(f"unknown fields: {', '.join(unknown)}")
+    return limit, cursor_key, fields
+
+
+def paginate(items: list, sort_key, limit: int, cursor_key=None, descending=False):
+    """
+    One page of `items` (already sorted by sort_key, asc or desc) after the
+    cursor; returns (page, next_cursor or None).
+    """
+    if cursor_key is not None:
+        keys = [list(sort_key(item)) for item in items]
+        cursor_key = list(cursor_key)
+        if descending:
+            start = next((i for i, k in enumerate(keys) if k < cursor_key), len(items))
+        else:
+            start = next((i for i, k in enumerate(keys) if k > cursor_key), len(items))
+        items = items[start:]
+    page = items[:limit]
+    next_cursor = encode_cursor(sort_key(page[-1])) if len(items) > limit else None
+    return page, next_cursor
+
+
+def stream_json_list(key: str, items: list, fields: tuple, next_cursor=None, headers=None):
+    """Response streaming {"<key>": [...], "next_cursor": ...} item by item"""
+    def generate():
+        yield f'{{"{key}": ['
+        for n, item in enumerate(items):
+            yield ("," if n else "") + json.dumps({f: item.get(f) for f in fields})
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+    return app.response_class(generate(), mimetype="application/json", headers=headers or {})
+
+
+# Built once per issue_cache.version; BOOT_ID keeps ETags from colliding
+# across restarts (the version counter starts over)
+BOOT_ID = uuid.uuid4().hex[:8]
+latest_issues_response = {"version": None, "etag": None, "body": None}
+latest_issues_lock = threading.Lock()
+
+LATEST_ISSUE_FIELDS = ("issue_id", "title", "category", "severity", "opened_at", "opened_at_str")
+LATEST_ISSUE_EXTRA_FIELDS = ("status", "source")
+
+
+def latest_issue_item(issue: dict) -> dict:
+    opened_at_raw = issue.get("opened_at", 0)
+    try:
+        opened_at_ms = int(opened_at_raw)
+        opened_at_str = datetime.fromtimestamp(
+            opened_at_ms / 1000, tz=timezone.utc
+        ).strftime("%Y-%m-%d %H:%M")
+    except Exception:
+        opened_at_ms = 0
+        opened_at_str = "N/A"
+    return {
+        "issue_id": issue.get("issue_id", ""),
+        "title": issue.get("title", ""),
+        "category": issue.get("category", "other"),
+        "severity": issue.get("severity", "low"),
+        "opened_at": opened_at_ms,
+        "opened_at_str": opened_at_str,
+        "status": issue.get("status", "Open"),
+        "source": issue.get("source", ""),
+    }
+
+
+def build_latest_issues_body(issues: list) -> str:
+    out = [{f: item[f] for f in LATEST_ISSUE_FIELDS} for item in map(latest_issue_item, issues)]
+    return json.dumps({"issues": out})
+
+
 @app.route('/latest_issues_json', methods=['GET'])
 def latest_issues_json():
-    issues = fetch_open_issues()
-    out = []
-    for issue in issues:
-        opened_at_raw = issue.get("opened_at", 0)
+    version = issue_cache.current_version()
+    
+    if any(p in request.args for p in PAGE_PARAMS):
+        # Paged / projected: newest first, cursor over (opened_at, issue_id)
         try:
-            opened_at_ms = int(opened_at_raw)
-            opened_at_str = datetime.fromtimestamp(
-                opened_at_ms / 1000, tz=timezone.utc
-            ).strftime("%Y-%m-%d %H:%M")
+            limit, cursor_key, fields = page_args(LATEST_ISSUE_FIELDS + LATEST_ISSUE_EXTRA_FIELDS, LATEST_ISSUE_FIELDS, (int, str))
+        except BadPageRequest as e:
+            return jsonify({"error": str(e)}), 400
+        etag = f'"issues-{BOOT_ID}-{version}-{hashlib.md5(request.query_string).hexdigest()[:8]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("If-None-Match", ""):
+            return "", 304, headers
+        _, issues = issue_cache.open_issues()
+        items = [latest_issue_item(issue) for issue in issues]
+        sort_key = lambda i: (i["opened_at"], i["issue_id"])
+        items.sort(key=sort_key, reverse=True)
+        page, next_cursor = paginate(items, sort_key, limit, cursor_key, descending=True)
+        return stream_json_list("issues", page, fields, next_cursor, headers)
+    
+    with latest_issues_lock:
+        cached = dict(latest_issues_response)
+    if cached["version"] != version:
+        version, issues = issue_cache.open_issues()
+        cached = {"version": version, "etag": f'"issues-{BOOT_ID}-{version}"', "body": build_latest_issues_body(issues)}
+        with latest_issues_lock:
+            latest_issues_response.update(cached)
+    
+    headers = {"ETag": cached["etag"], "Cache-Control": "no-cache"}
+    if cached["etag"] in request.headers.get("If-None-Match", ""):
+        return "", 304, headers
+    return app.response_class(cached["body"], mimetype="application/json", headers=headers)
+
+
+CONVERSATION_FIELDS = ("time_str", "role", "sender_id", "message_text")
+CONVERSATION_EXTRA_FIELDS = ("message_id", "time_stamp", "category", "severity")
+
+
+def conversation_sort_key(m: dict) -> tuple:
+    rowid = str(m.get("ROWID") or "0")
+    return int(m.get("time_stamp", 0) or 0), int(rowid) if rowid.isdigit() else 0
+
+
+class IssueThreadCache:
+    def __init__(self, ttl_s: float, max_issues: int):
+        self.ttl_s = ttl_s
+        self.max_issues = max_issues
+        self.threads = OrderedDict()   # {issue_id: (fetched_at, messages oldest first)}
+        self.lock = threading.Lock()
+
+    def get(self, issue_id: str) -> list:
+        """An issue's messages sorted oldest first (shared; do not modify)"""
+        now = time.time()
+        with self.lock:
+            cached = self.threads.get(issue_id)
+            if cached and now - cached[0] < self.ttl_s:
+                self.threads.move_to_end(issue_id)
+                return cached[1]
+        messages = fetch_messages_by_issue_id(issue_id)
+        try:
+            messages.sort(key=conversation_sort_key)
         except Exception:
-            opened_at_ms = 0
-            opened_at_str = "N/A"
-        out.append({
-            "issue_id": issue.get("issue_id", ""),
-            "title": issue.get("title", ""),
-            "category": issue.get("category", "other"),
-            "severity": issue.get("severity", "low"),
-            "opened_at": opened_at_ms,
-            "opened_at_str": opened_at_str,
-        })
-    return jsonify({"issues": out})
+            pass
+        with self.lock:
+            self.threads[issue_id] = (now, messages)
+            self.threads.move_to_end(issue_id)
+            while len(self.threads) > self.max_issues:
+                self.threads.popitem(last=False)
+        return messages
+
+    def discard(self, issue_id: str):
+        with self.lock:
+            self.threads.pop(issue_id, None)
+
+
+issue_threads = IssueThreadCache(ISSUE_THREAD_TTL_S, ISSUE_THREAD_CACHE_MAX)
+
 
 @app.route('/issue_conversations_json', methods=['GET'])
 def issue_conversations_json():
     issue_id = request.args.get("issue_id", "").strip()
     if not issue_id:
         return jsonify({"messages": []})
-
-    messages = fetch_messages_by_issue_id(issue_id)
-    try:
-        messages.sort(key=lambda m: int(m.get("time_stamp", 0)))
-    except Exception:
-        pass
+    
+    paged = any(p in request.args for p in PAGE_PARAMS)
+    if paged:
+        try:
+            limit, cursor_key, fields = page_args(CONVERSATION_FIELDS + CONVERSATION_EXTRA_FIELDS, CONVERSATION_FIELDS, (int, int))
+        except BadPageRequest as e:
+            return jsonify({"error": str(e)}), 400
+        # Oldest first, cursor over (time_stamp, ROWID); one table scan serves every page
+        messages, next_cursor = paginate(issue_threads.get(issue_id), conversation_sort_key, limit, cursor_key)
+    else:
+        messages = fetch_messages_by_issue_id(issue_id)
+        try:
+            messages.sort(key=conversation_sort_key)
+        except Exception:
+            pass
+        next_cursor = None
 
     out = []
     for m in messages:
@@ -4543,8 +8170,15 @@ def issue_conversations_json():
             "role": m.get("role", "discussion"),
             "sender_id": m.get("sender_id", ""),
             "message_text": m.get("message_text", ""),
+            "message_id": m.get("message_id", ""),
+            "time_stamp": ts_raw,
+            "category": m.get("category", "other"),
+            "severity": m.get("severity", "low"),
         })
-    return jsonify({"messages": out})
+    
+    if paged:
+        return stream_json_list("messages", out, fields, next_cursor)
+    return stream_json_list("messages", out, CONVERSATION_FIELDS)
 
 @app.route('/search_incidents_card_json', methods=['GET'])
 def search_incidents_card_json():
@@ -4562,7 +8196,7 @@ def search_incidents_card_json():
     
     # Search for incidents
     q_filter = Filter(must=[FieldCondition(key="role", match=MatchValue(value="incident"))])
-    hits = qdrant.search(
+    hits = qdrant_search(
         collection_name=QDRANT_COLLECTION,
         query_vector=q_emb,
         query_filter=q_filter,
@@ -4596,28 +8230,19 @@ def search_incidents_card_json():
             issue_scores.setdefault(iid, 0)
             issue_scores[iid] = max(issue_scores[iid], hit.score)
     
-    # Fetch all issues (both open and resolved)
-    all_issues = fetch_all_issues()
+    # Denormalized issue records (no Data Store calls on a warm cache)
+    top_issues = sorted(issue_scores.items(), key=lambda x: x[1], reverse=True)[:10]
+    issues = issue_cache.get_many([issue_id for issue_id, _ in top_issues])
     
     results = []
-    for issue_id, score in sorted(issue_scores.items(), key=lambda x: x[1], reverse=True)[:10]:
-        issue = next((i for i in all_issues if i.get("issue_id") == issue_id), None)
+    for issue_id, score in top_issues:
+        issue = issues.get(issue_id)
         if not issue:
             continue
         
-        # Get messages
-        messages = fetch_messages_by_issue_id(issue_id)
-        if not messages:
-            continue
-        
-        # Get incident message
-        incident_msg = next((m for m in messages if m.get("role") == "incident"), None)
-        if not incident_msg:
-            continue
-        
-        title = incident_msg.get("message_text", "Untitled")[:80]
-        category = incident_msg.get("category", "other")
-        severity = incident_msg.get("severity", "low")
+        title = (issue.get("title") or "Untitled")[:80]
+        category = issue.get("category") or "other"
+        severity = issue.get("severity") or "low"
         
         # Status and dates
         status = issue.get("status", "Open")
@@ -4636,7 +8261,12 @@ def search_incidents_card_json():
         
         # Resolution
         if status.lower() == "resolved":
-            resolution_summary = issue.get("resolution_summary")
+            resolution_summary = get_resolution_summary(issue_id, issue=issue)
+            if not resolution_summary:
+                # Nothing stored yet: build it from the thread once (it is persisted)
+                messages = fetch_messages_by_issue_id(issue_id)
+                if messages:
+                    resolution_summary = get_resolution_summary(issue_id, messages=messages, issue=issue)
             if not resolution_summary or resolution_summary.strip() == "":
                 resolution_summary = "Resolved (no details)"
         else:
@@ -5028,12 +8658,38 @@ def store_resolution_summary(issue_id: str, summary: str, resolved_at_ms: int) -
         
         resp = requests.put(base_url, headers=headers, json=update_body, timeout=10)
         print(f"✅ Resolution stored for {issue_id}: {resp.status_code}")
+        if resp.status_code == 200:
+            issue_cache.note_resolved(issue_id, resolved_at_ms, summary[:500])
         return resp.status_code == 200
         
     except Exception as e:
         print(f"❌ Resolution store failed: {e}")
         return False
 
+def persist_resolution_summary(issue_id: str, summary: str) -> bool:
+    """Update only the stored summary of an issue (after a regeneration)"""
+    if not (CATALYST_TOKEN and CATALYST_PROJECT_ID):
+        return False
+
+    base_url = f"https://api.catalyst.zoho.com/baas/v1/project/{CATALYST_PROJECT_ID}/table/{ISSUES_TABLE}/row"
+    headers = {"Authorization": f"Zoho-oauthtoken {get_catalyst_token()}", "Content-Type": "application/json", "CATALYST-ORG": CATALYST_ORG_ID}
+
+    try:
+        row_id = find_issue_row_id(issue_id)
+        if not row_id:
+            return False
+
+        update_body = [{"ROWID": row_id, "resolution_summary": summary[:500]}]
+        resp = requests.put(base_url, headers=headers, json=update_body, timeout=10)
+        print(f"💾 Regenerated summary stored for {issue_id[:12]}: {resp.status_code}")
+        if resp.status_code == 200:
+            issue_cache.note_summary(issue_id, summary[:500])
+        return resp.status_code == 200
+
+    except Exception as e:
+        print(f"❌ Summary store failed: {e}")
+        return False
+
 @app.route('/debug_qdrant', methods=['GET'])
 def debug_qdrant():
     """Check what's in Qdrant"""
@@ -5372,6 +9028,9 @@ def clear_issues():
         import traceback
         traceback.print_exc()
         return jsonify({"status": "error", "message": str(e)})
+    finally:
+        # Rows may be gone even when a later batch failed
+        issue_cache.clear()
 
 
 @app.route('/clear_all_data', methods=['POST'])
@@ -5488,12 +9147,87 @@ def admin_token_status():
     })
 
 
+@app.route('/admin/quickml_stats', methods=['GET'])
+def admin_quickml_stats():
+    """In-flight requests, hedging counters and latency histograms per QuickML model"""
+    return jsonify(quickml.snapshot())
+
+
+@app.route('/admin/llm_batch_stats', methods=['GET'])
+def admin_llm_batch_stats():
+    """Show how many messages were classified per QuickML batch request"""
+    with analysis_batcher.lock:
+        stats = dict(analysis_batcher.stats)
+    stats["avg_batch_size"] = round(stats["messages"] / stats["batches"], 2) if stats["batches"] else 0
+    stats["enabled"] = LLM_BATCH_ENABLED
+    stats["window_ms"] = LLM_BATCH_WINDOW_MS
+    stats["max_size"] = LLM_BATCH_MAX_SIZE
+    return jsonify(stats)
+
+
+@app.route('/admin/breakers', methods=['GET'])
+def admin_breakers():
+    """Circuit breaker state per dependency plus the queued-vector backlog"""
+    return jsonify({
+        "breakers": {name: breaker.snapshot() for name, breaker in breakers.items()},
+        "vector_backlog": vector_backlog.snapshot(),
+    })
+
+
+@app.route('/admin/signals_publisher', methods=['GET'])
+def signals_publisher_status():
+    """Background Signals publisher: queue depth, spill file size, counters"""
+    return jsonify(signals_publisher.snapshot()), 200
+
+
+@app.route('/admin/idempotency_ledger', methods=['GET'])
+def idempotency_ledger_status():
+    """Idempotency ledger: tracked messages and hit/record counters"""
+    return jsonify(message_ledger.snapshot()), 200
+
+
+@app.route('/admin/ingest_decisions', methods=['GET'])
+def ingest_decisions_status():
+    """Recent linking decisions (optionally only message_ids containing ?match=)"""
+    match = request.args.get("match", "")
+    try:
+        limit = max(1, int(request.args.get("limit", "5000")))
+    except ValueError:
+        return jsonify({"error": "invalid limit"}), 400
+    decisions = [d for d in list(ingest_decisions) if match in str(d.get("message_id"))]
+    return jsonify({"decisions": decisions[-limit:], "count": len(decisions), "capture": capture_writer.stats}), 200
+
+
+@app.route('/admin/issue_cache', methods=['GET'])
+def issue_cache_status():
+    """Denormalized issue cache: size, age and hit/miss counters"""
+    return jsonify(issue_cache.snapshot()), 200
+
+
+@app.route('/admin/ingest_queue', methods=['GET'])
+def ingest_queue_status():
+    """Durable ingest queue: jobs per state, oldest pending job, worker counters"""
+    return jsonify(ingest_queue.snapshot()), 200
+
+
+@app.route('/admin/content_store', methods=['GET'])
+def admin_content_store():
+    """Hit rates of the attachment content-hash store and the near-duplicate image index"""
+    return jsonify({
+        "content_store": content_store.snapshot(),
+        "near_duplicates": image_index.snapshot(),
+    })
 
 
 if __name__ == '__main__':
     # ✅ Start auto token refresh
     token_manager.start_auto_refresh()
     
+    # ✅ Replay unfinished ingest jobs from the last run
+    if INGEST_QUEUE_ENABLED:
+        ingest_queue.start()
+    attachment_jobs.start()
+    
     print("\n" + "="*60)
     print("🚀 Starting Workspace-vita Backend")
     print("="*60)
@@ -0,0 +1,345 @@
+"""
+Bulk-import Cliq chat history through the indexing pipeline.
+
+Usage:
+    python import_history.py <export.json|export.jsonl> [...] [options]
+
+Options:
+    --conversation-id ID   conversation for records that do not carry one
+                           (a per-channel export)
+    --batch-size N         messages per analysis / embedding batch (default 32)
+    --state-file PATH      resume state (default import_history_state.json)
+    --limit N              stop after N messages (for trial runs)
+
+Exports are streamed: JSONL one message per line, or JSON as a top-level
+array of messages (or an object with a "messages" / "data" array, which is
+streamed too). Messages
+go through three pipelined stages - batched classification, batched
+embedding, then linking in file order via bpipe.index_message - and their
+Data Store rows and Qdrant points are written in bulk (BulkIndexWriter).
+
+Progress is checkpointed to the state file after every flushed batch, so an
+interrupted import resumes where it stopped; the idempotency ledger makes
+any overlap harmless. Once a batch of a file has a failed message (or a
+failed Data Store row) that file's checkpoint stops advancing, so the next
+run retries from the last clean batch. An unreadable export stops the
+import with a non-zero exit status.
+"""
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from datetime import datetime
+
+from bpipe import (
+    IssueSnapshot,
+    BulkIndexWriter,
+    analyze_text_batch,
+    embed_texts_or_none,
+    index_message,
+)
+
+DONE = object()
+
+
+# ---------- Reading exports ----------
+
+class JsonStream:
+    """Incremental reader over a JSON text file, one value at a time"""
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f, self.chunk_size = f, chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf, self.eof = "", False
+
+    def fill(self):
+        more = self.f.read(self.chunk_size)
+        self.eof = not more
+        self.buf += more
+        return bool(more)
+
+    def peek(self):
+        """Next non-whitespace character ("" at end of file)"""
+        self.buf = self.buf.lstrip()
+        while not self.buf and self.fill():
+            self.buf = self.buf.lstrip()
+        return self.buf[:1]
+
+    def take(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expected {char!r}", self.buf, 0)
+        self.buf = self.buf[1:]
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                item, end = self.decoder.raw_decode(self.buf)
+                # A value that ends the buffer (a number) may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.buf = self.buf[end:]
+                    return item
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def array(self):
+        """Yield the elements of the array that starts here"""
+        self.take("[")
+        while True:
+            char = self.peek()
+            if char == ",":
+                self.take(",")
+                continue
+            if char == "]":
+                self.take("]")
+                return
+            if not char:
+                raise json.JSONDecodeError("Unterminated array", self.buf, 0)
+            yield self.value()
+            if len(self.buf) < self.chunk_size and not self.eof:
+                self.fill()
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """
+    Yield the messages of a JSON export without loading the file: a top-level
+    array, or an export object whose "messages" / "data" array is streamed
+    the same way (the object's other members are decoded and skipped).
+    """
+    stream = JsonStream(f, chunk_size)
+    if stream.peek() == "[":
+        yield from stream.array()
+        return
+    stream.take("{")
+    while stream.peek() != "}":
+        key = stream.value()
+        stream.take(":")
+        if key in ("messages", "data") and stream.peek() == "[":
+            yield from stream.array()
+            return
+        stream.value()
+        if stream.peek() == ",":
+            stream.take(",")
+
+
+def iter_export(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(f)
+
+
+def to_millis(value):
+    if value is None:
+        return int(time.time() * 1000)
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        value = int(value)
+        return value if value > 10 ** 11 else value * 1000
+    return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000)
+
+
+def normalize_record(rec, default_conversation):
+    """Cliq export record -> message fields used by index_message (None to skip)"""
+    content = rec.get("content")
+    text = content.get("text") if isinstance(content, dict) else content
+    text = text or rec.get("text") or rec.get("message_text") or ""
+    sender = rec.get("sender") if isinstance(rec.get("sender"), dict) else {}
+    message_id = rec.get("id") or rec.get("message_id")
+    conversation_id = rec.get("chat_id") or rec.get("conversation_id") or default_conversation
+
+    if not (message_id and conversation_id and text.strip()):
+        return None
+    # Bot commands are never indexed
+    if "@workspace-vita" in text.lower() or "{@b-" in text:
+        return None
+    return {
+        "message_id": str(message_id),
+        "conversation_id": str(conversation_id),
+        "sender_id": str(sender.get("id") or rec.get("sender_id") or ""),
+        "timestamp_ms": to_millis(rec.get("time") or rec.get("timestamp")),
+        "message_text": text,
+    }
+
+
+# ---------- Resume state ----------
+
+def load_state(path):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}}
+
+
+def save_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# ---------- Pipeline ----------
+
+class Stage(threading.Thread):
+    """Takes batches from inbox, applies fn, passes them on; records busy time"""
+    def __init__(self, name, fn, inbox, outbox, errors):
+        super().__init__(name=name, daemon=True)
+        self.fn, self.inbox, self.outbox, self.errors = fn, inbox, outbox, errors
+        self.busy_s = 0.0
+
+    def run(self):
+        while True:
+            batch = self.inbox.get()
+            if batch is DONE:
+                self.outbox.put(DONE)
+                return
+            start = time.time()
+            try:
+                self.fn(batch)
+            except Exception as e:
+                self.errors.append(f"{self.name}: {e}")
+            self.busy_s += time.time() - start
+            self.outbox.put(batch)
+
+
+def classify(batch):
+    batch["analyses"] = analyze_text_batch([m["message_text"] for m in batch["messages"]])
+
+
+def embed(batch):
+    batch["vectors"] = embed_texts_or_none([m["message_text"] for m in batch["messages"]])
+
+
+def iter_batches(paths, state, args):
+    """Stream every file, skip what a previous run finished, yield batches"""
+    total = 0
+    for path in paths:
+        done = state["files"].get(path, 0)
+        batch, position = [], 0
+        try:
+            for position, rec in enumerate(iter_export(path), 1):
+                if position <= done:
+                    continue
+                msg = normalize_record(rec, args.conversation_id)
+                if msg:
+                    batch.append(msg)
+                    total += 1
+                if len(batch) >= args.batch_size or (args.limit and total >= args.limit):
+                    yield {"path": path, "position": position, "messages": batch}
+                    batch = []
+                if args.limit and total >= args.limit:
+                    return
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"{path}: unreadable at record {position}: {e}") from e
+        yield {"path": path, "position": position, "messages": batch}
+
+
+def read_batches(paths, state, args, out, failure):
+    """Reader thread: always ends the stream with DONE; an error is left in failure"""
+    try:
+        for batch in iter_batches(paths, state, args):
+            out.put(batch)
+    except Exception as e:
+        failure.append(e)
+    finally:
+        out.put(DONE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import Cliq history into Workspace-vita")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--conversation-id")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--state-file", default="import_history_state.json")
+    parser.add_argument("--limit", type=int, default=0)
+    args = parser.parse_args()
+
+    state = load_state(args.state_file)
+    errors, reader_failure = [], []
+    to_classify, to_embed, to_link = queue.Queue(maxsize=4), queue.Queue(maxsize=4), queue.Queue(maxsize=4)
+
+    reader = threading.Thread(target=read_batches, args=(args.paths, state, args, to_classify, reader_failure), daemon=True)
+    stages = [
+        Stage("classify", classify, to_classify, to_embed, errors),
+        Stage("embed", embed, to_embed, to_link, errors),
+    ]
+    reader.start()
+    for stage in stages:
+        stage.start()
+
+    snapshot = IssueSnapshot()
+    writer = BulkIndexWriter()
+    roles, issues, failed = {}, set(), 0
+    stalled = {}               # {path: checkpoint kept because a batch after it failed}
+    imported, link_s = 0, 0.0
+    start = time.time()
+
+    while True:
+        batch = to_link.get()
+        if batch is DONE:
+            break
+
+        t = time.time()
+        messages = batch["messages"]
+        analyses = batch.get("analyses") or [None] * len(messages)
+        vectors = batch.get("vectors") or [None] * len(messages)
+        row_failures = writer.stats["row_failures"]
+        batch_failed = 0
+        for msg, cls, emb in zip(messages, analyses, vectors):
+            try:
+                issue_id = index_message(
+                    msg["conversation_id"], msg["message_id"], msg["sender_id"], msg["timestamp_ms"],
+                    msg["message_text"], cls=cls, emb=emb, snapshot=snapshot, writer=writer
+                )
+            except Exception as e:
+                batch_failed += 1
+                print(f"❌ {msg['message_id']}: {e}")
+                continue
+            role = (cls or {}).get("role", "discussion")
+            roles[role] = roles.get(role, 0) + 1
+            if issue_id:
+                issues.add(issue_id)
+        writer.flush()
+        batch_failed += writer.stats["row_failures"] - row_failures
+        link_s += time.time() - t
+
+        imported += len(messages)
+        failed += batch_failed
+        path = batch["path"]
+        if batch_failed and path not in stalled:
+            stalled[path] = state["files"].get(path, 0)
+            print(f"⚠️ {batch_failed} failed in {path}, its checkpoint stays at record {stalled[path]}")
+        if path not in stalled:
+            state["files"][path] = batch["position"]
+            save_state(args.state_file, state)
+
+        elapsed = time.time() - start
+        print(f"📊 {imported} messages in {elapsed:.0f}s ({imported / elapsed:.1f} msg/s)")
+
+    elapsed = time.time() - start
+    print("\n" + "=" * 60)
+    print(f"Messages imported:  {imported} ({failed} failed)")
+    print(f"Roles:              {roles}")
+    print(f"Issues linked:      {len(issues)}")
+    print(f"DS rows / points:   {writer.stats['rows']} / {writer.stats['points']} in {writer.stats['flushes']} flushes")
+    print(f"Elapsed:            {elapsed:.1f}s ({imported / elapsed:.1f} msg/s)" if elapsed else "")
+    for stage in stages:
+        print(f"Stage {stage.name:<12} busy {stage.busy_s:.1f}s")
+    print(f"Stage {'link+write':<12} busy {link_s:.1f}s")
+    if errors:
+        print(f"Stage errors:       {len(errors)} (first: {errors[0]})")
+    print(f"Resume state:       {args.state_file}")
+    for path, position in stalled.items():
+        print(f"  {path}: retried from record {position} on the next run")
+    if reader_failure:
+        print(f"❌ Import stopped: {reader_failure[0]}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
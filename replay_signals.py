@@ -0,0 +1,237 @@
+"""
+Replay captured Signals deliveries against an instance for load testing.
+
+Usage:
+    python replay_signals.py <capture.jsonl> --target http://localhost:8000 [options]
+
+Options:
+    --shape original|constant|burst   send timing (default original)
+    --speed X          original shape: replay X times faster (default 1)
+    --rate N           constant/burst: deliveries per second (default 5)
+    --burst-rate N     burst: rate during a burst (default 50)
+    --burst-every S    burst: a burst starts every S seconds (default 30)
+    --burst-seconds S  burst: each burst lasts S seconds (default 5)
+    --concurrency N    parallel senders (default 8)
+    --wait S           how long to wait for the target to index (default 120)
+    --run-id ID        suffix for message/conversation ids (default: timestamp)
+
+The capture comes from running an instance with SIGNALS_CAPTURE_PATH set;
+a rotated <capture.jsonl>.1 next to it is read first.
+Message and conversation ids are suffixed with the run id so the replay
+does not collide with the original data (or with earlier replays).
+
+Reports ack latency of /signals/consume, end-to-end ingest latency (until
+the target records a decision), errors, and how the target's roles and
+issue links compare with the decisions captured in the original run.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def latency_line(name, values):
+    if not values:
+        return f"{name:<22} n/a"
+    return (f"{name:<22} p50 {percentile(values, 50) * 1000:7.0f}ms  p90 {percentile(values, 90) * 1000:7.0f}ms  "
+            f"p99 {percentile(values, 99) * 1000:7.0f}ms  max {max(values) * 1000:7.0f}ms")
+
+
+# ---------- Capture ----------
+
+def load_capture(path):
+    deliveries, decisions = [], {}
+    paths = [p for p in (path + ".1", path) if os.path.exists(p)]
+    for capture_path in paths:
+        with open(capture_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("type") == "delivery":
+                    deliveries.append(record)
+                elif record.get("type") == "decision":
+                    decisions[record["message_id"]] = record
+    return deliveries, decisions
+
+
+def rewrite_event(event_obj, suffix):
+    """Suffix message and conversation ids; returns (event, message_id)"""
+    inner_data = event_obj.get("data", {}).get("data", {})
+    message_id = None
+    try:
+        raw = json.loads(inner_data.get("raw") or "{}")
+        message_obj = raw.get("message", {})
+        if message_obj.get("id"):
+            message_obj["id"] = message_id = f"{message_obj['id']}{suffix}"
+        inner_data["raw"] = json.dumps(raw)
+
+        chat = json.loads(inner_data.get("chat") or "{}")
+        if chat.get("id"):
+            chat["id"] = f"{chat['id']}{suffix}"
+        inner_data["chat"] = json.dumps(chat)
+    except Exception:
+        pass
+    return event_obj, message_id
+
+
+# ---------- Schedule ----------
+
+def schedule(deliveries, args):
+    """Send offset (seconds from start) for every delivery"""
+    if args.shape == "original":
+        first = deliveries[0]["captured_at"] if deliveries else 0
+        return [(d["captured_at"] - first) / args.speed for d in deliveries]
+
+    offsets, t = [], 0.0
+    for _ in deliveries:
+        offsets.append(t)
+        rate = args.rate
+        if args.shape == "burst" and t % args.burst_every < args.burst_seconds:
+            rate = args.burst_rate
+        t += 1.0 / rate
+    return offsets
+
+
+# ---------- Comparison ----------
+
+def link_groups(decisions, ids):
+    """For every message: the other messages sharing its issue (empty if unlinked)"""
+    by_issue = {}
+    for mid in ids:
+        issue_id = decisions[mid].get("issue_id")
+        if issue_id:
+            by_issue.setdefault(issue_id, set()).add(mid)
+    return {mid: frozenset(by_issue.get(decisions[mid].get("issue_id"), set()) - {mid}) for mid in ids}
+
+
+def compare(original, replayed):
+    ids = [mid for mid in original if mid in replayed]
+    if not ids:
+        return None
+    before, after = link_groups(original, ids), link_groups(replayed, ids)
+    return {
+        "compared": len(ids),
+        "role_agreement": sum(original[m].get("role") == replayed[m].get("role") for m in ids) / len(ids),
+        "link_agreement": sum(before[m] == after[m] for m in ids) / len(ids),
+        "issues_before": len({original[m]["issue_id"] for m in ids if original[m].get("issue_id")}),
+        "issues_after": len({replayed[m]["issue_id"] for m in ids if replayed[m].get("issue_id")}),
+        "linked_before": sum(1 for m in ids if original[m].get("issue_id")),
+        "linked_after": sum(1 for m in ids if replayed[m].get("issue_id")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured Signals traffic")
+    parser.add_argument("capture")
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--shape", choices=("original", "constant", "burst"), default="original")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--rate", type=float, default=5.0)
+    parser.add_argument("--burst-rate", type=float, default=50.0)
+    parser.add_argument("--burst-every", type=float, default=30.0)
+    parser.add_argument("--burst-seconds", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--wait", type=float, default=120.0)
+    parser.add_argument("--run-id", default=f"r{int(time.time())}")
+    args = parser.parse_args()
+
+    deliveries, original = load_capture(args.capture)
+    if not deliveries:
+        print(f"No deliveries in {args.capture}")
+        sys.exit(1)
+
+    suffix = f"-{args.run_id}"
+    target = args.target.rstrip("/")
+    local = threading.local()
+    lock = threading.Lock()
+    acks, errors, sent_at = [], [], {}
+
+    def send(events, message_ids):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.time()
+        with lock:
+            for mid in message_ids:
+                sent_at[mid] = start
+        try:
+            resp = session.post(f"{target}/signals/consume", json={"events": events}, timeout=60)
+            elapsed = time.time() - start
+            with lock:
+                acks.append(elapsed)
+                if resp.status_code != 200:
+                    errors.append(f"HTTP {resp.status_code}")
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+
+    offsets = schedule(deliveries, args)
+    print(f"▶️ Replaying {len(deliveries)} deliveries ({args.shape}) against {target} as run {args.run_id}")
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for delivery, offset in zip(deliveries, offsets):
+            delay = start + offset - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            events, message_ids = [], []
+            for event_obj in delivery["events"]:
+                event_obj, mid = rewrite_event(event_obj, suffix)
+                events.append(event_obj)
+                if mid:
+                    message_ids.append(mid)
+            pool.submit(send, events, message_ids)
+    send_s = time.time() - start
+
+    # Wait for the target to index everything it acknowledged
+    replayed = {}
+    deadline = time.time() + args.wait
+    while time.time() < deadline:
+        try:
+            resp = requests.get(f"{target}/admin/ingest_decisions", params={"match": suffix, "limit": 1000000}, timeout=30)
+            for decision in resp.json().get("decisions", []):
+                replayed[decision["message_id"]] = decision
+        except Exception as e:
+            print(f"⚠️ Could not read decisions: {e}")
+        if len(replayed) >= len(sent_at):
+            break
+        time.sleep(2)
+
+    end_to_end = [d["indexed_at"] - sent_at[mid] for mid, d in replayed.items() if mid in sent_at]
+    comparison = compare(original, {mid[:-len(suffix)]: d for mid, d in replayed.items()})
+
+    print("\n" + "=" * 60)
+    print(f"Deliveries sent:        {len(deliveries)} in {send_s:.1f}s ({len(deliveries) / send_s:.1f}/s)" if send_s else "")
+    print(f"Messages sent/indexed:  {len(sent_at)} / {len(replayed)}")
+    print(f"Errors:                 {len(errors)}" + (f" (first: {errors[0]})" if errors else ""))
+    print(latency_line("Ack latency:", acks))
+    print(latency_line("End-to-end latency:", end_to_end))
+    statuses = {}
+    for d in replayed.values():
+        statuses[d["status"]] = statuses.get(d["status"], 0) + 1
+    print(f"Statuses:               {statuses}")
+    if comparison:
+        print(f"Compared with capture:  {comparison['compared']} messages")
+        print(f"  Role agreement:       {comparison['role_agreement']:.0%}")
+        print(f"  Link agreement:       {comparison['link_agreement']:.0%}")
+        print(f"  Linked messages:      {comparison['linked_before']} → {comparison['linked_after']}")
+        print(f"  Distinct issues:      {comparison['issues_before']} → {comparison['issues_after']}")
+    else:
+        print("Compared with capture:  no captured decisions to compare")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compare vision analysis on original vs normalized images.
+
+Usage:
+    python vision_benchmark.py <image_dir> [max_images]
+
+For every image it sends the original bytes and the normalized bytes
+(bpipe.normalize_image_for_vision) to the vision model and reports request
+size, latency, the classified role of each analysis and how similar the two
+analyses are, so VISION_MAX_EDGE / VISION_JPEG_QUALITY can be tuned without
+losing incident detection.
+"""
+import os
+import sys
+import time
+import base64
+
+from bpipe import (
+    IMAGE_EXTENSIONS,
+    normalize_image_for_vision,
+    process_image_with_vision,
+    analyze_message_llm,
+)
+
+
+def words(text: str) -> set:
+    return {w for w in "".join(ch if ch.isalnum() else " " for ch in text.lower()).split() if len(w) > 2}
+
+
+def similarity(a: str, b: str) -> float:
+    wa, wb = words(a), words(b)
+    if not wa or not wb:
+        return 0.0
+    return len(wa & wb) / len(wa | wb)
+
+
+def run_one(path: str) -> dict:
+    with open(path, "rb") as f:
+        original = f.read()
+
+    normalized = normalize_image_for_vision(original)
+
+    start = time.time()
+    before = process_image_with_vision(original, normalize=False)
+    before_s = time.time() - start
+
+    if normalized is None:
+        after, after_s, normalized_size = "No incident detected (image too small to analyze)", 0.0, 0
+    else:
+        start = time.time()
+        after = process_image_with_vision(normalized, normalize=False)
+        after_s = time.time() - start
+        normalized_size = len(normalized)
+
+    return {
+        "file": os.path.basename(path),
+        "original_b64_kb": len(base64.b64encode(original)) / 1024,
+        "normalized_b64_kb": len(base64.b64encode(normalized)) / 1024 if normalized else 0,
+        "normalized_kb": normalized_size / 1024,
+        "before_s": before_s,
+        "after_s": after_s,
+        "before_role": analyze_message_llm(before).get("role") if before else "none",
+        "after_role": analyze_message_llm(after).get("role") if after else "none",
+        "similarity": similarity(before, after),
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    image_dir = sys.argv[1]
+    max_images = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.rsplit(".", 1)[-1].lower() in IMAGE_EXTENSIONS
+    )[:max_images]
+    if not paths:
+        print(f"No images found in {image_dir}")
+        sys.exit(1)
+
+    rows = []
+    for path in paths:
+        row = run_one(path)
+        rows.append(row)
+        print(
+            f"{row['file'][:40]:40} {row['original_b64_kb']:8.0f}KB → {row['normalized_b64_kb']:6.0f}KB  "
+            f"{row['before_s']:5.1f}s → {row['after_s']:5.1f}s  "
+            f"role {row['before_role']:>10} / {row['after_role']:<10} sim {row['similarity']:.2f}"
+        )
+
+    n = len(rows)
+    total_before = sum(r["original_b64_kb"] for r in rows)
+    total_after = sum(r["normalized_b64_kb"] for r in rows)
+    print("\n" + "=" * 60)
+    print(f"Images:             {n}")
+    print(f"Request bytes:      {total_before:.0f}KB → {total_after:.0f}KB "
+          f"({total_before / total_after:.1f}x smaller)" if total_after else "")
+    print(f"Mean latency:       {sum(r['before_s'] for r in rows) / n:.2f}s → {sum(r['after_s'] for r in rows) / n:.2f}s")
+    print(f"Role agreement:     {sum(r['before_role'] == r['after_role'] for r in rows) / n:.0%}")
+    print(f"Mean similarity:    {sum(r['similarity'] for r in rows) / n:.2f}")
+
+
+if __name__ == "__main__":
+    main()